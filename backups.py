@@ -0,0 +1,154 @@
+import datetime
+import gzip
+import io
+import json
+import os
+import tarfile
+
+from records import hydrate
+from section_store import MANIFEST, assemble
+
+PREFIX = "database-"
+SUFFIX = ".tar.gz"
+# Single-file snapshots taken before the database was split into sections
+LEGACY_SUFFIX = ".json.gz"
+REQUIRED_SECTIONS = ("users", "stock", "prices", "receipts", "topup_requests",
+                     "payment", "sales_total")
+
+
+class Backups:
+    """Gzipped tarballs of the section store with tiered retention.
+
+    A snapshot is the manifest plus the section files it names, opened
+    together, so it is a consistent point in time that never touches the
+    in-memory `db`. All methods do blocking I/O and are meant to run in a
+    worker thread. Files are streamed into the archive in chunks, so memory
+    stays flat however large the database grows, and an unchanged store
+    (same manifest generation) is not backed up again.
+    """
+
+    def __init__(self, store, directory, hourly=24, daily=7, weekly=4):
+        self.store = store
+        self.directory = directory
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self._last_generation = None
+
+    def create(self, now=None):
+        """Snapshot the store; returns the new name or None if unchanged"""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        os.makedirs(self.directory, exist_ok=True)
+        with self.store.snapshot() as (manifest, files):
+            if manifest["generation"] == self._last_generation:
+                return None
+            name = f"{PREFIX}{now:%Y%m%dT%H%M%S}{SUFFIX}"
+            path = os.path.join(self.directory, name)
+            with tarfile.open(path + ".tmp", "w:gz", compresslevel=6) as tar:
+                raw = json.dumps(manifest).encode()
+                tar.addfile(self._member(MANIFEST, len(raw), now),
+                            io.BytesIO(raw))
+                for filename, f in files.items():
+                    size = os.fstat(f.fileno()).st_size
+                    tar.addfile(self._member(filename, size, now), f)
+        os.replace(path + ".tmp", path)
+        self._last_generation = manifest["generation"]
+        self.prune(now)
+        return name
+
+    @staticmethod
+    def _member(name, size, now):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(now.timestamp())
+        return info
+
+    def list(self):
+        """Snapshot names, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((n for n in os.listdir(self.directory)
+                       if n.startswith(PREFIX) and n.endswith((SUFFIX,
+                                                                LEGACY_SUFFIX))),
+                      reverse=True)
+
+    @staticmethod
+    def taken_at(name):
+        stamp = name[len(PREFIX):].split(".")[0]
+        return datetime.datetime.strptime(stamp, "%Y%m%dT%H%M%S").replace(
+            tzinfo=datetime.timezone.utc)
+
+    def prune(self, now=None):
+        """Keep the newest `hourly` snapshots plus the newest one of each of
+        the last `daily` days and `weekly` ISO weeks; delete the rest"""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        names = self.list()
+        keep = set(names[:self.hourly])
+        days, weeks = {}, {}
+        for name in names:
+            taken = self.taken_at(name)
+            age = now - taken
+            if age < datetime.timedelta(days=self.daily):
+                days.setdefault(taken.date(), name)
+            if age < datetime.timedelta(weeks=self.weekly):
+                weeks.setdefault(taken.isocalendar()[:2], name)
+        keep.update(days.values(), weeks.values())
+        removed = [name for name in names if name not in keep]
+        for name in removed:
+            os.remove(os.path.join(self.directory, name))
+        return removed
+
+    def load(self, name):
+        if os.path.basename(name) != name or name not in self.list():
+            raise FileNotFoundError(name)
+        path = os.path.join(self.directory, name)
+        if name.endswith(LEGACY_SUFFIX):
+            with gzip.open(path, "rt") as f:
+                return json.load(f)
+        with tarfile.open(path, "r:gz") as tar:
+
+            def read(member):
+                with tar.extractfile(member) as f:
+                    return json.load(f)
+
+            return assemble(read(MANIFEST), read)
+
+
+def validate(data):
+    """Check a loaded snapshot; returns (problems, summary counts)"""
+    problems = [f"missing section {s!r}" for s in REQUIRED_SECTIONS
+                if s not in data]
+    if problems:
+        return problems, {}
+    try:
+        data = hydrate(data)
+    except (TypeError, ValueError, KeyError, AttributeError) as e:
+        return [f"unreadable records: {e!r}"], {}
+
+    negative = [uid for uid, u in data["users"].items() if u["balance"] < 0]
+    if negative:
+        problems.append(f"{len(negative)} users with a negative balance")
+    seen, duplicates = set(), 0
+    for amounts in data["stock"].values():
+        for codes in amounts.values():
+            for code in codes:
+                duplicates += code in seen
+                seen.add(code)
+    if duplicates:
+        problems.append(f"{duplicates} codes in stock more than once")
+    for game_type, amounts in data["stock"].items():
+        unpriced = [a for a, codes in amounts.items()
+                    if codes and a not in data["prices"].get(game_type, {})]
+        if unpriced:
+            problems.append(f"{game_type} {', '.join(unpriced)} in stock "
+                            "without a price")
+
+    summary = {
+        "users": len(data["users"]),
+        "balance": sum(u["balance"] for u in data["users"].values()),
+        "codes": len(seen),
+        "receipts": len(data["receipts"]),
+        "topups": len(data["topup_requests"]),
+        "sales_total": data["sales_total"],
+    }
+    return problems, summary
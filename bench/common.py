@@ -0,0 +1,246 @@
+"""Shared pieces for the offline benchmarks: synthetic databases, raw update
+builders and a Bot API stand-in that never touches the network."""
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from telegram import Update
+from telegram.ext import Application, CallbackContext, ExtBot
+from telegram.request import BaseRequest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+ADMIN_ID = 1
+BOT_TOKEN = "123456:bench"
+FIRST_UID = 10**9
+GAMES = {
+    "MLBBbal": "Mobile Legends (Bal)",
+    "MLBBph": "Mobile Legends (PH)",
+    "PUPG": "PUPG Mobile"
+}
+AMOUNTS = ["86", "172", "257", "706", "1000", "2195"]
+
+
+def prepare_env(workdir=None):
+    """Point main.py at throwaway files; must run before `import main`"""
+    workdir = workdir or tempfile.mkdtemp(prefix="mlbb-bench-")
+    os.environ["ADMIN_ID"] = str(ADMIN_ID)
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ["DB_DIR"] = os.path.join(workdir, "database")
+    os.environ["DB_FILE"] = os.path.join(workdir, "database.json")
+    os.environ["STATE_FILE"] = os.path.join(workdir, "conversation_state.db")
+    os.environ["SALES_LOG"] = os.path.join(workdir, "sales_events.jsonl")
+    os.environ["CHANGE_LOG"] = os.path.join(workdir, "changes.jsonl")
+    return workdir
+
+
+def synthetic_db(users=1000, codes=200, history=5, balance=10**9, seed=1):
+    """A database.json-shaped dict of approved users and full stock"""
+    rng = random.Random(seed)
+    db = {
+        "users": {},
+        "stock": {game: {} for game in GAMES},
+        "receipts": {},
+        "topup_requests": {},
+        "prices": {game: {} for game in GAMES},
+        "payment": {
+            "Wave": {"phone": "0900000000", "name": "Bench"},
+            "Kpay": {"phone": "0900000001", "name": "Bench"}
+        },
+        "sales_total": 0,
+        "pending_registrations": {},
+        "cleanup_done": True
+    }
+    serial = itertools.count()
+    for game in GAMES:
+        for amount in AMOUNTS:
+            db["stock"][game][amount] = [
+                f"{game}-{amount}-{next(serial):08d}" for _ in range(codes)
+            ]
+            db["prices"][game][amount] = int(amount) * 3
+    for uid in range(FIRST_UID, FIRST_UID + users):
+        entries = []
+        for _ in range(history):
+            game = rng.choice(list(GAMES))
+            amount = rng.choice(AMOUNTS)
+            entries.append({
+                "type": "balance",
+                "codes": [f"OLD{rng.getrandbits(40):X}"],
+                "game": GAMES[game],
+                "amount": amount,
+                "quantity": 1,
+                "total_price": int(amount) * 3
+            })
+        db["users"][str(uid)] = {
+            "balance": balance,
+            "history": entries,
+            "approved": True
+        }
+    return db
+
+
+def write_db(db, path=None):
+    with open(path or os.environ["DB_FILE"], "w") as f:
+        json.dump(db, f)
+
+
+# ---------------- Raw updates ----------------
+class Updates:
+    """Builds Bot API update dicts, as getUpdates would return them"""
+
+    def __init__(self):
+        self._update_id = itertools.count(1)
+        self._message_id = itertools.count(1)
+        self._query_id = itertools.count(1)
+
+    @staticmethod
+    def user(uid):
+        return {
+            "id": uid,
+            "is_bot": False,
+            "first_name": f"User{uid % 100000}",
+            "username": f"user{uid}"
+        }
+
+    def _message(self, uid, **fields):
+        return {
+            "message_id": next(self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self.user(uid),
+            **fields
+        }
+
+    def text(self, uid, text):
+        message = self._message(uid, text=text)
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{
+                "type": "bot_command",
+                "offset": 0,
+                "length": len(command)
+            }]
+        return {"update_id": next(self._update_id), "message": message}
+
+    def photo(self, uid):
+        size = {
+            "file_id": f"photo{uid}",
+            "file_unique_id": f"u{uid}",
+            "width": 720,
+            "height": 1280
+        }
+        return {
+            "update_id": next(self._update_id),
+            "message": self._message(uid, photo=[size])
+        }
+
+    def callback(self, uid, data, message_id=None):
+        message = self._message(uid, text="menu")
+        if message_id is not None:
+            message["message_id"] = message_id
+        message["from"] = {"id": 42, "is_bot": True, "first_name": "bot"}
+        return {
+            "update_id": next(self._update_id),
+            "callback_query": {
+                "id": str(next(self._query_id)),
+                "from": self.user(uid),
+                "chat_instance": str(uid),
+                "message": message,
+                "data": data
+            }
+        }
+
+
+# ---------------- Bot API stand-in ----------------
+class StubRequest(BaseRequest):
+    """Answers Bot API calls locally; `latency()` may add a delay"""
+
+    def __init__(self, latency=None):
+        self.latency = latency
+        self.calls = {}
+        self._message_id = itertools.count(10**6)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args,
+                         **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency:
+            delay = self.latency()
+            if delay:
+                await asyncio.sleep(delay)
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({
+            "ok": True,
+            "result": self.result(api_method, params)
+        }).encode()
+
+    def result(self, api_method, params):
+        if api_method == "getMe":
+            return {
+                "id": 42,
+                "is_bot": True,
+                "first_name": "bench",
+                "username": "bench_bot"
+            }
+        if api_method in ("answerCallbackQuery", "deleteWebhook"):
+            return True
+        return {
+            "message_id": params.get("message_id") or next(self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id", 0), "type": "private"},
+            "text": params.get("text", "")
+        }
+
+
+async def build_app(latency=None):
+    """An initialized Application whose bot talks to a StubRequest"""
+    request = StubRequest(latency)
+    bot = ExtBot(BOT_TOKEN, request=request, get_updates_request=request)
+    app = Application.builder().bot(bot).updater(None).build()
+    await app.initialize()
+    return app, request
+
+
+async def call(app, handler, raw, args=None):
+    """Run one handler on a raw update dict, like the dispatcher would"""
+    update = Update.de_json(raw, app.bot)
+    context = CallbackContext.from_update(update, app)
+    if args is not None:
+        context.args = args
+    return await handler(update, context)
+
+
+# ---------------- Reporting ----------------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def report(results, file=sys.stdout):
+    """results: {name: [seconds, ...]}"""
+    print(f"{'flow':<16}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+          f"{'ops/s':>10}",
+          file=file)
+    for name, samples in results.items():
+        samples = sorted(samples)
+        total = sum(samples)
+        print(f"{name:<16}{len(samples):>7}"
+              f"{percentile(samples, 0.5) * 1000:>10.2f}"
+              f"{percentile(samples, 0.99) * 1000:>10.2f}"
+              f"{samples[-1] * 1000 if samples else 0:>10.2f}"
+              f"{len(samples) / total if total else 0:>10.1f}",
+              file=file)
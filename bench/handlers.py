@@ -0,0 +1,127 @@
+"""Drive the real handlers through typical flows against a synthetic database.
+
+No network is involved: updates are built locally and every Bot API call is
+answered by a stub, so the numbers are the bot's own CPU and persistence
+cost.
+
+    python bench/handlers.py --users 20000 --codes 500 --history 10 -n 200
+"""
+import argparse
+import asyncio
+import importlib
+import random
+import time
+
+from common import (ADMIN_ID, AMOUNTS, FIRST_UID, GAMES, Updates, build_app,
+                    call, prepare_env, report, synthetic_db, write_db)
+
+
+async def flow_browse(bot, app, updates, uid, rng):
+    await call(app, bot.start, updates.text(uid, "/start"))
+    for data in ("balance", "buy", "start"):
+        await call(app, bot.callback_handler, updates.callback(uid, data))
+
+
+async def flow_select(bot, app, updates, uid, rng):
+    game = rng.choice(list(GAMES))
+    await call(app, bot.callback_handler,
+               updates.callback(uid, f"select_{game}"))
+    await call(app, bot.callback_handler,
+               updates.callback(uid, f"amount_{game}_{rng.choice(AMOUNTS)}"))
+
+
+async def flow_quantity(bot, app, updates, uid, rng):
+    game, amount = rng.choice(list(GAMES)), rng.choice(AMOUNTS)
+    await call(app, bot.callback_handler,
+               updates.callback(uid, f"amount_{game}_{amount}"))
+    await call(app, bot.handle_message, updates.text(uid, "1"))
+
+
+async def flow_buy_balance(bot, app, updates, uid, rng):
+    game, amount = rng.choice(list(GAMES)), rng.choice(AMOUNTS)
+    await call(app, bot.callback_handler,
+               updates.callback(uid, f"buy_balance_{game}_{amount}_1"))
+
+
+async def flow_receipt(bot, app, updates, uid, rng):
+    game, amount = rng.choice(list(GAMES)), rng.choice(AMOUNTS)
+    receipt_id = str(rng.randint(10000, 999999))
+    while receipt_id in bot.db["receipts"]:
+        receipt_id = str(rng.randint(10000, 999999))
+    await call(app, bot.callback_handler,
+               updates.callback(uid, f"buy_receipt_{game}_{amount}_1"))
+    await call(app, bot.handle_message, updates.photo(uid))
+    await call(app, bot.handle_message, updates.text(uid, receipt_id))
+    await call(app, bot.callback_handler,
+               updates.callback(ADMIN_ID, f"approve_{receipt_id}"))
+
+
+FLOWS = {
+    "browse": flow_browse,
+    "select": flow_select,
+    "quantity": flow_quantity,
+    "buy_balance": flow_buy_balance,
+    "receipt": flow_receipt,
+}
+
+
+async def run(args):
+    bot = importlib.import_module("main")
+    app, request = await build_app()
+    updates = Updates()
+    rng = random.Random(args.seed)
+    results = {}
+    for name in args.flows:
+        flow = FLOWS[name]
+        samples = results[name] = []
+        for i in range(args.warmup + args.iterations):
+            uid = FIRST_UID + rng.randrange(args.users)
+            start = time.perf_counter()
+            await flow(bot, app, updates, uid, rng)
+            if i >= args.warmup:
+                samples.append(time.perf_counter() - start)
+    await app.shutdown()
+    return results, request.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--codes",
+                        type=int,
+                        default=500,
+                        help="codes per denomination")
+    parser.add_argument("--history",
+                        type=int,
+                        default=5,
+                        help="history entries per user")
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--flows",
+                        nargs="+",
+                        choices=list(FLOWS),
+                        default=list(FLOWS))
+    args = parser.parse_args()
+
+    purchases_per_denomination = (args.iterations + args.warmup) * 2
+    if args.codes < purchases_per_denomination:
+        parser.error(f"--codes must be at least {purchases_per_denomination} "
+                     "so stock cannot run out mid-run")
+
+    prepare_env()
+    write_db(
+        synthetic_db(users=args.users,
+                     codes=args.codes,
+                     history=args.history,
+                     seed=args.seed))
+    results, calls = asyncio.run(run(args))
+    print(f"users={args.users} codes/denomination={args.codes} "
+          f"history/user={args.history}")
+    report(results)
+    print("Bot API calls:",
+          ", ".join(f"{k}={v}" for k, v in sorted(calls.items())))
+
+
+if __name__ == "__main__":
+    main()
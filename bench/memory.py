@@ -0,0 +1,155 @@
+"""Resident memory of the in-memory database: plain dicts vs slotted records.
+
+Each mode is built in a fresh subprocess so the numbers are not polluted by
+the other mode's allocations.
+
+    python bench/memory.py --users 100000 --history 3
+"""
+import argparse
+import gc
+import os
+import random
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import HistoryEntry, Receipt, TopupRequest, UserRecord  # noqa: E402
+
+GAMES = {
+    "MLBBbal": "Mobile Legends (Bal)",
+    "MLBBph": "Mobile Legends (PH)",
+    "PUPG": "PUPG Mobile"
+}
+AMOUNTS = ["86", "172", "257", "706", "1000", "2195"]
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def fresh(s):
+    # json.load hands out a new str object for every value it decodes
+    return (s + ".")[:-1]
+
+
+def build(mode, users, history, seed):
+    rng = random.Random(seed)
+    db = {"users": {}, "receipts": {}, "topup_requests": {}}
+    for uid in range(10**9, 10**9 + users):
+        entries = []
+        for _ in range(history):
+            game_type = rng.choice(list(GAMES))
+            amount = rng.choice(AMOUNTS)
+            quantity = rng.randint(1, 3)
+            codes = [f"C{rng.getrandbits(40):X}" for _ in range(quantity)]
+            if mode == "dict":
+                entries.append({
+                    "type": fresh("balance"),
+                    "codes": codes,
+                    "game": fresh(GAMES[game_type]),
+                    "amount": fresh(amount),
+                    "quantity": quantity,
+                    "total_price": 2500 * quantity
+                })
+            else:
+                entries.append(
+                    HistoryEntry(fresh("balance"),
+                                 codes=codes,
+                                 game=fresh(GAMES[game_type]),
+                                 amount=fresh(amount),
+                                 quantity=quantity,
+                                 total_price=2500 * quantity))
+
+        rid = str(uid)[-6:]
+        tid = str(uid + users)[-6:]
+        game_type = rng.choice(list(GAMES))
+        if mode == "dict":
+            db["users"][uid] = {
+                "balance": rng.randint(0, 100000),
+                "history": entries,
+                "approved": True
+            }
+            db["receipts"][rid] = {
+                "user_id": uid,
+                "status": fresh("approved"),
+                "game_type": fresh(game_type),
+                "amount": fresh(rng.choice(AMOUNTS)),
+                "quantity": 1
+            }
+            db["topup_requests"][tid] = {
+                "user_id": uid,
+                "status": fresh("approved"),
+                "amount": 5000,
+                "payment_method": fresh("Wave")
+            }
+        else:
+            db["users"][uid] = UserRecord(balance=rng.randint(0, 100000),
+                                          history=entries,
+                                          approved=True)
+            db["receipts"][rid] = Receipt(uid,
+                                          status=fresh("approved"),
+                                          game_type=fresh(game_type),
+                                          amount=fresh(rng.choice(AMOUNTS)),
+                                          quantity=1)
+            db["topup_requests"][tid] = TopupRequest(
+                uid,
+                status=fresh("approved"),
+                amount=5000,
+                payment_method=fresh("Wave"))
+    return db
+
+
+def child(args):
+    gc.collect()
+    before = rss_kb()
+    db = build(args.child, args.users, args.history, args.seed)
+    gc.collect()
+    after = rss_kb()
+    print(after - before, len(db["users"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--history", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", choices=["dict", "records"])
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = {}
+    for mode in ("dict", "records"):
+        out = subprocess.run([
+            sys.executable, __file__, "--child", mode, "--users",
+            str(args.users), "--history",
+            str(args.history), "--seed",
+            str(args.seed)
+        ],
+                             check=True,
+                             capture_output=True,
+                             text=True).stdout
+        results[mode] = int(out.split()[0])
+
+    print(f"users={args.users} history/user={args.history} "
+          f"(+1 receipt, +1 top-up per user)")
+    print(f"{'mode':<10}{'RSS delta':>14}{'bytes/user':>14}")
+    for mode, kb in results.items():
+        print(f"{mode:<10}{kb / 1024:>11.1f} MB{kb * 1024 // args.users:>14}")
+    saved = 1 - results["records"] / results["dict"]
+    print(f"records use {saved:.0%} less resident memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Local stand-in for api.telegram.org to load-test the real bot end to end.
+
+The mock serves getUpdates from thousands of scripted users and accepts the
+calls the bot makes back. Each simulated user is closed-loop: it sends its
+next update only after the bot has replied to the previous one, or after
+--reply-timeout. End-to-end latency is measured from the moment an update
+leaves getUpdates to the bot's first reply in that user's chat.
+
+By default the script also starts `main.py` against a synthetic database,
+with BOT_API_BASE_URL pointing at the mock:
+
+    python bench/mock_api.py --users 2000 --sessions 3 --latency-ms 50 \\
+        --retry-after-rate 0.01
+
+Add --workers N to start scaleout.py with N worker processes instead.
+Pass --no-spawn to only run the server and start the bot yourself with
+BOT_API_BASE_URL=http://127.0.0.1:<port>/bot.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+from common import (ADMIN_ID, AMOUNTS, BOT_TOKEN, FIRST_UID, GAMES, REPO,
+                    Updates, percentile, prepare_env, synthetic_db, write_db)
+
+REPLY_METHODS = ("sendMessage", "editMessageText", "sendDocument")
+
+
+class SimulatedUser:
+    __slots__ = ("uid", "script", "step", "sent_at", "label", "message_id",
+                 "query_id", "timeout")
+
+    def __init__(self, uid, script):
+        self.uid = uid
+        self.script = script
+        self.step = 0
+        self.sent_at = None
+        self.label = None
+        self.message_id = None
+        self.query_id = None
+        self.timeout = None
+
+
+def session_script(rng, buy_ratio):
+    game, amount = rng.choice(list(GAMES)), rng.choice(AMOUNTS)
+    last = (f"buy_balance_{game}_{amount}_1"
+            if rng.random() < buy_ratio else "start")
+    return [("text", "/start"), ("callback", "balance"),
+            ("callback", "buy"), ("callback", f"select_{game}"),
+            ("callback", f"amount_{game}_{amount}"), ("text", "1"),
+            ("callback", last)]
+
+
+class MockBotAPI:
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.updates = Updates()
+        self.pending = collections.deque()  # raw updates not yet fetched
+        self.new_updates = asyncio.Event()
+        self.users = {}
+        self.queries = {}  # callback_query id -> SimulatedUser
+        self.latencies = collections.defaultdict(list)
+        self.outcomes = collections.Counter()
+        self.api_calls = collections.Counter()
+        self.retry_after_served = 0
+        self.remaining_sessions = 0
+        self.started = None
+        self.finished = asyncio.Event()
+        self._message_id = 10**6
+
+    # ---------- Simulated users ----------
+    def populate(self):
+        for i in range(self.args.users):
+            uid = FIRST_UID + i
+            script = []
+            for _ in range(self.args.sessions):
+                script += session_script(self.rng, self.args.buy_ratio)
+            self.users[uid] = SimulatedUser(uid, script)
+            self.remaining_sessions += len(script)
+        self.started = time.perf_counter()
+        for user in self.users.values():
+            self.schedule(user, self.rng.uniform(0, self.args.ramp_up))
+
+    def schedule(self, user, delay):
+        asyncio.get_running_loop().call_later(delay, self.emit, user)
+
+    def emit(self, user):
+        kind, payload = user.script[user.step]
+        if kind == "text":
+            raw = self.updates.text(user.uid, payload)
+        else:
+            raw = self.updates.callback(user.uid, payload, user.message_id)
+            user.query_id = raw["callback_query"]["id"]
+            self.queries[user.query_id] = user
+        user.label = payload.split("_")[0] if kind == "callback" else (
+            "command" if payload.startswith("/") else "text")
+        user.sent_at = None
+        self.pending.append((raw, user))
+        self.new_updates.set()
+
+    def complete(self, user, outcome):
+        if user.sent_at is None:
+            return  # reply to an update we already gave up on
+        if user.timeout:
+            user.timeout.cancel()
+            user.timeout = None
+        if outcome == "ok":
+            self.latencies[user.label].append(time.perf_counter() -
+                                              user.sent_at)
+        self.outcomes[outcome] += 1
+        self.queries.pop(user.query_id, None)
+        user.sent_at = None
+        user.step += 1
+        self.remaining_sessions -= 1
+        if user.step < len(user.script):
+            self.schedule(user, self.args.think_ms / 1000)
+        elif self.remaining_sessions <= 0:
+            self.finished.set()
+
+    # ---------- Bot API ----------
+    async def get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+        # Updates below offset were confirmed by the bot
+        while self.pending and self.pending[0][0]["update_id"] < offset:
+            self.pending.popleft()
+        if not self.pending and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(itertools.islice(self.pending, limit))
+        now = time.perf_counter()
+        for raw, user in batch:
+            if user.sent_at is None:
+                user.sent_at = now
+                user.timeout = asyncio.get_running_loop().call_later(
+                    self.args.reply_timeout, self.complete, user, "timeout")
+        return [raw for raw, _ in batch]
+
+    def message(self, chat_id, text, message_id=None):
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text or ""
+        }
+
+    async def call(self, api_method, params):
+        self.api_calls[api_method] += 1
+        if api_method == "getUpdates":
+            return {"ok": True, "result": await self.get_updates(params)}
+        if self.args.latency_ms:
+            await asyncio.sleep(
+                self.rng.expovariate(1000 / self.args.latency_ms))
+        if api_method == "getMe":
+            return {
+                "ok": True,
+                "result": {
+                    "id": 42,
+                    "is_bot": True,
+                    "first_name": "mock",
+                    "username": "mock_bot"
+                }
+            }
+        if api_method in ("deleteWebhook", "setMyCommands", "close"):
+            return {"ok": True, "result": True}
+        if (api_method in REPLY_METHODS
+                and self.rng.random() < self.args.retry_after_rate):
+            self.retry_after_served += 1
+            return {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            }
+        if api_method == "answerCallbackQuery":
+            user = self.queries.get(params.get("callback_query_id"))
+            if user and params.get("text"):
+                self.complete(user, "throttled")
+            return {"ok": True, "result": True}
+
+        chat_id = int(params.get("chat_id", 0) or 0)
+        message_id = params.get("message_id")
+        result = self.message(chat_id, params.get("text"),
+                              int(message_id) if message_id else None)
+        user = self.users.get(chat_id)
+        if user and api_method in REPLY_METHODS:
+            user.message_id = result["message_id"]
+            self.complete(user, "ok")
+        return {"ok": True, "result": result}
+
+    # ---------- HTTP ----------
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                request_line, _, header_block = head.decode(
+                    "latin-1").partition("\r\n")
+                headers = {}
+                for line in header_block.split("\r\n"):
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get("content-length", 0)))
+                path = request_line.split()[1]
+                params = parse_body(headers.get("content-type", ""), body)
+                response = await self.call(path.rsplit("/", 1)[-1], params)
+                status = 200 if response["ok"] else response["error_code"]
+                payload = json.dumps(response).encode()
+                writer.write(f"HTTP/1.1 {status} X\r\n"
+                             "Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                             + payload)
+                await writer.drain()
+        except asyncio.CancelledError:
+            pass  # shutting down with a long poll in flight
+        finally:
+            writer.close()
+
+
+def parse_body(content_type, body):
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        return {
+            part.get_param("name", header="content-disposition"):
+            part.get_content()
+            for part in message.iter_parts()
+            if not part.get_filename()
+        }
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    return dict(parse_qsl(body.decode()))
+
+
+def spawn_bot(args, port):
+    workdir = prepare_env()
+    db = synthetic_db(users=args.users,
+                      codes=args.users * args.sessions + 100,
+                      history=args.history)
+    write_db(db)
+    env = dict(os.environ,
+               BOT_API_BASE_URL=f"http://127.0.0.1:{port}/bot",
+               PYTHONUNBUFFERED="1",
+               WORKERS=str(args.workers))
+    script = "scaleout.py" if args.workers > 1 else "main.py"
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    print(f"bot working directory: {workdir}")
+    return subprocess.Popen([sys.executable, os.path.join(REPO, script)],
+                            env=env,
+                            cwd=workdir,
+                            stdout=log,
+                            stderr=subprocess.STDOUT)
+
+
+def print_report(api, elapsed):
+    all_latencies = sorted(l for ls in api.latencies.values() for l in ls)
+    done = sum(api.outcomes.values())
+    print(f"\n{done} updates in {elapsed:.1f}s "
+          f"-> {api.outcomes['ok'] / elapsed:.1f} replies/s")
+    print("outcomes:", dict(api.outcomes),
+          f"429 served: {api.retry_after_served}")
+    print(f"{'update':<14}{'n':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}")
+    rows = sorted(api.latencies.items()) + [("all", all_latencies)]
+    for label, samples in rows:
+        samples = sorted(samples)
+        if not samples:
+            continue
+        print(f"{label:<14}{len(samples):>7}"
+              f"{percentile(samples, 0.5) * 1000:>10.1f}"
+              f"{percentile(samples, 0.9) * 1000:>10.1f}"
+              f"{percentile(samples, 0.99) * 1000:>10.1f}"
+              f"{samples[-1] * 1000:>10.1f}")
+    print("Bot API calls:",
+          ", ".join(f"{k}={v}" for k, v in sorted(api.api_calls.items())))
+
+
+async def run(args):
+    api = MockBotAPI(args)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", args.port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"mock Bot API on http://127.0.0.1:{port}/bot<token>/")
+    bot = None if args.no_spawn else spawn_bot(args, port)
+    api.populate()
+    try:
+        await asyncio.wait_for(api.finished.wait(), args.duration)
+    except asyncio.TimeoutError:
+        print("duration reached before all scripted updates completed")
+    elapsed = time.perf_counter() - api.started
+    if bot:
+        bot.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(asyncio.to_thread(bot.wait), 10)
+        except asyncio.TimeoutError:
+            bot.kill()
+    server.close()
+    print_report(api, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sessions",
+                        type=int,
+                        default=2,
+                        help="scripted sessions per user")
+    parser.add_argument("--buy-ratio", type=float, default=0.5)
+    parser.add_argument("--history", type=int, default=5)
+    parser.add_argument("--think-ms",
+                        type=float,
+                        default=1000,
+                        help="pause between a reply and the next update")
+    parser.add_argument("--ramp-up", type=float, default=5.0)
+    parser.add_argument("--latency-ms",
+                        type=float,
+                        default=0,
+                        help="mean injected Bot API latency")
+    parser.add_argument("--retry-after-rate",
+                        type=float,
+                        default=0,
+                        help="fraction of replies answered with 429")
+    parser.add_argument("--reply-timeout", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=600.0)
+    parser.add_argument("--workers",
+                        type=int,
+                        default=1,
+                        help="run scaleout.py with this many workers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-spawn", action="store_true")
+    args = parser.parse_args()
+    if args.no_spawn:
+        print(f"start the bot with ADMIN_ID={ADMIN_ID} BOT_TOKEN={BOT_TOKEN}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
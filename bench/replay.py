@@ -0,0 +1,183 @@
+"""Replay a recorded trace through the handlers and report latency.
+
+    TRACE_FILE=traffic.trace.gz python main.py      # record (opt-in)
+    python bench/replay.py traffic.trace.gz --speed 10
+    python bench/replay.py traffic.trace.gz --db database --speed 0
+
+Updates go through main.add_handlers(), so flood control, dedupe and
+every handler run as in production, on a Bot API stub and a throwaway
+copy of --db (a section store directory or a database.json; a synthetic
+database by default). They arrive on the recorded schedule, compressed
+--speed times (0 = as fast as possible), and are handled one at a time in
+arrival order like the bot does. "service" is a handler's own time;
+"latency" also counts the time an update waited behind earlier ones.
+
+Pseudonymous users are mapped onto the database's approved users in order
+of first appearance and staff onto ADMIN_ID; pseudonymous ids inside
+callback data or commands (approve_reg_<id>, /setbalance <id>) follow the
+same mapping.
+"""
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import time
+
+from telegram import Update
+
+from common import (ADMIN_ID, Updates, build_app, prepare_env, report,
+                    synthetic_db, write_db)
+
+LONG_NUMBER = re.compile(r"\d{7,}")
+
+
+class Users:
+    """Pseudonymous trace ids -> users of the replay database"""
+
+    def __init__(self, uids):
+        self.uids = uids
+        self.mapping = {}
+
+    def __call__(self, pseudonym, staff=False):
+        if staff:
+            return ADMIN_ID
+        if pseudonym not in self.mapping:
+            self.mapping[pseudonym] = self.uids[len(self.mapping) %
+                                                len(self.uids)]
+        return self.mapping[pseudonym]
+
+    def rewrite(self, text):
+        """Swap pseudonymous ids already mapped to a user"""
+        return LONG_NUMBER.sub(
+            lambda m: str(self.mapping.get(int(m.group()), m.group())), text)
+
+
+def to_update(event, users, updates):
+    """Raw update dict for a trace event, or None for kinds not replayed"""
+    uid = users(event["u"], event.get("s"))
+    if event["k"] == "callback":
+        return updates.callback(uid, users.rewrite(event["d"]))
+    if event["k"] == "text":
+        return updates.text(uid, users.rewrite(event["d"]))
+    if event["k"] == "photo":
+        return updates.photo(uid)
+    return None
+
+
+def label(bot, update):
+    if update.callback_query:
+        return bot.callback_action(update)
+    text = update.message.text
+    if text is None:
+        return "photo"
+    return text.split()[0] if text.startswith("/") else "text"
+
+
+async def replay(bot, events, args):
+    app, request = await build_app()
+    bot.add_handlers(app)
+    errors = []
+
+    async def on_error(update, context):
+        errors.append(context.error)
+
+    app.add_error_handler(on_error)
+    if not args.rate_limit:
+        bot.flood_control.allow = lambda uid, action: True
+
+    users = Users(
+        sorted(uid for uid, user in bot.db["users"].items()
+               if user.get("approved")) or [ADMIN_ID])
+    updates = Updates()
+    # Profiles as Updates sends them, or remember_profile would commit on
+    # every user's first update, which production does not
+    for uid, user in bot.db["users"].items():
+        profile = Updates.user(uid)
+        user["name"], user["username"] = (profile["first_name"],
+                                          profile["username"])
+    service, latency = {}, {}
+    skipped = 0
+    t0 = events[0]["t"]
+    started = time.perf_counter()
+    for event in events:
+        raw = to_update(event, users, updates)
+        if raw is None:
+            skipped += 1
+            continue
+        due = started + ((event["t"] - t0) / args.speed if args.speed else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = Update.de_json(raw, app.bot)
+        name = label(bot, update)
+        begin = time.perf_counter()
+        await app.process_update(update)
+        end = time.perf_counter()
+        service.setdefault(name, []).append(end - begin)
+        latency.setdefault(name, []).append(end - due)
+    elapsed = time.perf_counter() - started
+    await app.shutdown()
+    return service, latency, elapsed, skipped, errors, request.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="gzip trace written under TRACE_FILE")
+    parser.add_argument("--db",
+                        help="section store directory or database.json to "
+                        "copy; synthetic when omitted")
+    parser.add_argument("--speed",
+                        type=float,
+                        default=1.0,
+                        help="1 = recorded pace, 10 = ten times faster, "
+                        "0 = as fast as possible")
+    parser.add_argument("--limit", type=int, help="replay only N updates")
+    parser.add_argument("--no-rate-limit",
+                        dest="rate_limit",
+                        action="store_false",
+                        help="let every update through flood control, which "
+                        "otherwise trips on compressed schedules")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--codes", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = prepare_env()
+    os.environ["TRACE_FILE"] = ""
+    os.environ["BACKUP_DIR"] = os.path.join(workdir, "backups")
+    if args.db and os.path.isdir(args.db):
+        shutil.copytree(args.db, os.environ["DB_DIR"])
+    elif args.db:
+        shutil.copy(args.db, os.environ["DB_FILE"])
+    else:
+        write_db(
+            synthetic_db(users=args.users, codes=args.codes, seed=args.seed))
+
+    from traffic import read_trace
+    events = read_trace(args.trace)[:args.limit]
+    if not events:
+        parser.error("the trace is empty")
+    import main as bot
+
+    service, latency, elapsed, skipped, errors, calls = asyncio.run(
+        replay(bot, events, args))
+    replayed = sum(len(samples) for samples in service.values())
+    span = events[-1]["t"] - events[0]["t"]
+    print(f"{replayed} updates ({skipped} skipped) recorded over {span:.1f}s, "
+          f"replayed in {elapsed:.1f}s at "
+          f"{'max' if not args.speed else f'{args.speed:g}x'} speed: "
+          f"{replayed / elapsed:.1f} updates/s")
+    print("\nservice")
+    report(service)
+    if args.speed:
+        print("\nlatency (arrival to done)")
+        report(latency)
+    print("\nBot API calls:",
+          ", ".join(f"{k}={v}" for k, v in sorted(calls.items())))
+    if errors:
+        print(f"{len(errors)} handler errors, first: {errors[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Check that standby.py keeps an exact replica under a concurrent workload.
+
+The stress workload runs against the real handlers in this process while
+standby.py tails the change journal in a second process. Afterwards the
+replica must equal the primary's section store, and the lag reported while
+running shows how far behind a failover would start. A small
+CHANGE_LOG_MAX_MB makes the journal rotate during the run. Afterwards a
+standby is walked through a rotation by hand: it must apply the rotated
+segment once and then wait for the primary to start the next file.
+
+    python bench/replication.py --rounds 2 --ops 500
+    CHANGE_LOG_MAX_MB=0.05 python bench/replication.py --rounds 1 --ops 300
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+from common import build_app, prepare_env, synthetic_db, write_db
+from section_store import SectionStore
+from replication import ROTATED, ChangeLog
+from stress import Stress
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def journaled(path):
+    """Commits in the live journal and the rotated segment before it"""
+    count = 0
+    for segment in (path + ROTATED, path):
+        if os.path.exists(segment):
+            with open(segment) as f:
+                count += sum(1 for _ in f)
+    return count
+
+
+def diff(primary, replica, path=""):
+    if type(primary) is not type(replica):
+        return [f"{path}: {primary!r} != {replica!r}"]
+    if isinstance(primary, dict):
+        out = []
+        for key in sorted(set(primary) | set(replica), key=str):
+            if key not in replica or key not in primary:
+                out.append(f"{path}/{key}: only in "
+                           f"{'primary' if key in primary else 'replica'}")
+            else:
+                out += diff(primary[key], replica[key], f"{path}/{key}")
+        return out
+    return [] if primary == replica else [f"{path}: {primary!r} != {replica!r}"]
+
+
+def check_rotation(workdir):
+    """Failures of a standby following a journal through one rotation"""
+    from standby import Standby
+    journal = os.path.join(workdir, "rotation.jsonl")
+    standby = Standby(os.environ["DB_DIR"], journal,
+                      os.path.join(workdir, "rotation", "database"))
+    log = ChangeLog(journal)
+    game, amount = next((game, amount)
+                        for game, amounts in standby.data["prices"].items()
+                        for amount in amounts)
+
+    def commit(price):
+        log.record("price", game, amount, price)
+        log.commit()
+
+    polls = []
+    commit(1)
+    commit(2)
+    polls.append(standby.poll())
+    log.max_bytes = 0  # the next commit rotates the journal
+    commit(3)
+    # No live file until the primary's next commit
+    polls += [standby.poll(), standby.poll(), standby.poll()]
+    log.max_bytes = 64 << 20
+    commit(4)
+    polls.append(standby.poll())
+    failures = []
+    if polls != [2, 1, 0, 0, 1]:
+        failures.append(f"commits applied per poll {polls}, "
+                        "expected [2, 1, 0, 0, 1]")
+    if standby.data["prices"][game][amount] != 4:
+        failures.append("replica missed the commit after the rotation")
+    return failures
+
+
+async def run(args, replica):
+    bot = importlib.import_module("main")
+    standby = subprocess.Popen([
+        sys.executable,
+        os.path.join(REPO, "standby.py"), "--replica", replica, "--interval",
+        "0.5"
+    ])
+    app, request = await build_app(
+        latency=lambda: random.uniform(0, args.max_latency_ms / 1000))
+    stress = Stress(bot, app, args)
+    for n in range(1, args.rounds + 1):
+        await stress.round()
+        print(f"round {n}: {args.ops} ops done")
+    await app.shutdown()
+    await asyncio.sleep(1)
+    standby.send_signal(signal.SIGINT)
+    standby.wait()
+    return bot.DB_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--codes", type=int, default=300)
+    parser.add_argument("--double-tap", type=float, default=0.1)
+    parser.add_argument("--max-latency-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = prepare_env()
+    write_db(
+        synthetic_db(users=args.users,
+                     codes=args.codes,
+                     history=0,
+                     balance=20000,
+                     seed=args.seed))
+    replica = os.path.join(workdir, "standby", "database")
+    started = time.perf_counter()
+    primary = asyncio.run(run(args, replica))
+    differences = diff(SectionStore(primary).load(),
+                       SectionStore(replica).load())
+    print(f"{time.perf_counter() - started:.1f}s, "
+          f"{journaled(os.environ['CHANGE_LOG'])} commits in the journal")
+    if differences:
+        print(f"replica differs in {len(differences)} places:")
+        for line in differences[:20]:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("replica matches primary")
+    failures = check_rotation(workdir)
+    for failure in failures:
+        print(f"rotation: {failure}")
+    if failures:
+        sys.exit(1)
+    print("rotation: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency of /finduser's prefix index against a linear scan.
+
+    python bench/search.py --users 100000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_index import UserIndex  # noqa: E402
+
+SYLLABLES = ["aung", "kyaw", "min", "thu", "zaw", "htet", "naing", "myo",
+             "win", "hlaing", "phyo", "su", "ei", "mon", "khin", "nwe"]
+
+
+def synthetic_users(n, seed):
+    rng = random.Random(seed)
+    users = {}
+    for uid in range(10**9, 10**9 + n):
+        name = " ".join(
+            rng.choice(SYLLABLES).title() for _ in range(rng.randint(1, 3)))
+        username = (rng.choice(SYLLABLES) + "".join(
+            rng.choices(string.ascii_lowercase + string.digits, k=5))
+                    if rng.random() < 0.7 else None)
+        users[uid] = {"name": name, "username": username, "balance": 0}
+    return users
+
+
+def scan(users, prefix, limit=20):
+    prefix = prefix.casefold()
+    found = []
+    for uid, user in users.items():
+        words = [str(uid), *(user["name"] or "").casefold().split(),
+                 (user["name"] or "").casefold(),
+                 (user["username"] or "").casefold()]
+        if any(w.startswith(prefix) for w in words):
+            found.append(uid)
+            if len(found) == limit:
+                break
+    return found
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    users = synthetic_users(args.users, args.seed)
+    rng = random.Random(args.seed)
+    uids = list(users)
+    queries = []
+    for _ in range(args.queries):
+        user = users[rng.choice(uids)]
+        source = rng.choice([user["name"].split()[0], user["username"] or "x"])
+        queries.append(source[:rng.randint(2, 6)])
+    # Prefixes nothing matches make a scan read every user
+    queries += ["zzz"] * (args.queries // 10)
+
+    index = UserIndex()
+    started = time.perf_counter()
+    index.rebuild(users)
+    print(f"rebuild: {(time.perf_counter() - started) * 1000:.0f} ms for "
+          f"{args.users} users")
+    started = time.perf_counter()
+    for uid in uids[:1000]:
+        index.update(uid, users[uid]["name"] + " Jr", users[uid]["username"])
+    print(f"update: {(time.perf_counter() - started):.3f} ms per user")
+    print(f"index search: {timed(index.search, queries):.4f} ms per query")
+    print(f"linear scan:  {timed(lambda q: scan(users, q), queries[-50:]):.2f} "
+          "ms per query (misses)")
+
+
+if __name__ == "__main__":
+    main()
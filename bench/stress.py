@@ -0,0 +1,467 @@
+"""Concurrency stress run that checks inventory and balance invariants.
+
+Thousands of purchases, top-ups, receipt purchases, admin approvals (some of
+them double-tapped) and addstock operations are fired through the real
+handlers at once. Every Bot API call sleeps for a random time so handlers
+interleave at each await. After every round the database must satisfy:
+
+  * codes delivered + codes remaining == codes ever added
+  * no code is delivered twice
+  * no balance is negative, and the balance total moved by exactly
+    approved top-ups minus balance purchases
+  * sales_total and the sales event log match the purchase history
+  * the section files on disk load back to exactly the in-memory database
+  * the price index, catalog, forecast, staff roster, pending requests
+    and review assignments work on the dicts in the database and agree
+    with them
+
+    python bench/stress.py --rounds 5 --ops 2000
+    python bench/stress.py --workers 3
+
+With --workers N the operations run in N processes sharing DB_DIR the way
+scaleout.py runs them: each user's taps go to the process that owns the
+user (uid % N) and every admin action to process 0, which approves
+requests while the other processes keep buying, and stocks new
+denominations right after the others' commits. The invariants are then
+checked on the database as the processes left it on disk, and every
+process must read back to exactly that.
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+
+from common import (ADMIN_ID, AMOUNTS, FIRST_UID, GAMES, Updates, build_app,
+                    call, prepare_env, synthetic_db, write_db)
+from records import encode_record
+
+
+def stocked(db):
+    codes = collections.Counter()
+    for amounts in db["stock"].values():
+        for game_codes in amounts.values():
+            codes.update(game_codes)
+    return codes
+
+
+def total_balance(db):
+    return sum(u["balance"] for u in db["users"].values())
+
+
+def plain(db):
+    """`db` as it reads back from JSON"""
+    return json.loads(json.dumps(db, default=encode_record))
+
+
+class Stress:
+    """Drives the operations of one process; `index` of `workers`"""
+
+    def __init__(self, bot, app, args, index=0, workers=1, approvals=None):
+        self.bot = bot
+        self.app = app
+        self.args = args
+        self.index = index
+        self.workers = workers
+        # Admin taps for process 0, fed by every process; None = tap here
+        self.approvals = approvals
+        self.rng = random.Random(args.seed + index)
+        self.updates = Updates()
+        self.message_ids = itertools.count(1)
+        self.uids = [
+            FIRST_UID + n for n in range(args.users)
+            if (FIRST_UID + n) % workers == index
+        ]
+        self.receipt_ids = iter(
+            self.rng.sample(range(10000 + index, 999999, workers),
+                            args.rounds * args.ops))
+        self.code_serial = itertools.count()
+        self.flow_locks = collections.defaultdict(asyncio.Lock)
+        self.added = stocked(bot.db)
+        self.initial_balance = total_balance(bot.db)
+
+    def random_uid(self):
+        return self.rng.choice(self.uids)
+
+    def sku(self):
+        return self.rng.choice(list(GAMES)), self.rng.choice(AMOUNTS)
+
+    async def send(self, handler, raw):
+        if self.bot.shared_db:
+            # What the refresh_db handler does ahead of every update
+            self.bot.shared_db.refresh()
+        await call(self.app, handler, raw)
+
+    async def tap(self, uid, data, repeats=1):
+        """Tap one button, possibly several times at once (double tap)"""
+        message_id = next(self.message_ids)
+        await asyncio.gather(*[
+            self.send(self.bot.callback_handler,
+                      self.updates.callback(uid, data, message_id))
+            for _ in range(repeats)
+        ])
+
+    async def admin_tap(self, data, repeats):
+        if self.approvals is None:
+            await self.tap(ADMIN_ID, data, repeats)
+        else:
+            self.approvals.put((data, repeats))
+
+    async def approve(self):
+        """Process 0: tap every queued admin action until all processes,
+        this one included, have finished their operations"""
+        loop = asyncio.get_running_loop()
+        taps, finished = [], 0
+        while finished < self.workers:
+            item = await loop.run_in_executor(None, self.approvals.get)
+            if item is None:
+                finished += 1
+            else:
+                taps.append(asyncio.ensure_future(self.tap(ADMIN_ID, *item)))
+        await asyncio.gather(*taps)
+
+    def repeats(self):
+        return 2 if self.rng.random() < self.args.double_tap else 1
+
+    # ---------- Operations ----------
+    async def purchase(self):
+        game, amount = self.sku()
+        await self.tap(self.random_uid(),
+                       f"buy_balance_{game}_{amount}_{self.rng.randint(1, 3)}",
+                       self.repeats())
+
+    async def topup(self):
+        uid = self.random_uid()
+        receipt_id = str(next(self.receipt_ids))
+        async with self.flow_locks[uid]:
+            await self.tap(uid, "topup_wave")
+            await self.send(self.bot.handle_message,
+                            self.updates.photo(uid))
+            await self.send(
+                self.bot.handle_message,
+                self.updates.text(
+                    uid, f"{receipt_id} {self.rng.randint(1, 20) * 1000}"))
+        await asyncio.sleep(0)
+        action = "approve" if self.rng.random() < 0.8 else "reject"
+        await self.admin_tap(f"{action}_topup_{receipt_id}", self.repeats())
+
+    async def receipt_purchase(self):
+        uid = self.random_uid()
+        game, amount = self.sku()
+        receipt_id = str(next(self.receipt_ids))
+        async with self.flow_locks[uid]:
+            await self.tap(uid, f"buy_receipt_{game}_{amount}_"
+                           f"{self.rng.randint(1, 3)}")
+            await self.send(self.bot.handle_message,
+                            self.updates.photo(uid))
+            await self.send(self.bot.handle_message,
+                            self.updates.text(uid, receipt_id))
+        action = "approve" if self.rng.random() < 0.8 else "reject"
+        await self.admin_tap(f"{action}_{receipt_id}", self.repeats())
+
+    async def addstock(self):
+        game, amount = self.sku()
+        codes = [f"NEW{next(self.code_serial):08d}" for _ in range(5)]
+        price = self.bot.db["prices"][game][amount]
+        async with self.flow_locks[ADMIN_ID]:
+            await self.tap(ADMIN_ID, f"addstock_{game}")
+            await self.send(
+                self.bot.handle_message,
+                self.updates.text(ADMIN_ID,
+                                  f"{amount} {price} {' '.join(codes)}"))
+        self.added.update(codes)
+
+    async def new_sku(self):
+        """Stock a denomination nobody buys, cheaper than everything else:
+        the price index and catalog must pick it up"""
+        game = self.rng.choice(list(GAMES))
+        amount = str(900000 + next(self.code_serial))
+        codes = [f"NEW{next(self.code_serial):08d}" for _ in range(2)]
+        async with self.flow_locks[ADMIN_ID]:
+            await self.tap(ADMIN_ID, f"addstock_{game}")
+            await self.send(
+                self.bot.handle_message,
+                self.updates.text(ADMIN_ID, f"{amount} 1 {' '.join(codes)}"))
+        self.added.update(codes)
+
+    async def round(self, ops=None):
+        operations = [self.purchase] * 6 + [self.topup] * 2 + [
+            self.receipt_purchase
+        ] * 2
+        if self.index == 0:
+            operations += [self.addstock, self.new_sku]  # admin only
+        ops = self.args.ops if ops is None else ops
+
+        async def run_operations():
+            results = await asyncio.gather(
+                *[self.rng.choice(operations)() for _ in range(ops)],
+                return_exceptions=True)
+            if self.approvals is not None:
+                self.approvals.put(None)
+            return results
+
+        if self.approvals is not None and self.index == 0:
+            results, _ = await asyncio.gather(run_operations(),
+                                              self.approve())
+        else:
+            results = await run_operations()
+        return [r for r in results if isinstance(r, BaseException)]
+
+    def check(self):
+        failures, delivered, remaining = invariants(self.bot.db, self.added,
+                                                    self.initial_balance,
+                                                    self.bot.sales)
+        if self.bot.store.load() != plain(self.bot.db):
+            failures.append("section files differ from the in-memory db")
+        failures += stale_indexes(self.bot)
+        return failures, delivered, remaining
+
+
+# ---------------- Invariants ----------------
+def invariants(db, added, initial_balance, sales):
+    """Failures of `db`, in memory or as read back from disk, against the
+    codes ever `added` and the balance total it started from"""
+    failures = []
+
+    delivered = collections.Counter()
+    spent = 0
+    expected_sales = 0
+    for user in db["users"].values():
+        if user["balance"] < 0:
+            failures.append(f"negative balance {user['balance']}")
+        for entry in user["history"]:
+            delivered.update(entry["codes"])
+            if entry["type"] == "balance":
+                spent += entry["total_price"]
+                expected_sales += entry["total_price"]
+    for receipt in db["receipts"].values():
+        if receipt["status"] == "approved":
+            expected_sales += db["prices"][receipt["game_type"]][
+                receipt["amount"]] * receipt["quantity"]
+
+    twice = [code for code, n in delivered.items() if n > 1]
+    if twice:
+        failures.append(f"{len(twice)} codes delivered more than once")
+    remaining = stocked(db)
+    if delivered + remaining != added:
+        lost = added - (delivered + remaining)
+        extra = (delivered + remaining) - added
+        failures.append(f"stock not conserved: {sum(lost.values())} "
+                        f"lost, {sum(extra.values())} appeared")
+
+    topups = sum(r["amount"] for r in db["topup_requests"].values()
+                 if r["status"] == "approved")
+    moved = total_balance(db) - initial_balance
+    if moved != topups - spent:
+        failures.append(f"balances moved by {moved}, expected "
+                        f"{topups} top-ups - {spent} spent")
+    if db["sales_total"] != expected_sales:
+        failures.append(f"sales_total {db['sales_total']} != "
+                        f"{expected_sales} from history")
+    logged = sum(totals[0] for totals in sales.window(86400).values())
+    if logged != expected_sales:
+        failures.append(f"sales log has {logged}, expected "
+                        f"{expected_sales} from history")
+    return failures, sum(delivered.values()), sum(remaining.values())
+
+
+def stale_indexes(bot):
+    """Failures of the indexes a process keeps next to its `db`"""
+    from dashboard import PendingIndex
+    from price_index import PriceIndex
+    from review_queue import ReviewQueue
+    db = bot.db
+    failures = []
+    index = bot.price_index
+    if index._stock is not db["stock"] or index._prices is not db["prices"]:
+        failures.append("price index holds detached stock or prices")
+    fresh = PriceIndex(db["stock"], db["prices"])
+    if (index.global_min, index._game_min) != (fresh.global_min,
+                                               fresh._game_min):
+        failures.append(f"price index minimum {index.global_min}, "
+                        f"{fresh.global_min} in the db")
+    if bot.catalog.data is not db["catalog"]:
+        failures.append("catalog holds a detached dict")
+    skus = {(game_type, amount)
+            for game_type, amounts in db["catalog"]["skus"].items()
+            for amount in amounts}
+    if set(bot.catalog._by_key) != skus:
+        failures.append("catalog SKUs differ from the db")
+    if (bot.forecast.state is not db["forecast"]
+            or bot.forecast.thresholds is not db["alert_thresholds"]):
+        failures.append("forecast holds detached dicts")
+    if bot.review.staff is not db["staff"]:
+        failures.append("review queue holds a detached staff roster")
+    queues = bot.request_queues()
+    pending = PendingIndex()
+    pending.rebuild(queues)
+    if any(
+            set(bot.pending._queues.get(name, ())) != set(ids)
+            for name, ids in pending._queues.items()):
+        failures.append("pending index differs from the request queues")
+    review = ReviewQueue(bot.ADMIN_ID, bot.REVIEW_TIMEOUT)
+    review.rebind(db["staff"], queues)
+    loads = {uid: n for uid, n in bot.review._load.items() if n}
+    if (bot.review._assigned, loads) != (review._assigned, review._load):
+        failures.append("review assignments differ from the request queues")
+    return failures
+
+
+async def run(args):
+    bot = importlib.import_module("main")
+    app, request = await build_app(
+        latency=lambda: random.uniform(0, args.max_latency_ms / 1000))
+    stress = Stress(bot, app, args)
+    ok = True
+    for n in range(1, args.rounds + 1):
+        errors = await stress.round()
+        failures, delivered, remaining = stress.check()
+        failures += [f"handler raised {e!r}" for e in errors[:5]]
+        status = "ok" if not failures else "FAILED"
+        print(f"round {n}: {args.ops} ops, {delivered} codes delivered, "
+              f"{remaining} in stock -> {status}")
+        for failure in failures:
+            print(f"  - {failure}")
+        ok = ok and not failures
+    await app.shutdown()
+    return ok
+
+
+# ---------------- Several processes ----------------
+def worker(index, args, commands, results, approvals):
+    """One process of a --workers run, set up the way scaleout.py does"""
+    import main as bot
+    from shared_store import SharedDatabase
+    bot.shared_db = SharedDatabase(bot.DB_DIR, bot.reload_db)
+    bot.worker_index = index
+    asyncio.run(serve(bot, index, args, commands, results, approvals))
+
+
+async def serve(bot, index, args, commands, results, approvals):
+    from section_store import SectionStore
+    app, request = await build_app(
+        latency=lambda: random.uniform(0, args.max_latency_ms / 1000))
+    stress = Stress(bot, app, args, index, args.workers, approvals)
+    ops = args.ops // args.workers + (index < args.ops % args.workers)
+    loop = asyncio.get_running_loop()
+    results.put(index)
+    while True:
+        command = await loop.run_in_executor(None, commands.get)
+        if command == "round":
+            before = stress.added.copy()
+            errors = await stress.round(ops)
+            results.put((index, [repr(e) for e in errors[:5]],
+                         dict(stress.added - before)))
+        elif command == "check":
+            bot.shared_db.refresh()
+            same = SectionStore(bot.DB_DIR).load() == plain(bot.db)
+            results.put((index, same, stale_indexes(bot)))
+        else:
+            break
+    await app.shutdown()
+
+
+def collect(results, processes):
+    """One reply per process; fails instead of waiting on a dead one"""
+    replies = []
+    while len(replies) < len(processes):
+        try:
+            replies.append(results.get(timeout=1))
+        except queue.Empty:
+            dead = [p.name for p in processes if not p.is_alive()]
+            if dead:
+                raise RuntimeError(f"{', '.join(dead)} exited")
+    return replies
+
+
+def run_workers(args, db):
+    from sales import SalesLog
+    from section_store import SectionStore
+    ctx = multiprocessing.get_context("spawn")
+    commands = [ctx.Queue() for _ in range(args.workers)]
+    results, approvals = ctx.Queue(), ctx.Queue()
+    processes = [
+        ctx.Process(target=worker,
+                    args=(i, args, commands[i], results, approvals),
+                    name=f"worker-{i}") for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    added, initial_balance = stocked(db), total_balance(db)
+    ok = True
+    try:
+        collect(results, processes)
+        for n in range(1, args.rounds + 1):
+            for q in commands:
+                q.put("round")
+            errors = []
+            for _, raised, new in collect(results, processes):
+                errors += raised
+                added.update(new)
+            for q in commands:
+                q.put("check")
+            checks = sorted(collect(results, processes))
+            stale = [index for index, same, _ in checks if not same]
+            failures, delivered, remaining = invariants(
+                SectionStore(os.environ["DB_DIR"]).load(), added,
+                initial_balance, SalesLog(os.environ["SALES_LOG"]))
+            failures += [f"worker {i} differs from the section files"
+                         for i in stale]
+            failures += [f"worker {i}: {failure}"
+                         for i, _, indexes in checks for failure in indexes]
+            failures += [f"handler raised {e}" for e in errors[:5]]
+            status = "ok" if not failures else "FAILED"
+            print(f"round {n}: {args.ops} ops on {args.workers} workers, "
+                  f"{delivered} codes delivered, {remaining} in stock "
+                  f"-> {status}")
+            for failure in failures:
+                print(f"  - {failure}")
+            ok = ok and not failures
+    finally:
+        for q in commands:
+            q.put(None)
+        for process in processes:
+            process.join()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--ops", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--codes", type=int, default=300)
+    parser.add_argument("--double-tap",
+                        type=float,
+                        default=0.1,
+                        help="fraction of money-moving taps sent twice")
+    parser.add_argument("--max-latency-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers",
+                        type=int,
+                        default=1,
+                        help="processes sharing DB_DIR, as under scaleout.py")
+    args = parser.parse_args()
+
+    prepare_env()
+    db = synthetic_db(users=args.users,
+                      codes=args.codes,
+                      history=0,
+                      balance=20000,
+                      seed=args.seed)
+    write_db(db)
+    if args.workers > 1:
+        ok = run_workers(args, db)
+    else:
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
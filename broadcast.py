@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import time
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+
+class Broadcast:
+    """One announcement to every recipient, resumable after a restart.
+
+    Recipients are taken in the order `recipients` yields them,
+    `concurrency` at a time, and paced to `rate` messages/second. Progress
+    is written to `path` after every batch, so a restarted bot resumes
+    after the last checkpointed id and at most one batch is ever sent
+    twice.
+    """
+
+    def __init__(self, path, text, after=None, delivered=0, blocked=0,
+                 failed=0):
+        self.path = path
+        self.text = text
+        self.after = after
+        self.delivered = delivered
+        self.blocked = blocked
+        self.failed = failed
+        self._next_at = 0.0
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls(path, **json.load(f))
+
+    def checkpoint(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "text": self.text,
+                    "after": self.after,
+                    "delivered": self.delivered,
+                    "blocked": self.blocked,
+                    "failed": self.failed
+                }, f)
+        os.replace(tmp, self.path)
+
+    def finish(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def run(self, bot, recipients, rate, concurrency, busy):
+        """Send to every id from `recipients(after)`.
+
+        `busy()` is polled before each batch; while it is true the broadcast
+        waits, so live traffic always goes first.
+        """
+        interval = 1.0 / rate
+        batch = []
+        for uid in recipients(self.after):
+            batch.append(uid)
+            if len(batch) < concurrency:
+                continue
+            await self._send_batch(bot, batch, interval, busy)
+            batch = []
+        if batch:
+            await self._send_batch(bot, batch, interval, busy)
+        self.finish()
+
+    async def _send_batch(self, bot, batch, interval, busy):
+        while busy():
+            await asyncio.sleep(0.1)
+        await asyncio.gather(
+            *[self._send(bot, uid, self._slot(interval)) for uid in batch])
+        self.after = batch[-1]
+        self.checkpoint()
+
+    def _slot(self, interval):
+        """Seconds to wait for the next free send slot"""
+        now = time.monotonic()
+        self._next_at = max(self._next_at, now) + interval
+        return self._next_at - interval - now
+
+    async def _send(self, bot, uid, delay):
+        await asyncio.sleep(delay)
+        for _ in range(3):
+            try:
+                await bot.send_message(uid, self.text)
+                self.delivered += 1
+                return
+            except RetryAfter as e:
+                # Flood limit: hold back every later slot as well
+                self._next_at = max(self._next_at,
+                                    time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except Forbidden:
+                self.blocked += 1
+                return
+            except TelegramError:
+                break
+        self.failed += 1
@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+from records import GAME_NAMES, GameType
+
+PAGE_SIZE = 8
+DEFAULT_UNITS = {
+    GameType.MLBB_BAL: "Coin",
+    GameType.MLBB_PH: "Coin",
+    GameType.PUPG: "UC"
+}
+
+# One denomination of a game, with what its buttons and messages show
+Sku = namedtuple("Sku", "id game_type amount name unit label")
+
+
+def amount_key(amount):
+    """Numeric amounts in numeric order, anything else after them"""
+    return (0, int(amount), "") if amount.isdigit() else (1, 0, amount)
+
+
+def default_catalog(stock, prices):
+    """The original games, with ids for every denomination already stocked
+    or priced. Deterministic, so every worker seeds the same ids."""
+    games = {
+        game_type: {
+            "name": name,
+            "unit": DEFAULT_UNITS[game_type]
+        }
+        for game_type, name in GAME_NAMES.items()
+    }
+    skus = {}
+    next_id = 1
+    for game_type in sorted(set(stock) | set(prices)):
+        games.setdefault(game_type, {"name": game_type, "unit": ""})
+        amounts = set(stock.get(game_type, {})) | set(
+            prices.get(game_type, {}))
+        for amount in sorted(amounts, key=amount_key):
+            skus.setdefault(game_type, {})[amount] = next_id
+            next_id += 1
+    return {"games": games, "skus": skus}
+
+
+def page(items, number, size=PAGE_SIZE):
+    """(items on page `number`, that page number clamped, page count)"""
+    pages = max(1, -(-len(items) // size))
+    number = min(max(number, 0), pages - 1)
+    return items[number * size:(number + 1) * size], number, pages
+
+
+class Catalog:
+    """Games and their denominations (SKUs), with display metadata
+    precomputed per SKU.
+
+    `data` is the persisted {"games": {game_type: {"name", "unit"}},
+    "skus": {game_type: {amount: id}}}. A denomination gets a small
+    integer id the first time it is stocked or priced, and keeps it, so
+    callback_data names it in a few bytes ("amount_17") however long the
+    game and amount strings get; Telegram allows 64.
+    """
+
+    def __init__(self, data):
+        self.rebind(data)
+
+    def rebind(self, data):
+        self.data = data
+        self._by_id = {}
+        self._by_key = {}
+        self._sorted = {}  # game_type -> [Sku] in amount order
+        self._next = 1
+        for game_type, amounts in data["skus"].items():
+            for amount, sku_id in amounts.items():
+                self._index(game_type, amount, sku_id)
+        for skus in self._sorted.values():
+            skus.sort(key=lambda sku: amount_key(sku.amount))
+
+    def _index(self, game_type, amount, sku_id):
+        game = self.game(game_type)
+        sku = Sku(sku_id, game_type, amount, game["name"], game["unit"],
+                  f"{amount} {game['unit']}".rstrip())
+        self._by_id[sku_id] = sku
+        self._by_key[(game_type, amount)] = sku
+        self._sorted.setdefault(game_type, []).append(sku)
+        self._next = max(self._next, sku_id + 1)
+        return sku
+
+    # ---------------- Games ----------------
+    def game(self, game_type):
+        return self.data["games"].get(game_type) or {
+            "name": game_type,
+            "unit": ""
+        }
+
+    def game_types(self):
+        return list(self.data["games"])
+
+    def display_name(self, game_type):
+        return self.game(game_type)["name"]
+
+    def unit(self, game_type):
+        return self.game(game_type)["unit"]
+
+    def set_game(self, game_type, name, unit):
+        """Add a game or rename one; its SKUs pick up the new labels"""
+        self.data["games"][game_type] = {"name": name, "unit": unit}
+        amounts = self.data["skus"].get(game_type, {})
+        self._sorted.pop(game_type, None)
+        for amount, sku_id in amounts.items():
+            self._index(game_type, amount, sku_id)
+        self._sorted.get(game_type, []).sort(
+            key=lambda sku: amount_key(sku.amount))
+
+    # ---------------- SKUs ----------------
+    def sku(self, game_type, amount):
+        return self._by_key.get((game_type, amount))
+
+    def by_id(self, sku_id):
+        return self._by_id.get(sku_id)
+
+    def skus(self, game_type):
+        """Every SKU of a game, in amount order"""
+        return self._sorted.get(game_type, [])
+
+    def ensure(self, game_type, amount):
+        """(SKU for a denomination, whether it was new), assigning an id to
+        a new one"""
+        sku = self.sku(game_type, amount)
+        if sku is not None:
+            return sku, False
+        sku_id = self._next
+        self.data["skus"].setdefault(game_type, {})[amount] = sku_id
+        sku = self._index(game_type, amount, sku_id)
+        self._sorted[game_type].sort(key=lambda sku: amount_key(sku.amount))
+        return sku, True
@@ -0,0 +1,130 @@
+import asyncio
+import bisect
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+from metrics import http_handler
+
+MAX_LIMIT = 100
+
+
+def query_limit(params, default):
+    """`limit` query parameter; ValueError (a 400) unless 1..MAX_LIMIT"""
+    limit = int(params.get("limit", default))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be 1..{MAX_LIMIT}")
+    return limit
+
+
+class PendingIndex:
+    """Ids of pending requests per queue, oldest first.
+
+    Kept up to date at the sites that create and resolve requests, so
+    reading a queue never scans the request dicts.
+    """
+
+    def __init__(self):
+        self._queues = {}
+
+    def rebuild(self, queues):
+        """`queues` maps a queue name to {id: record with a status}"""
+        self._queues = {
+            name: {
+                rid: None
+                for rid, record in records.items()
+                if record["status"] == "pending"
+            }
+            for name, records in queues.items()
+        }
+
+    def add(self, name, rid):
+        self._queues.setdefault(name, {})[rid] = None
+
+    def discard(self, name, rid):
+        self._queues.get(name, {}).pop(rid, None)
+
+    def snapshot(self, limit=20):
+        return {
+            name: {
+                "count": len(ids),
+                "oldest": list(itertools.islice(ids, limit))
+            }
+            for name, ids in self._queues.items()
+        }
+
+
+class BalanceRanking:
+    """Users ordered by balance, updated one user at a time"""
+
+    def __init__(self):
+        self._order = []  # (-balance, uid), ascending
+        self._balance = {}
+
+    def rebuild(self, users):
+        self._balance = {uid: user["balance"] for uid, user in users.items()}
+        self._order = sorted((-b, uid) for uid, b in self._balance.items())
+
+    def update(self, uid, balance):
+        old = self._balance.get(uid)
+        if old == balance:
+            return
+        if old is not None:
+            i = bisect.bisect_left(self._order, (-old, uid))
+            del self._order[i]
+        bisect.insort(self._order, (-balance, uid))
+        self._balance[uid] = balance
+
+    def top(self, n):
+        return [(uid, -neg) for neg, uid in self._order[:n]]
+
+
+class Dashboard:
+    """Read-only JSON endpoints on the bot's event loop.
+
+    `routes` maps a path to a function taking the query parameters and
+    returning something JSON-serialisable. Responses are cached for `ttl`
+    seconds per (path, query), so a dashboard polling every few seconds
+    costs at most one render per TTL. `refresh`, if given, runs before
+    each render.
+    """
+
+    def __init__(self, routes, ttl=2.0, refresh=None):
+        self.routes = routes
+        self.ttl = ttl
+        self.refresh = refresh
+        self._cache = {}  # (path, query) -> (expires, body)
+
+    def render(self, path, query, now=None):
+        now = time.monotonic() if now is None else now
+        key = (path, query)
+        cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        if self.refresh:
+            self.refresh()
+        body = json.dumps(self.routes[path](dict(parse_qsl(query))),
+                          ensure_ascii=False).encode()
+        if len(self._cache) > 256:
+            self._cache = {
+                k: v
+                for k, v in self._cache.items() if v[0] > now
+            }
+        self._cache[key] = (now + self.ttl, body)
+        return body
+
+    def _respond(self, path, query):
+        if path not in self.routes:
+            return "404 Not Found", json.dumps({
+                "endpoints": sorted(self.routes)
+            }).encode()
+        try:
+            return "200 OK", self.render(path, query)
+        except ValueError:
+            return "400 Bad Request", b'{"error": "bad request"}'
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(
+            http_handler(self._respond, "application/json; charset=utf-8"),
+            host, port)
@@ -0,0 +1,73 @@
+import math
+import time
+
+
+class StockForecast:
+    """Sell-velocity estimate per denomination and one-shot low-stock alerts.
+
+    All state lives in plain dicts inside `db` ({game_type: {amount: ...}}),
+    so it is saved, reloaded and shared between workers like stock itself.
+    Every sale or restock costs O(1): one exponentially decayed rate update
+    and one comparison. A denomination alerts once when it runs low and is
+    re-armed only after a restock takes it out of the danger zone.
+    """
+
+    def __init__(self, state, thresholds, horizon, default_threshold,
+                 half_life=6 * 3600):
+        self.state = state  # {"rate": units/second, "at": ts, "alerted": bool}
+        self.thresholds = thresholds
+        self.horizon = horizon
+        self.default_threshold = default_threshold
+        self._tau = half_life / math.log(2)
+
+    def rebind(self, state, thresholds):
+        self.state = state
+        self.thresholds = thresholds
+
+    def _entry(self, game_type, amount):
+        return self.state.setdefault(game_type, {}).setdefault(
+            amount, {
+                "rate": 0.0,
+                "at": 0.0,
+                "alerted": False
+            })
+
+    def rate(self, game_type, amount, now=None):
+        """Units per second, decayed to `now`"""
+        entry = self.state.get(game_type, {}).get(amount)
+        if entry is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return entry["rate"] * math.exp(-max(0.0, now - entry["at"]) /
+                                        self._tau)
+
+    def threshold(self, game_type, amount):
+        return self.thresholds.get(game_type, {}).get(amount,
+                                                      self.default_threshold)
+
+    def sold(self, game_type, amount, units, remaining, now=None):
+        """Fold a sale into the rate; returns seconds-to-empty if this sale
+        should raise the alert, otherwise None"""
+        now = time.time() if now is None else now
+        rate = self.rate(game_type, amount, now) + units / self._tau
+        entry = self._entry(game_type, amount)
+        entry["rate"] = rate
+        entry["at"] = now
+        if entry["alerted"] or not self._low(game_type, amount, remaining,
+                                             rate):
+            return None
+        entry["alerted"] = True
+        return remaining / rate if rate else 0.0
+
+    def restocked(self, game_type, amount, remaining, now=None):
+        """Re-arm the alert once stock is comfortable again"""
+        entry = self.state.get(game_type, {}).get(amount)
+        if entry and entry["alerted"] and not self._low(
+                game_type, amount, remaining, self.rate(game_type, amount,
+                                                        now)):
+            entry["alerted"] = False
+
+    def _low(self, game_type, amount, remaining, rate):
+        if remaining <= self.threshold(game_type, amount):
+            return True
+        return rate > 0 and remaining / rate < self.horizon
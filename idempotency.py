@@ -0,0 +1,29 @@
+import time
+from collections import OrderedDict
+
+
+class RecentQueries:
+    """Bounded, TTL-limited memory of recently handled callback keys"""
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._seen = OrderedDict()  # key -> first seen, oldest first
+
+    def seen(self, key, now=None):
+        """Return True for a repeat of `key`, otherwise remember it"""
+        now = time.monotonic() if now is None else now
+        while self._seen:
+            oldest, first_seen = next(iter(self._seen.items()))
+            if now - first_seen < self.ttl:
+                break
+            del self._seen[oldest]
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return False
+
+    def __len__(self):
+        return len(self._seen)
@@ -0,0 +1,81 @@
+import heapq
+import json
+import time
+
+from records import Status, encode_record, transition
+
+
+class RequestLifecycle:
+    """Expiry of stale pending requests and archival of resolved ones.
+
+    `queues` maps a name ("topups", ...) to its {id: request} dict. A heap
+    ordered by due time holds when each pending request expires and when
+    each resolved one leaves the hot dataset, so a sweep only touches what
+    is due. Entries made stale by an approval in the meantime are noticed
+    and skipped when popped.
+
+    Registrations are deleted when resolved, so they only ever expire.
+    """
+
+    def __init__(self, queues, max_age, archive_after, archive_path):
+        self.max_age = max_age
+        self.archive_after = archive_after
+        self.archive_path = archive_path
+        self.rebind(queues)
+
+    def rebind(self, queues):
+        self.queues = queues
+        now = time.time()
+        self._heap = []
+        for name, requests in queues.items():
+            for rid, request in requests.items():
+                if "created" not in request:
+                    request["created"] = now
+                due = self._due(name, request)
+                if due is not None:
+                    self._heap.append((due, name, rid))
+        heapq.heapify(self._heap)
+
+    def _due(self, name, request):
+        if request["status"] == Status.PENDING:
+            return request["created"] + self.max_age[name]
+        if name == "registrations":
+            return None
+        resolved = request.get("resolved") or request["created"]
+        return resolved + self.archive_after
+
+    def track(self, name, rid):
+        """Schedule a request that was just created or resolved"""
+        request = self.queues[name].get(rid)
+        due = request and self._due(name, request)
+        if due is not None:
+            heapq.heappush(self._heap, (due, name, rid))
+
+    def sweep(self, now=None):
+        """Expire and archive everything due.
+
+        Returns the expired [(name, id, request)] and the archived
+        [(name, id)]; the caller saves the database and tells the users.
+        """
+        now = time.time() if now is None else now
+        expired, archive = [], []
+        while self._heap and self._heap[0][0] <= now:
+            due, name, rid = heapq.heappop(self._heap)
+            request = self.queues[name].get(rid)
+            if request is None or self._due(name, request) != due:
+                continue
+            if request["status"] == Status.PENDING:
+                if name == "registrations":
+                    del self.queues[name][rid]
+                else:
+                    transition(request, Status.EXPIRED, now)
+                    self.track(name, rid)
+                expired.append((name, rid, request))
+            else:
+                archive.append({"queue": name, "id": rid, "request": request})
+                del self.queues[name][rid]
+        if archive:
+            with open(self.archive_path, "a") as f:
+                for entry in archive:
+                    f.write(json.dumps(entry, default=encode_record) + "\n")
+        return expired, [(e["queue"], e["id"]) for e in archive]
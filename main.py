@@ -1,21 +1,111 @@
 import os
+import atexit
 import json
+import re
 import random
 import asyncio
+import tarfile
+import time
+import contextlib
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, TypeHandler, filters
 from dotenv import load_dotenv
+import metrics
+from backups import Backups, validate
+from broadcast import Broadcast
+from catalog import PAGE_SIZE, Catalog, default_catalog, page
+from dashboard import BalanceRanking, Dashboard, PendingIndex, query_limit
+from forecast import StockForecast
+from idempotency import RecentQueries
+from lifecycle import RequestLifecycle
+from memstats import (AllocationTrace, deep_size, footprint, human, rss,
+                      section_sizes, type_census)
+from price_index import PriceIndex
+from ratelimit import FloodControl
+from replication import QUEUE_SECTIONS, ChangeLog, touch
+from records import (HistoryEntry, HistoryType, Receipt, Record, Status,
+                     TopupRequest, UserRecord, hydrate, transition)
+from review_queue import ROLES, ReviewQueue
+from sales import SalesLog, parse_window
+from section_store import QUEUES, SectionStore
+from state_store import ConversationStore
+from traffic import TraceRecorder
+from user_index import UserIndex
 
 # ---------------- Load .env ----------------
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# e.g. http://127.0.0.1:8081/bot for bench/mock_api.py
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+# Local read-only JSON API, e.g. DASHBOARD_PORT=9200; off when unset
+DASHBOARD_PORT = int(os.getenv("DASHBOARD_PORT", "0"))
+DASHBOARD_TTL = float(os.getenv("DASHBOARD_TTL", "2"))
+# Send /memstats to ADMIN_ID every N minutes; 0 = only on demand. It can
+# also be switched at runtime with /memstats every <minutes>
+MEMSTATS_INTERVAL = float(os.getenv("MEMSTATS_INTERVAL_MINUTES", "0")) * 60
+if METRICS_ENABLED:
+    metrics.enable()
 
 # ---------------- Database ----------------
-DB_FILE = "database.json"
-
-
-def load_db():
+# One file per section in DB_DIR; a single-file DB_FILE is imported once
+# when DB_DIR is empty
+DB_DIR = os.getenv("DB_DIR", "database")
+DB_FILE = os.getenv("DB_FILE", "database.json")
+DB_USER_SHARDS = int(os.getenv("DB_USER_SHARDS", "16"))
+# Commits survive a process crash either way; DB_FSYNC=1 also makes them
+# survive a power cut, at the cost of one fsync per written file
+DB_FSYNC = os.getenv("DB_FSYNC", "0") == "1"
+STATE_FILE = os.getenv("STATE_FILE", "conversation_state.db")
+SALES_LOG = os.getenv("SALES_LOG", "sales_events.jsonl")
+# Alert when a denomination is at or below this many codes, or when it is
+# projected to sell out within the horizon
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+LOW_STOCK_HORIZON = float(os.getenv("LOW_STOCK_HORIZON_HOURS", "6")) * 3600
+# Telegram rejects longer messages; confirmations keep room for the header
+MESSAGE_LIMIT = 4096
+INLINE_CODES_LIMIT = 3000
+# Orders with more codes than this arrive as a .txt document
+DOCUMENT_THRESHOLD = int(os.getenv("DOCUMENT_THRESHOLD", "100"))
+BROADCAST_FILE = os.getenv("BROADCAST_FILE", "broadcast.json")
+# Pending requests expire after these ages; resolved ones move to
+# ARCHIVE_FILE once they are ARCHIVE_AFTER old
+REQUEST_MAX_AGE = {
+    "registrations":
+    float(os.getenv("REGISTRATION_MAX_AGE_HOURS", "72")) * 3600,
+    "topups": float(os.getenv("TOPUP_MAX_AGE_HOURS", "48")) * 3600,
+    "receipts": float(os.getenv("RECEIPT_MAX_AGE_HOURS", "48")) * 3600,
+}
+ARCHIVE_AFTER = float(os.getenv("ARCHIVE_AFTER_DAYS", "7")) * 86400
+ARCHIVE_FILE = os.getenv("ARCHIVE_FILE", "requests_archive.jsonl")
+LIFECYCLE_SWEEP_INTERVAL = 300
+# Pending requests go to the least-loaded online staff member and move on
+# to another one if still unhandled after REVIEW_TIMEOUT
+REVIEW_TIMEOUT = float(os.getenv("REVIEW_TIMEOUT_MINUTES", "15")) * 60
+REVIEW_SWEEP_INTERVAL = 60
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+# Commit journal tailed by standby.py, rotated to CHANGE_LOG.1 at this size
+CHANGE_LOG = os.getenv("CHANGE_LOG", "changes.jsonl")
+CHANGE_LOG_MAX_BYTES = int(float(os.getenv("CHANGE_LOG_MAX_MB", "64")) * 2**20)
+# Opt-in anonymized trace of incoming updates for bench/replay.py, e.g.
+# TRACE_FILE=traffic.trace.gz; workers sharing a trace share TRACE_KEY
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_KEY = os.getenv("TRACE_KEY", "")
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL_MINUTES", "60")) * 60
+# Retention: newest N snapshots, plus one per day / ISO week for N of them
+BACKUP_KEEP = tuple(
+    int(os.getenv(f"BACKUP_KEEP_{tier}", default))
+    for tier, default in (("HOURLY", "24"), ("DAILY", "7"), ("WEEKLY", "4")))
+# Telegram allows about 30 messages/second; the rest is left for live traffic
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))
+BROADCAST_CONCURRENCY = 8
+
+
+def read_legacy_db():
     if not os.path.exists(DB_FILE):
         return {
             "users": {},
@@ -42,10 +132,17 @@ def load_db():
                     "name": "Ma May Phoo Wai"
                 }
             },
-            "sales_total": 0
+            "sales_total": 0,
+            "forecast": {},
+            "alert_thresholds": {}
         }
     with open(DB_FILE, "r") as f:
-        data = json.load(f)
+        return json.load(f)
+
+
+def load_db():
+    imported = not store.exists()
+    data = read_legacy_db() if imported else store.load()
 
     # Update old structure if needed
     if "stock" in data and isinstance(data["stock"],
@@ -73,7 +170,6 @@ def load_db():
 
         data["stock"] = new_stock
         data["prices"] = new_prices
-        save_db(data)
 
     # Migrate PUBG to PUPG in existing structure
     if "stock" in data and "PUBG" in data["stock"]:
@@ -101,6 +197,9 @@ def load_db():
         }
     if "sales_total" not in data: data["sales_total"] = 0
     if "pending_registrations" not in data: data["pending_registrations"] = {}
+    if "forecast" not in data: data["forecast"] = {}
+    if "alert_thresholds" not in data: data["alert_thresholds"] = {}
+    if "staff" not in data: data["staff"] = {}
 
     # Clear old codes from MLBBph and PUPG (one-time cleanup)
     if "cleanup_done" not in data:
@@ -110,25 +209,352 @@ def load_db():
             data["stock"]["PUPG"] = {}
         data["cleanup_done"] = True
 
+    if "catalog" not in data:
+        data["catalog"] = default_catalog(data["stock"], data["prices"])
+        if not imported:
+            store.touch("config")
+
+    data = hydrate(data)
+    if imported:
+        store.create(data)
     return data
 
 
 def save_db(db):
-    with open(DB_FILE, "w") as f:
-        json.dump(db, f, indent=2)
+    with metrics.timer("persistence_seconds", "save_db"):
+        store.save(db)
+    changes.commit()
+    if shared_db:
+        shared_db.saved()
+
+
+# Set by scaleout.run_worker() when several processes share DB_DIR
+shared_db = None
+changes = ChangeLog(CHANGE_LOG, CHANGE_LOG_MAX_BYTES)
+# Singleton jobs (broadcasts, ...) only run on worker 0
+worker_index = 0
+
+
+def db_transaction():
+    """Critical section for a check-mutate-save sequence on `db`.
+
+    A no-op in a single process. With several workers it serializes commits
+    and first refreshes `db` with whatever the other workers saved, so
+    records must be looked up inside the block. Never await inside it.
+    """
+    return shared_db.transaction() if shared_db else contextlib.nullcontext()
+
 
+def record_change(op, *args):
+    """Journal a change and mark the section file it lands in"""
+    changes.record(op, *args)
+    touch(store, op, args)
 
+
+def replace_section(key, value):
+    """Swap a top-level value of `db` for a freshly read one, in place for
+    dicts: the indexes hold on to those and must see the new contents"""
+    current = db.get(key)
+    if isinstance(current, dict) and isinstance(value, dict):
+        current.clear()
+        current.update(value)
+    else:
+        db[key] = value
+
+
+def reload_db():
+    """Catch `db` up with what the other workers committed.
+
+    Only the section files committed since this worker last read or wrote
+    them are read, and only the indexes built from those sections are
+    refreshed; users and requests are updated one at a time.
+    """
+    changed = store.changed()
+    if changed is None:
+        fresh = load_db()
+        db.clear()
+        db.update(fresh)
+        price_index.rebuild(db["stock"], db["prices"])
+        catalog.rebind(db["catalog"])
+        forecast.rebind(db["forecast"], db["alert_thresholds"])
+        rebuild_aggregates()
+        return
+
+    users, parts = {}, {"stock": {}}
+    for section, value in changed.items():
+        kind, _, key = section.partition(".")
+        if section == "config":
+            parts.update(value or {})
+        elif kind == "users":
+            users.update(value or {})
+        elif kind == "stock":
+            parts["stock"][key] = value or {}
+        else:
+            parts[section] = value or {}
+    queues = {
+        section: parts.pop(section)
+        for section in QUEUES if section in parts
+    }
+    present = set(parts)
+    parts = {k: v for k, v in hydrate(parts).items() if k in present}
+
+    # A rewritten shard mostly holds users this worker already has
+    for uid, data in users.items():
+        uid = int(uid)
+        old = db["users"].get(uid)
+        if old is not None and old.same_as(data):
+            continue
+        user = UserRecord.from_dict(data)
+        db["users"][uid] = user
+        balances.update(uid, user["balance"])
+        profile = user.get("name"), user.get("username")
+        if old is None or (old.get("name"), old.get("username")) != profile:
+            user_search.update(uid, *profile)
+    stock = parts.pop("stock")
+    db["stock"].update(stock)
+    # Config arrives whole; see which of its keys actually moved
+    keys = {key for key, value in parts.items() if db.get(key) != value}
+    for key in keys:
+        replace_section(key, parts[key])
+    for section, requests in queues.items():
+        sync_queue(section, requests)
+
+    if stock or "prices" in keys:
+        price_index.rebuild(db["stock"], db["prices"])
+    if "catalog" in keys:
+        catalog.rebind(db["catalog"])
+    if keys & {"forecast", "alert_thresholds"}:
+        forecast.rebind(db["forecast"], db["alert_thresholds"])
+
+
+store = SectionStore(DB_DIR, DB_USER_SHARDS, DB_FSYNC)
 db = load_db()
+price_index = PriceIndex(db["stock"], db["prices"])
+catalog = Catalog(db["catalog"])
+forecast = StockForecast(db["forecast"], db["alert_thresholds"],
+                         LOW_STOCK_HORIZON, LOW_STOCK_THRESHOLD)
+# (game_type, amount, remaining, seconds to empty) waiting to be sent
+stock_alerts = []
+pending = PendingIndex()
+balances = BalanceRanking()
+user_search = UserIndex()
+# Rolling sales aggregates, read forward from SALES_LOG so every worker's
+# sales count; the log rotates to SALES_LOG.1 once it outspans the rings
+sales = SalesLog(SALES_LOG)
+
+
+def request_queues():
+    return {
+        "registrations": db["pending_registrations"],
+        "topups": db["topup_requests"],
+        "receipts": db["receipts"]
+    }
+
+
+def rebuild_aggregates():
+    pending.rebuild(request_queues())
+    balances.rebuild(db["users"])
+    user_search.rebuild(db["users"])
+    lifecycle.rebind(request_queues())
+    review.rebind(db["staff"], request_queues())
+
+
+backups = Backups(store, BACKUP_DIR, *BACKUP_KEEP)
+review = ReviewQueue(ADMIN_ID, REVIEW_TIMEOUT)
+lifecycle = RequestLifecycle(request_queues(), REQUEST_MAX_AGE, ARCHIVE_AFTER,
+                             ARCHIVE_FILE)
+rebuild_aggregates()
+
+
+def request_changed(name, rid):
+    request = request_queues()[name].get(rid)
+    if request is None:
+        record_change("drop_request", name, rid)
+    else:
+        record_change("request", name, rid, request)
+
+
+def sync_queue(section, requests):
+    """Take over another worker's copy of a request queue, as read from
+    JSON, touching only the requests that differ from ours"""
+    name = next(n for n, s in QUEUE_SECTIONS.items() if s == section)
+    current = db[section]
+    ours = {str(rid): rid for rid in current}
+    changed = {}
+    for key, data in requests.items():
+        old = current.get(ours.get(key))
+        if old is None or (old.to_dict()
+                           if isinstance(old, Record) else old) != data:
+            changed[key] = data
+    gone = [rid for key, rid in ours.items() if key not in requests]
+    for rid in gone:
+        del current[rid]
+    fresh = hydrate({section: changed})[section]
+    current.update(fresh)
+    for rid in [*gone, *fresh]:
+        request_synced(name, rid)
+
+
+def request_synced(name, rid):
+    """Index a request as another worker left it"""
+    request = request_queues()[name].get(rid)
+    if request is not None and request["status"] == Status.PENDING:
+        pending.add(name, rid)
+    else:
+        pending.discard(name, rid)
+    lifecycle.track(name, rid)
+    review.track(name, rid)
+
+
+def request_opened(name, rid):
+    pending.add(name, rid)
+    lifecycle.track(name, rid)
+    review.assign(name, rid, review.pick() or ADMIN_ID)
+    request_changed(name, rid)
+
+
+def request_closed(name, rid):
+    pending.discard(name, rid)
+    lifecycle.track(name, rid)
+    review.release(name, rid)
+    request_changed(name, rid)
+
+# ---------------- Conversation state ----------------
+# Multi-step flows: (ttl seconds, keys). Keys of one flow expire together.
+STATE_FLOWS = {
+    "quantity": (15 * 60, ("selecting_quantity", )),
+    "receipt": (60 * 60, ("buying_game", "buying_amount", "buying_quantity",
+                          "receipt_step", "receipt_photo_sent",
+                          "receipt_photo_message_id")),
+    "topup": (60 * 60, ("topup_method", "topup_photo_sent",
+                        "topup_photo_message_id")),
+    "addstock": (30 * 60, ("addstock_game", )),
+    "admin_messaging": (30 * 60, ("admin_messaging", ))
+}
+STATE_SWEEP_INTERVAL = 5 * 60
+
+conversations = ConversationStore(STATE_FILE, STATE_FLOWS)
+
+# ---------------- Duplicate taps ----------------
+# Callbacks that change balances or stock; a repeat of the same button on
+# the same message within the TTL is dropped before any work is done.
+IDEMPOTENT_CALLBACKS = ("buy_balance_", "approve_", "reject_")
+recent_queries = RecentQueries(maxsize=10000, ttl=60)
+
+# ---------------- Flood control ----------------
+# (tokens per second, burst) per user and action class
+RATE_LIMITS = {"navigation": (2.0, 10), "purchase": (0.2, 3)}
+PURCHASE_CALLBACKS = ("buy_balance_", "buy_receipt_", "register")
+SLOW_DOWN_TEXT = "⏳ ခဏစောင့်ပြီးမှ ထပ်နှိပ်ပါ။"
+flood_control = FloodControl(RATE_LIMITS)
+
+# ---------------- Instrumentation ----------------
+# Prefixes that identify a callback action; longer ones first
+CALLBACK_ACTIONS = ("buy_balance_", "buy_receipt_", "approve_topup_",
+                    "reject_topup_", "approve_reg_", "reject_reg_",
+                    "message_topup_", "approve_", "reject_", "message_",
+                    "select_", "amount_", "quantity_", "topup_", "copy_",
+                    "addstock_", "games_")
+
+
+def callback_action(update):
+    data = update.callback_query.data or ""
+    for prefix in CALLBACK_ACTIONS:
+        if data.startswith(prefix):
+            return prefix.rstrip("_")
+    return data
+
+
+def message_kind(update):
+    return "photo" if update.message and update.message.photo else "text"
+
+
+# ---------------- Traffic recording ----------------
+# Words a trace keeps verbatim in typed text; everything else is masked
+TRACE_WORDS = {"Wave", "Kpay", "KPay", "add", "remove", *ROLES}
+
+
+def trace_word(word):
+    return (word in TRACE_WORDS or word in catalog.data["games"]
+            or re.fullmatch(r"\d+[mhd]", word) is not None)
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    trace.record(update)
+
+
+trace = TraceRecorder(TRACE_FILE, lambda uid: is_staff(uid), trace_word,
+                      bytes.fromhex(TRACE_KEY)) if TRACE_FILE else None
+if trace:
+    atexit.register(trace.flush)
 
 
 # ---------------- Helpers ----------------
 def get_user(uid):
     if uid not in db["users"]:
-        db["users"][uid] = {"balance": 0, "history": [], "approved": False}
-        save_db(db)
+        with db_transaction():
+            if uid not in db["users"]:
+                db["users"][uid] = UserRecord()
+                balances.update(uid, 0)
+                user_search.update(uid)
+                record_change("user", uid, db["users"][uid])
+                save_db(db)
     return db["users"][uid]
 
 
+def set_balance(uid, balance):
+    db["users"][uid]["balance"] = balance
+    balances.update(uid, balance)
+    record_change("balance", uid, balance)
+
+
+def add_history(uid, entry):
+    history = db["users"][uid]["history"]
+    record_change("history", uid, len(history), entry)
+    history.append(entry)
+
+
+def add_sales_total(amount):
+    db["sales_total"] += amount
+    record_change("section", "sales_total", db["sales_total"])
+
+
+def approved_users(after=None):
+    """Approved user ids, starting after `after`.
+
+    Ordered by (user shard, uid), so only one shard's ids are ever sorted
+    at a time.
+    """
+    start = (-1, -1) if after is None else (after % store.user_shards, after)
+    for shard in range(max(start[0], 0), store.user_shards):
+        for uid in sorted(store.shard_members(shard)):
+            user = db["users"].get(uid)
+            if (shard, uid) > start and user and user["approved"]:
+                yield uid
+
+
+def is_admin(uid):
+    return review.role(uid) == "admin"
+
+
+def is_staff(uid):
+    return review.role(uid) is not None
+
+
+def may_review(uid, request):
+    """Admins may act on anything, reviewers on what is assigned to them"""
+    return is_admin(uid) or (is_staff(uid)
+                             and request.get("assignee") == uid)
+
+
+def set_staff(uid, member):
+    if member is None:
+        db["staff"].pop(uid, None)
+    else:
+        db["staff"][uid] = member
+    record_change("section", "staff", db["staff"])
+
+
 def is_user_approved(uid):
     return uid in db["users"] and db["users"][uid].get("approved", False)
 
@@ -144,23 +570,277 @@ def validate_receipt_id(rid):
     return rid.isdigit() and 5 <= len(rid) <= 6
 
 
-def get_available_amounts(game_type):
-    """Get available amounts for a game type that have stock"""
-    amounts = []
-    if game_type in db["stock"]:
-        for amount, codes in db["stock"][game_type].items():
-            if codes:  # Only include amounts that have codes
-                amounts.append(amount)
-    return sorted(amounts)
+def in_stock(game_type):
+    """SKUs of a game that have codes, in amount order"""
+    stock = db["stock"].get(game_type, {})
+    return [sku for sku in catalog.skus(game_type) if stock.get(sku.amount)]
+
+
+def register_sku(game_type, amount):
+    if catalog.ensure(game_type, amount)[1]:
+        record_change("section", "catalog", db["catalog"])
+
+
+def take_codes(game_type, amount, quantity):
+    """Pop up to `quantity` codes off the front of a denomination's stock"""
+    stock = db["stock"][game_type][amount]
+    codes = stock[:quantity]
+    del stock[:quantity]
+    price_index.update(game_type, amount)
+    record_change("take", game_type, amount, codes)
+    eta = forecast.sold(game_type, amount, len(codes), len(stock))
+    forecast_changed(game_type, amount)
+    if eta is not None:
+        stock_alerts.append((game_type, amount, len(stock), eta))
+    return codes
+
+
+def add_codes(game_type, amount, codes):
+    stock = db["stock"].setdefault(game_type, {}).setdefault(amount, [])
+    stock.extend(codes)
+    price_index.update(game_type, amount)
+    register_sku(game_type, amount)
+    record_change("add", game_type, amount, list(codes))
+    forecast.restocked(game_type, amount, len(stock))
+    forecast_changed(game_type, amount)
+
+
+def forecast_changed(game_type, amount):
+    entry = db["forecast"].get(game_type, {}).get(amount)
+    if entry is not None:
+        record_change("forecast", game_type, amount, entry)
+
+
+def remove_code(game_type, amount, code):
+    stock = db["stock"].get(game_type, {}).get(amount, [])
+    if code not in stock:
+        return False
+    stock.remove(code)
+    price_index.update(game_type, amount)
+    record_change("remove", game_type, amount, [code])
+    return True
+
+
+def set_price(game_type, amount, price):
+    db["prices"].setdefault(game_type, {})[amount] = price
+    price_index.update(game_type, amount)
+    register_sku(game_type, amount)
+    record_change("price", game_type, amount, price)
+
+
+async def send_stock_alerts(bot):
+    while stock_alerts:
+        game_type, amount, remaining, eta = stock_alerts.pop(0)
+        unit = catalog.unit(game_type)
+        rate = forecast.rate(game_type, amount) * 3600
+        await bot.send_message(
+            ADMIN_ID, f"⚠️ ကုတ်နည်းနေပါသည်: {get_game_display_name(game_type)} "
+            f"{amount} {unit}\n"
+            f"📦 ကျန်: {remaining} ခု\n"
+            f"⚡ {rate:.1f} ခု/နာရီ\n"
+            f"⏳ ~{eta / 3600:.1f} နာရီအတွင်း ကုန်နိုင်ပါသည်")
+
+
+# ---------------- Delivery ----------------
+def fits_inline(codes):
+    return sum(len(code) + 3 for code in codes) <= INLINE_CODES_LIMIT
+
+
+def codes_block(codes):
+    """Codes as shown in a confirmation message, or a note that they follow
+    separately"""
+    if fits_inline(codes):
+        return "\n".join([f"🔑 {code}" for code in codes])
+    return f"📄 ကုတ် {len(codes)} ခုကို နောက်စာများဖြင့် ပို့ပေးပါမည်။"
+
+
+def chunk_lines(lines, limit):
+    chunk, size = [], 0
+    for line in lines:
+        if chunk and size + len(line) > limit:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield "\n".join(chunk)
+
+
+async def send_codes(bot, chat_id, codes, title):
+    """Deliver codes too many for one message: split across messages, or
+    as a .txt document above DOCUMENT_THRESHOLD.
+
+    Stock and balance are committed before delivery, so a failure is
+    reported to the admin, who can resend with /redeliver.
+    """
+    try:
+        if len(codes) > DOCUMENT_THRESHOLD:
+            await bot.send_document(chat_id,
+                                    document="\n".join(codes).encode(),
+                                    filename="codes.txt",
+                                    caption=f"🔑 {title}")
+        else:
+            lines = [f"🔑 {code}" for code in codes]
+            for chunk in chunk_lines(lines, MESSAGE_LIMIT - len(title) - 2):
+                await bot.send_message(chat_id, f"{title}\n\n{chunk}")
+        return True
+    except TelegramError as e:
+        await bot.send_message(
+            ADMIN_ID, f"⚠️ အသုံးပြုသူ {chat_id} ထံ ကုတ် {len(codes)} ခု ပို့၍မရပါ: {e}\n"
+            f"/redeliver {chat_id} ဖြင့် ပြန်ပို့ပါ")
+        return False
 
 
 def get_game_display_name(game_type):
-    names = {
-        "MLBBbal": "Mobile Legends (Bal)",
-        "MLBBph": "Mobile Legends (PH)",
-        "PUPG": "PUPG Mobile"
-    }
-    return names.get(game_type, game_type)
+    return catalog.display_name(game_type)
+
+
+# ---------------- Catalog menus ----------------
+def valid_game_type(game_type):
+    # Callback data is split on "_", and digits alone name a SKU id
+    return (game_type.isascii() and game_type.isalnum()
+            and not game_type.isdigit() and len(game_type) <= 16)
+
+
+def callback_sku(data, prefix):
+    """(SKU, remaining fields) from `<prefix><sku id>_...`, or from the
+    `<prefix><game_type>_<amount>_...` of buttons sent before SKUs had ids.
+    The SKU is None if it is unknown."""
+    fields = data[len(prefix):].split("_")
+    if fields[0].isdigit():
+        return catalog.by_id(int(fields[0])), fields[1:]
+    return catalog.sku(fields[0], fields[1]), fields[2:]
+
+
+def sku_page(sku):
+    """The page of its game's buy menu a SKU is listed on"""
+    skus = in_stock(sku.game_type)
+    return skus.index(sku) // PAGE_SIZE if sku in skus else 0
+
+
+def page_label(number, pages):
+    return f" ({number + 1}/{pages})" if pages > 1 else ""
+
+
+def page_row(callback, number, pages):
+    """Previous/next buttons; the page number is appended to `callback`"""
+    row = []
+    if number > 0:
+        row.append(
+            InlineKeyboardButton("⬅️", callback_data=f"{callback}_{number - 1}"))
+    if number < pages - 1:
+        row.append(
+            InlineKeyboardButton("➡️", callback_data=f"{callback}_{number + 1}"))
+    return [row] if row else []
+
+
+def game_menu(action, number=0):
+    """Text and keyboard rows for one page of games, each button being
+    `<action>_<game_type>`. The buy menu ("select") only lists games with
+    stock; None if there are none."""
+    if action == "select":
+        games = [
+            game_type for game_type in catalog.game_types()
+            if any(db["stock"].get(game_type, {}).values())
+        ]
+    else:
+        games = catalog.game_types()
+    if not games:
+        return None
+
+    visible, number, pages = page(games, number)
+    keyboard = []
+    for game_type in visible:
+        label = f"🎮 {catalog.display_name(game_type)}"
+        if action == "select":
+            total_codes = sum(
+                len(codes) for codes in db["stock"][game_type].values())
+            label += f" ({total_codes})"
+        keyboard.append([
+            InlineKeyboardButton(label, callback_data=f"{action}_{game_type}")
+        ])
+    keyboard += page_row(f"games_{action}", number, pages)
+    return f"🎮 ဂိမ်းအမျိုးအစားရွေးချယ်ပါ{page_label(number, pages)}:", keyboard
+
+
+# ---------------- Reviews ----------------
+def review_notice(name, rid, request):
+    """Text and buttons of the message asking staff to handle a request"""
+    if name == "registrations":
+        # Requests made before handles were kept hold the name as username
+        username = request.get("username") if "name" in request else None
+        text = (f"📬 အကောင့်ဝင်ရန်တောင်းဆိုမှုအသစ်:\n"
+                f"👤 အသုံးပြုသူ ID: {rid}\n"
+                f"📝 အမည်: {request.get('name', request.get('username'))}\n"
+                f"👤 Username: @{username or 'မရှိ'}")
+        buttons = [
+            InlineKeyboardButton("✅ လက်ခံရန်",
+                                 callback_data=f"approve_reg_{rid}"),
+            InlineKeyboardButton("❌ ငြင်းပယ်ရန်",
+                                 callback_data=f"reject_reg_{rid}")
+        ]
+    elif name == "topups":
+        text = (f"📬 ငွေဖြည့်တောင်းဆိုမှုအသစ်:\n"
+                f"👤 အသုံးပြုသူ: {request['user_id']}\n"
+                f"💳 နည်းလမ်း: {request['payment_method']}\n"
+                f"🧾 လွှဲငွေ ID: {rid}\n"
+                f"💰 ငွေပမာဏ: {request['amount']} MMK")
+        buttons = [
+            InlineKeyboardButton("✅ လက်ခံရန်",
+                                 callback_data=f"approve_topup_{rid}"),
+            InlineKeyboardButton("💬 စာပို့ရန်",
+                                 callback_data=f"message_topup_{rid}"),
+            InlineKeyboardButton("❌ ငြင်းပယ်ရန်",
+                                 callback_data=f"reject_topup_{rid}")
+        ]
+    else:
+        game_type = request["game_type"]
+        unit = catalog.unit(game_type)
+        text = (f"📬 ကုတ်ဝယ်ယူမှု:\n"
+                f"👤 အသုံးပြုသူ: {request['user_id']}\n"
+                f"🎮 ဂိမ်း: {get_game_display_name(game_type)}\n"
+                f"💎 {request['amount']} {unit} x {request['quantity']}\n"
+                f"🧾 လွှဲငွေ ID: {rid}")
+        buttons = [
+            InlineKeyboardButton("✅ လက်ခံရန်", callback_data=f"approve_{rid}"),
+            InlineKeyboardButton("💬 စာပို့ရန်", callback_data=f"message_{rid}"),
+            InlineKeyboardButton("❌ ငြင်းပယ်ရန်", callback_data=f"reject_{rid}")
+        ]
+    return text, InlineKeyboardMarkup([buttons])
+
+
+REASSIGNED_TEXT = "⚠️ ဤတောင်းဆိုမှုကို အခြားဝန်ထမ်းထံ လွှဲပေးထားပါသည်။"
+
+
+REASSIGNED_NOTE = "⏰ ဤတောင်းဆိုမှုကို သင့်ထံ လွှဲပေးလိုက်ပါသည်။"
+
+
+def reassign(name, rid, exclude):
+    """Hand a request to another online reviewer; False if there is none"""
+    reviewer = review.pick(exclude=exclude)
+    if reviewer is None:
+        return False
+    review.assign(name, rid, reviewer)
+    request_changed(name, rid)
+    return True
+
+
+async def notify_reviewer(bot, name, rid, note=None):
+    """Send a request, with its screenshot, to the staff member it is
+    assigned to"""
+    request = request_queues()[name].get(rid)
+    if request is None or request["status"] != Status.PENDING:
+        return
+    text, keyboard = review_notice(name, rid, request)
+    if note:
+        text = f"{note}\n\n{text}"
+    if request.get("photo"):
+        await bot.forward_message(chat_id=request["assignee"],
+                                  from_chat_id=request["user_id"],
+                                  message_id=request["photo"])
+    await bot.send_message(chat_id=request["assignee"],
+                           text=text,
+                           reply_markup=keyboard)
 
 
 # ---------------- User Commands ----------------
@@ -182,11 +862,54 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=InlineKeyboardMarkup(keyboard))
 
 
+async def rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user is None or is_staff(user.id):
+        return
+
+    query = update.callback_query
+    if query:
+        action = "purchase" if (query.data or "").startswith(
+            PURCHASE_CALLBACKS) else "navigation"
+    elif update.message and update.message.photo:
+        action = "purchase"
+    else:
+        action = "navigation"
+
+    if flood_control.allow(user.id, action):
+        return
+    if query:
+        await query.answer(SLOW_DOWN_TEXT, cache_time=5)
+    raise ApplicationHandlerStop
+
+
+async def remember_profile(update: Update,
+                           context: ContextTypes.DEFAULT_TYPE):
+    """Keep name and username current for /finduser"""
+    user = update.effective_user
+    record = user and db["users"].get(user.id)
+    if record is None or (record.get("name"), record.get("username")) == (
+            user.first_name, user.username):
+        return
+    with db_transaction():
+        record = db["users"][user.id]
+        record["name"] = user.first_name
+        record["username"] = user.username
+        user_search.update(user.id, user.first_name, user.username)
+        record_change("user", user.id, record)
+        save_db(db)
+
+
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     data = query.data
     uid = query.from_user.id
+    if data.startswith(IDEMPOTENT_CALLBACKS) and recent_queries.seen(
+        (uid, data, query.message.message_id if query.message else None)):
+        await query.answer()
+        return
+    await query.answer()
+    user_state = conversations.for_user(uid)
 
     if data == "start":
         await start(update, context)
@@ -211,27 +934,18 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Create registration request
-        db["pending_registrations"][uid] = {
-            "user_id": uid,
-            "username": query.from_user.first_name,
-            "status": "pending"
-        }
-        save_db(db)
+        with db_transaction():
+            db["pending_registrations"][uid] = {
+                "user_id": uid,
+                "name": query.from_user.first_name,
+                "username": query.from_user.username,
+                "status": Status.PENDING,
+                "created": time.time()
+            }
+            request_opened("registrations", uid)
+            save_db(db)
 
-        # Send to admin
-        keyboard = [[
-            InlineKeyboardButton("✅ လက်ခံရန်",
-                                 callback_data=f"approve_reg_{uid}"),
-            InlineKeyboardButton("❌ ငြင်းပယ်ရန်",
-                                 callback_data=f"reject_reg_{uid}")
-        ]]
-        await context.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=f"📬 အကောင့်ဝင်ရန်တောင်းဆိုမှုအသစ်:\n"
-            f"👤 အသုံးပြုသူ ID: {uid}\n"
-            f"📝 အမည်: {query.from_user.first_name}\n"
-            f"👤 Username: @{query.from_user.username or 'မရှိ'}",
-            reply_markup=InlineKeyboardMarkup(keyboard))
+        await notify_reviewer(context.bot, "registrations", uid)
 
         keyboard = [[
             InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")
@@ -253,16 +967,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = get_user(uid)
         keyboard = []
         # Check if user has enough for any available product
-        can_buy = False
-        for game_type in db["prices"]:
-            for amount, price in db["prices"][game_type].items():
-                if amount in db["stock"].get(
-                        game_type, {}) and db["stock"][game_type][amount]:
-                    if user['balance'] >= price:
-                        can_buy = True
-                        break
-
-        if not can_buy:
+        if not price_index.can_afford(user['balance']):
             keyboard.append(
                 [InlineKeyboardButton("💳 ငွေဖြည့်ရန်", callback_data="topup")])
         keyboard.append(
@@ -294,7 +999,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         payment_method = data.split("_")[1].title()
         payment_info = db["payment"][payment_method]
 
-        context.user_data['topup_method'] = payment_method
+        user_state['topup_method'] = payment_method
         keyboard = [[
             InlineKeyboardButton(f"📋 {payment_info['phone']}",
                                  callback_data=f"copy_{payment_info['phone']}")
@@ -340,7 +1045,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• ငွေစစ်၍ဝယ်ယူလျှင် ချက်ချင်းဝယ်ယူနိုင်မည်",
             reply_markup=InlineKeyboardMarkup(keyboard))
 
-    elif data == "buy":
+    elif data == "buy" or data.startswith("games_select_"):
         if not is_user_approved(uid):
             keyboard = [[
                 InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")
@@ -351,25 +1056,10 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Show available game types
-        keyboard = []
-        available_games = []
-
-        for game_type in ["MLBBbal", "MLBBph", "PUPG"]:
-            amounts = get_available_amounts(game_type)
-            if amounts:
-                total_codes = sum(
-                    len(codes)
-                    for codes in db["stock"].get(game_type, {}).values())
-                if total_codes > 0:
-                    game_name = get_game_display_name(game_type)
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"🎮 {game_name} ({total_codes})",
-                            callback_data=f"select_{game_type}")
-                    ])
-                    available_games.append(game_type)
+        number = 0 if data == "buy" else int(data.rsplit("_", 1)[1])
+        menu = game_menu("select", number)
 
-        if not available_games:
+        if menu is None:
             keyboard = [[
                 InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")
             ]]
@@ -378,17 +1068,19 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
+        text, keyboard = menu
         keyboard.append(
             [InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")])
         await query.edit_message_text(
-            "🎮 ဂိမ်းအမျိုးအစားရွေးချယ်ပါ:",
-            reply_markup=InlineKeyboardMarkup(keyboard))
+            text, reply_markup=InlineKeyboardMarkup(keyboard))
 
     elif data.startswith("select_"):
-        game_type = data.split("_")[1]
-        amounts = get_available_amounts(game_type)
+        parts = data.split("_")
+        game_type = parts[1]
+        number = int(parts[2]) if len(parts) > 2 else 0
+        skus = in_stock(game_type)
 
-        if not amounts:
+        if not skus:
             keyboard = [[
                 InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")
             ]]
@@ -397,47 +1089,45 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-        keyboard = []
-        game_name = get_game_display_name(game_type)
-
-        for amount in amounts:
-            codes_count = len(db["stock"][game_type][amount])
-            price = db["prices"][game_type].get(amount, 0)
-            unit = "Coin" if "MLBB" in game_type else "UC"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"💎 {amount} {unit} - {price} MMK ({codes_count})",
-                    callback_data=f"amount_{game_type}_{amount}")
-            ])
+        # Buttons only for the page on screen
+        visible, number, pages = page(skus, number)
+        stock = db["stock"][game_type]
+        prices = db["prices"].get(game_type, {})
+        keyboard = [[
+            InlineKeyboardButton(
+                f"💎 {sku.label} - {prices.get(sku.amount, 0)} MMK "
+                f"({len(stock[sku.amount])})",
+                callback_data=f"amount_{sku.id}")
+        ] for sku in visible]
+        keyboard += page_row(f"select_{game_type}", number, pages)
 
         keyboard.append(
             [InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")])
         await query.edit_message_text(
-            f"🎮 {game_name}\n💎 အရေအတွက်ရွေးချယ်ပါ:",
+            f"🎮 {get_game_display_name(game_type)}\n"
+            f"💎 အရေအတွက်ရွေးချယ်ပါ{page_label(number, pages)}:",
             reply_markup=InlineKeyboardMarkup(keyboard))
 
     elif data.startswith("amount_"):
-        parts = data.split("_")
-        game_type = parts[1]
-        amount = parts[2]
+        sku, _ = callback_sku(data, "amount_")
 
-        if amount not in db["stock"].get(
-                game_type, {}) or not db["stock"][game_type][amount]:
+        if sku is None or not db["stock"][sku.game_type].get(sku.amount):
+            back = "buy" if sku is None else f"select_{sku.game_type}"
             keyboard = [[
-                InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်",
-                                     callback_data=f"select_{game_type}")
+                InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data=back)
             ]]
             await query.edit_message_text(
                 "⚠️ ဒီပမာဏအတွက် ကုတ်မရှိသေးပါ။",
                 reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-        price = db["prices"][game_type].get(amount, 0)
+        game_type, amount = sku.game_type, sku.amount
+        price = db["prices"].get(game_type, {}).get(amount, 0)
         user = get_user(uid)
         max_quantity = len(db["stock"][game_type][amount])
 
         # Store selection data for text input
-        context.user_data['selecting_quantity'] = {
+        user_state['selecting_quantity'] = {
             'game_type': game_type,
             'amount': amount,
             'price': price,
@@ -445,15 +1135,14 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
 
         keyboard = [[
-            InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်",
-                                 callback_data=f"select_{game_type}")
+            InlineKeyboardButton(
+                "↩️ နောက်သို့ပြန်ရန်",
+                callback_data=f"select_{game_type}_{sku_page(sku)}")
         ]]
 
-        game_name = get_game_display_name(game_type)
-        unit = "Coin" if "MLBB" in game_type else "UC"
         await query.edit_message_text(
-            f"🎮 {game_name}\n"
-            f"💎 {amount} {unit}\n"
+            f"🎮 {sku.name}\n"
+            f"💎 {sku.label}\n"
             f"💰 ဈေးနှုန်း: {price} MMK/ကုတ်\n"
             f"💳 လက်ကျန်ငွေ: {user['balance']} MMK\n"
             f"📦 လက်ကျန်ရှိသော ကုတ်: {max_quantity} ခု\n\n"
@@ -461,12 +1150,19 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=InlineKeyboardMarkup(keyboard))
 
     elif data.startswith("quantity_"):
-        parts = data.split("_")
-        game_type = parts[1]
-        amount = parts[2]
-        quantity = int(parts[3])
+        sku, fields = callback_sku(data, "quantity_")
+        quantity = int(fields[0])
+        if sku is None:
+            keyboard = [[
+                InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")
+            ]]
+            await query.edit_message_text(
+                "⚠️ ဒီပမာဏအတွက် ကုတ်မရှိသေးပါ။",
+                reply_markup=InlineKeyboardMarkup(keyboard))
+            return
 
-        price = db["prices"][game_type].get(amount, 0)
+        game_type, amount = sku.game_type, sku.amount
+        price = db["prices"].get(game_type, {}).get(amount, 0)
         total_price = price * quantity
         user = get_user(uid)
 
@@ -475,8 +1171,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             keyboard.append([
                 InlineKeyboardButton(
                     f"💰 လက်ကျန်ငွေဖြင့်ဝယ်ရန် ({total_price} MMK)",
-                    callback_data=f"buy_balance_{game_type}_{amount}_{quantity}"
-                )
+                    callback_data=f"buy_balance_{sku.id}_{quantity}")
             ])
         else:
             keyboard.append(
@@ -485,49 +1180,79 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([
             InlineKeyboardButton(
                 "🧾 လွှဲငွေဖြင့်ဝယ်ရန်",
-                callback_data=f"buy_receipt_{game_type}_{amount}_{quantity}")
+                callback_data=f"buy_receipt_{sku.id}_{quantity}")
         ])
         keyboard.append([
             InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်",
-                                 callback_data=f"amount_{game_type}_{amount}")
+                                 callback_data=f"amount_{sku.id}")
         ])
 
-        game_name = get_game_display_name(game_type)
-        unit = "Coin" if "MLBB" in game_type else "UC"
         await query.edit_message_text(
-            f"🎮 {game_name}\n"
-            f"💎 {amount} {unit} x {quantity}\n"
+            f"🎮 {sku.name}\n"
+            f"💎 {sku.label} x {quantity}\n"
             f"💰 စုစုပေါင်းတန်ဖိုး: {total_price} MMK\n"
             f"💳 လက်ကျန်ငွေ: {user['balance']} MMK\n\n"
             f"💳 ငွေပေးချေမှုနည်းလမ်းကိုရွေးချယ်ပါ:",
             reply_markup=InlineKeyboardMarkup(keyboard))
 
     elif data.startswith("buy_balance_"):
-        parts = data.split("_")
-        game_type = parts[2]
-        amount = parts[3]
-        quantity = int(parts[4])
+        sku, fields = callback_sku(data, "buy_balance_")
+        quantity = int(fields[0])
+        if sku is None:
+            keyboard = [[
+                InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")
+            ]]
+            await query.edit_message_text(
+                "⚠️ လုံလောက်သော ကုတ်မရှိပါ။",
+                reply_markup=InlineKeyboardMarkup(keyboard))
+            return
 
-        user = get_user(uid)
-        price = db["prices"][game_type].get(amount, 0)
-        total_price = price * quantity
+        game_type, amount = sku.game_type, sku.amount
+        game_name, unit = sku.name, sku.unit
+        with db_transaction():
+            user = get_user(uid)
+            price = db["prices"][game_type].get(amount, 0)
+            total_price = price * quantity
+
+            if user["balance"] < total_price:
+                shortfall = "balance"
+            elif len(db["stock"][game_type][amount]) < quantity:
+                shortfall = "stock"
+            else:
+                shortfall = None
+                # Get codes
+                codes = take_codes(game_type, amount, quantity)
+                metrics.inc("purchases_total", "balance")
+
+                set_balance(uid, user["balance"] - total_price)
+                add_sales_total(total_price)
+                add_history(
+                    uid,
+                    HistoryEntry(HistoryType.BALANCE,
+                                 codes=codes,
+                                 game=game_name,
+                                 amount=amount,
+                                 quantity=quantity,
+                                 total_price=total_price))
+                save_db(db)
+                sales.emit(uid, HistoryType.BALANCE, game_type, amount,
+                           quantity, total_price)
 
-        if user["balance"] < total_price:
+        if shortfall == "balance":
             keyboard = [[
                 InlineKeyboardButton("💳 ငွေဖြည့်ရန်", callback_data="topup")
             ],
                         [
                             InlineKeyboardButton(
                                 "↩️ နောက်သို့ပြန်ရန်",
-                                callback_data=
-                                f"quantity_{game_type}_{amount}_{quantity}")
+                                callback_data=f"quantity_{sku.id}_{quantity}")
                         ]]
             await query.edit_message_text(
                 "⚠️ လက်ကျန်ငွေမလုံလောက်ပါ။",
                 reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-        if len(db["stock"][game_type][amount]) < quantity:
+        if shortfall == "stock":
             keyboard = [[
                 InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")
             ]]
@@ -536,28 +1261,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-        # Get codes
-        codes = []
-        for _ in range(quantity):
-            if db["stock"][game_type][amount]:
-                codes.append(db["stock"][game_type][amount].pop(0))
-
-        user["balance"] -= total_price
-        db["sales_total"] += total_price
-        game_name = get_game_display_name(game_type)
-        unit = "Coin" if "MLBB" in game_type else "UC"
-
-        user["history"].append({
-            "type": "balance",
-            "codes": codes,
-            "game": game_name,
-            "amount": amount,
-            "quantity": quantity,
-            "total_price": total_price
-        })
-        save_db(db)
-
-        codes_text = "\n".join([f"🔑 {code}" for code in codes])
+        codes_text = codes_block(codes)
         keyboard = [[
             InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")
         ]]
@@ -569,22 +1273,32 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"🔑 ကုတ်များ:\n{codes_text}\n\n"
             f"💳 လက်ကျန်ငွေ: {user['balance']} MMK",
             reply_markup=InlineKeyboardMarkup(keyboard))
+        if not fits_inline(codes):
+            await send_codes(context.bot, uid, codes,
+                             f"{game_name} {amount} {unit} x {quantity}")
+        await send_stock_alerts(context.bot)
 
     elif data.startswith("buy_receipt_"):
-        parts = data.split("_")
-        game_type = parts[2]
-        amount = parts[3]
-        quantity = int(parts[4])
+        sku, fields = callback_sku(data, "buy_receipt_")
+        quantity = int(fields[0])
+        if sku is None:
+            keyboard = [[
+                InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="buy")
+            ]]
+            await query.edit_message_text(
+                "⚠️ ဒီပမာဏအတွက် ကုတ်မရှိသေးပါ။",
+                reply_markup=InlineKeyboardMarkup(keyboard))
+            return
 
-        context.user_data['buying_game'] = game_type
-        context.user_data['buying_amount'] = amount
-        context.user_data['buying_quantity'] = quantity
-        context.user_data['receipt_step'] = 'photo'
+        user_state['buying_game'] = sku.game_type
+        user_state['buying_amount'] = sku.amount
+        user_state['buying_quantity'] = quantity
+        user_state['receipt_step'] = 'photo'
 
         keyboard = [[
             InlineKeyboardButton(
                 "↩️ နောက်သို့ပြန်ရန်",
-                callback_data=f"quantity_{game_type}_{amount}_{quantity}")
+                callback_data=f"quantity_{sku.id}_{quantity}")
         ]]
         await query.edit_message_text(
             "🧾 လွှဲငွေဖြင့်ဝယ်ယူရန်:\n\n"
@@ -595,7 +1309,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Admin approval handlers
     elif data.startswith("message_topup_"):
-        if uid != ADMIN_ID:
+        if not is_staff(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
@@ -606,12 +1320,15 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         request = db["topup_requests"][receipt_id]
+        if not may_review(uid, request):
+            await query.edit_message_text(REASSIGNED_TEXT)
+            return
         user_id = request["user_id"]
-        context.user_data['admin_messaging'] = {'user_id': user_id}
+        user_state['admin_messaging'] = {'user_id': user_id}
         await query.edit_message_text("💬 အသုံးပြုသူထံသို့ပို့မည့်စာကို ရိုက်ထည့်ပါ:")
 
     elif data.startswith("message_") and not data.startswith("message_topup_"):
-        if uid != ADMIN_ID:
+        if not is_staff(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
@@ -622,30 +1339,49 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         receipt = db["receipts"][receipt_id]
+        if not may_review(uid, receipt):
+            await query.edit_message_text(REASSIGNED_TEXT)
+            return
         user_id = receipt["user_id"]
-        context.user_data['admin_messaging'] = {'user_id': user_id}
+        user_state['admin_messaging'] = {'user_id': user_id}
         await query.edit_message_text("💬 အသုံးပြုသူထံသို့ပို့မည့်စာကို ရိုက်ထည့်ပါ:")
 
     elif data.startswith("approve_topup_") or data.startswith("reject_topup_"):
-        if uid != ADMIN_ID:
+        if not is_staff(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
 
         action, _, receipt_id = data.split("_")
-        if receipt_id not in db["topup_requests"]:
+        with db_transaction():
+            request = db["topup_requests"].get(receipt_id)
+            allowed = request is None or may_review(uid, request)
+            done = request is not None and allowed and transition(
+                request,
+                Status.APPROVED if action == "approve" else Status.REJECTED)
+            if done:
+                user_id = request["user_id"]
+                amount = request["amount"]
+                user = get_user(user_id)
+                if action == "approve":
+                    set_balance(user_id, user["balance"] + amount)
+                    metrics.inc("topups_total", "approved")
+                request_closed("topups", receipt_id)
+                save_db(db)
+
+        if request is None:
             await query.edit_message_text("⚠️ ငွေဖြည့်တောင်းဆိုမှုကို မတွေ့ပါ။")
             return
-
-        request = db["topup_requests"][receipt_id]
-        user_id = request["user_id"]
-        amount = request["amount"]
-        user = get_user(user_id)
+        if not allowed:
+            await query.edit_message_text(REASSIGNED_TEXT)
+            return
+        if not done:
+            await query.edit_message_text(
+                f"⚠️ ငွေဖြည့်မှု {receipt_id} ကို ဆောင်ရွက်ပြီးသားဖြစ်ပါသည်။ ({request['status']})"
+            )
+            return
 
         if action == "approve":
-            user["balance"] += amount
-            request["status"] = "approved"
-            save_db(db)
             await context.bot.send_message(
                 user_id,
                 f"✅ ငွေဖြည့်မှုကို လက်ခံပြီးပါပြီ!\n💰 ငွေပမာဏ: {amount} MMK\n💳 လက်ကျန်ငွေ: {user['balance']} MMK"
@@ -653,15 +1389,13 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 f"✅ ငွေဖြည့်မှု {receipt_id} ကို လက်ခံပြီးပါပြီ")
         else:
-            request["status"] = "rejected"
-            save_db(db)
             await context.bot.send_message(user_id,
                                            "❌ ငွေဖြည့်မှုကို ငြင်းပယ်လိုက်ပါသည်။")
             await query.edit_message_text(
                 f"❌ ငွေဖြည့်မှု {receipt_id} ကို ငြင်းပယ်ပြီးပါပြီ")
 
     elif data.startswith("approve_reg_") or data.startswith("reject_reg_"):
-        if uid != ADMIN_ID:
+        if not is_staff(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
@@ -669,21 +1403,36 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         action, _, user_id = data.split("_")
         user_id = int(user_id)
 
-        if user_id not in db["pending_registrations"]:
+        with db_transaction():
+            registration = db["pending_registrations"].get(user_id)
+            allowed = registration is None or may_review(uid, registration)
+            if registration is not None and allowed:
+                del db["pending_registrations"][user_id]
+                if action == "approve":
+                    # Create approved user account
+                    if "name" in registration:
+                        name = registration["name"]
+                        username = registration["username"]
+                    else:  # requested before handles were kept
+                        name, username = registration.get("username"), None
+                    db["users"][user_id] = UserRecord(approved=True,
+                                                      name=name,
+                                                      username=username)
+                    balances.update(user_id, 0)
+                    user_search.update(user_id, name, username)
+                    record_change("user", user_id, db["users"][user_id])
+                request_closed("registrations", user_id)
+                save_db(db)
+
+        if registration is None:
             await query.edit_message_text("⚠️ အကောင့်ဝင်ရန်တောင်းဆိုမှုကို မတွေ့ပါ။"
                                           )
             return
+        if not allowed:
+            await query.edit_message_text(REASSIGNED_TEXT)
+            return
 
         if action == "approve":
-            # Create approved user account
-            db["users"][user_id] = {
-                "balance": 0,
-                "history": [],
-                "approved": True
-            }
-            del db["pending_registrations"][user_id]
-            save_db(db)
-
             await context.bot.send_message(
                 user_id,
                 "✅ အကောင့်ဝင်ရန်တောင်းဆိုမှုကို လက်ခံပြီးပါပြီ! ယခု bot ကို အသုံးပြုနိုင်ပါပြီ။"
@@ -691,86 +1440,122 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 f"✅ အသုံးပြုသူ {user_id} ၏ အကောင့်ဝင်ရန်တောင်းဆိုမှုကို လက်ခံပြီးပါပြီ")
         else:
-            del db["pending_registrations"][user_id]
-            save_db(db)
             await context.bot.send_message(
                 user_id, "❌ အကောင့်ဝင်ရန်တောင်းဆိုမှုကို ငြင်းပယ်လိုက်ပါသည်။")
             await query.edit_message_text(
                 f"❌ အသုံးပြုသူ {user_id} ၏ အကောင့်ဝင်ရန်တောင်းဆိုမှုကို ငြင်းပယ်ပြီးပါပြီ")
 
     elif data.startswith("approve_") or data.startswith("reject_"):
-        if uid != ADMIN_ID:
+        if not is_staff(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
 
         action, receipt_id = data.split("_")
-        if receipt_id not in db["receipts"]:
+        with db_transaction():
+            receipt = db["receipts"].get(receipt_id)
+            if receipt is None:
+                outcome = "missing"
+            elif not may_review(uid, receipt):
+                outcome = "reassigned"
+            elif receipt["status"] != Status.PENDING:
+                outcome = "done"
+            elif action == "approve":
+                user_id = receipt["user_id"]
+                game_type = receipt["game_type"]
+                amount = receipt["amount"]
+                quantity = receipt["quantity"]
+                if len(db["stock"][game_type].get(amount, [])) < quantity:
+                    outcome = "stock"
+                else:
+                    outcome = "approved"
+                    user = get_user(user_id)
+                    codes = take_codes(game_type, amount, quantity)
+                    metrics.inc("purchases_total", "receipt")
+
+                    total_price = db["prices"][game_type].get(amount,
+                                                              0) * quantity
+                    add_sales_total(total_price)
+                    game_name = get_game_display_name(game_type)
+                    unit = catalog.unit(game_type)
+
+                    add_history(
+                        user_id,
+                        HistoryEntry(HistoryType.RECEIPT,
+                                     codes=codes,
+                                     receipt=receipt_id,
+                                     game=game_name,
+                                     amount=amount,
+                                     quantity=quantity))
+                    transition(receipt, Status.APPROVED)
+                    request_closed("receipts", receipt_id)
+                    save_db(db)
+                    sales.emit(user_id, HistoryType.RECEIPT, game_type,
+                               amount, quantity, total_price)
+            else:
+                outcome = "rejected"
+                user_id = receipt["user_id"]
+                transition(receipt, Status.REJECTED)
+                request_closed("receipts", receipt_id)
+                save_db(db)
+
+        if outcome == "missing":
             await query.edit_message_text("⚠️ လွှဲငွေကို မတွေ့ပါ။")
             return
+        if outcome == "reassigned":
+            await query.edit_message_text(REASSIGNED_TEXT)
+            return
+        if outcome == "done":
+            await query.edit_message_text(
+                f"⚠️ လွှဲငွေ {receipt_id} ကို ဆောင်ရွက်ပြီးသားဖြစ်ပါသည်။ ({receipt['status']})"
+            )
+            return
+        if outcome == "stock":
+            await query.edit_message_text("⚠️ လုံလောက်သော ကုတ်မရှိပါ။")
+            return
 
-        receipt = db["receipts"][receipt_id]
-        user_id = receipt["user_id"]
-        game_type = receipt["game_type"]
-        amount = receipt["amount"]
-        quantity = receipt["quantity"]
-        user = get_user(user_id)
-
-        if action == "approve":
-            if len(db["stock"][game_type].get(amount, [])) < quantity:
-                await query.edit_message_text("⚠️ လုံလောက်သော ကုတ်မရှိပါ။")
-                return
-
-            codes = []
-            for _ in range(quantity):
-                if db["stock"][game_type][amount]:
-                    codes.append(db["stock"][game_type][amount].pop(0))
-
-            total_price = db["prices"][game_type].get(amount, 0) * quantity
-            db["sales_total"] += total_price
-            game_name = get_game_display_name(game_type)
-            unit = "Coin" if "MLBB" in game_type else "UC"
-
-            user["history"].append({
-                "type": "receipt",
-                "codes": codes,
-                "receipt": receipt_id,
-                "game": game_name,
-                "amount": amount,
-                "quantity": quantity
-            })
-            receipt["status"] = "approved"
-            save_db(db)
-
-            codes_text = "\n".join([f"🔑 {code}" for code in codes])
+        if outcome == "approved":
+            codes_text = codes_block(codes)
             await context.bot.send_message(
                 user_id, f"✅ လွှဲငွေဖြင့်ဝယ်ယူမှုကို လက်ခံပြီးပါပြီ!\n\n"
                 f"🎮 {game_name}\n"
                 f"💎 {amount} {unit} x {quantity}\n\n"
                 f"🔑 ကုတ်များ:\n{codes_text}")
+            if not fits_inline(codes):
+                await send_codes(context.bot, user_id, codes,
+                                 f"{game_name} {amount} {unit} x {quantity}")
             await query.edit_message_text(f"✅ လွှဲငွေ {receipt_id} ကို လက်ခံပြီးပါပြီ")
+            await send_stock_alerts(context.bot)
         else:
-            receipt["status"] = "rejected"
-            save_db(db)
             await context.bot.send_message(
                 user_id, "❌ လွှဲငွေဖြင့်ဝယ်ယူမှုကို ငြင်းပယ်လိုက်ပါသည်။")
             await query.edit_message_text(f"❌ လွှဲငွေ {receipt_id} ကို ငြင်းပယ်ပြီးပါပြီ")
 
     # Admin addstock interactive handlers
+    elif data.startswith("games_addstock_"):
+        if not is_admin(uid):
+            await query.edit_message_text(
+                "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
+            return
+
+        text, keyboard = game_menu("addstock", int(data.rsplit("_", 1)[1]))
+        await query.edit_message_text(
+            text, reply_markup=InlineKeyboardMarkup(keyboard))
+
     elif data.startswith("addstock_"):
-        if uid != ADMIN_ID:
+        if not is_admin(uid):
             await query.edit_message_text(
                 "⚠️ Admin များသာ ဤလုပ်ဆောင်ချက်ကို အသုံးပြုနိုင်ပါသည်။")
             return
 
         game_type = data.split("_")[1]
-        context.user_data['addstock_game'] = game_type
+        user_state['addstock_game'] = game_type
 
         keyboard = [[
             InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်", callback_data="start")
         ]]
         game_name = get_game_display_name(game_type)
-        unit = "Coin" if "MLBB" in game_type else "UC"
+        unit = catalog.unit(game_type)
         await query.edit_message_text(
             f"🎮 {game_name} အတွက် ကုတ်ထည့်ရန်:\n\n"
             f"📝 ပုံစံ: <amount> <price> <code1> <code2> ...\n"
@@ -783,14 +1568,14 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.message.from_user.id
     user = get_user(uid)
+    user_state = conversations.for_user(uid)
 
     # Handle photos
     if update.message.photo:
         # Handle topup photos
-        if 'topup_method' in context.user_data:
-            context.user_data['topup_photo_sent'] = True
-            context.user_data[
-                'topup_photo_message_id'] = update.message.message_id
+        if 'topup_method' in user_state:
+            user_state['topup_photo_sent'] = True
+            user_state['topup_photo_message_id'] = update.message.message_id
 
             await update.message.reply_text(
                 "🧾 လွှဲငွေ screenshot လက်ခံရရှိပါသည်။ ကျေးဇူးပြု၍ အောက်ပါအချက်အလက်များကို ပို့ပေးပါ:\n\n"
@@ -800,12 +1585,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Handle receipt purchase photos
-        elif 'buying_game' in context.user_data and context.user_data.get(
+        elif 'buying_game' in user_state and user_state.get(
                 'receipt_step') == 'photo':
-            context.user_data['receipt_photo_sent'] = True
-            context.user_data[
-                'receipt_photo_message_id'] = update.message.message_id
-            context.user_data['receipt_step'] = 'id'
+            user_state['receipt_photo_sent'] = True
+            user_state['receipt_photo_message_id'] = update.message.message_id
+            user_state['receipt_step'] = 'id'
 
             await update.message.reply_text(
                 "🧾 လွှဲငွေ screenshot လက်ခံရရှိပါသည်။ ယခု လွှဲငွေ ID (နောက်ဆုံး ၅လုံး သို့မဟုတ် ၆လုံး) ကို ပို့ပေးပါ:\n\n"
@@ -818,20 +1602,20 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text = update.message.text.strip()
 
         # Handle admin message sending
-        if uid == ADMIN_ID and 'admin_messaging' in context.user_data:
-            target_user = context.user_data['admin_messaging']['user_id']
+        if is_staff(uid) and 'admin_messaging' in user_state:
+            target_user = user_state['admin_messaging']['user_id']
             await context.bot.send_message(target_user,
                                            f"📬 Admin ထံမှ စာ:\n{text}")
             await update.message.reply_text(
                 f"✅ အသုံးပြုသူ {target_user} ထံသို့ စာပို့ပြီးပါပြီ")
-            del context.user_data['admin_messaging']
+            del user_state['admin_messaging']
             return
 
         # Handle quantity selection
-        if 'selecting_quantity' in context.user_data:
+        if 'selecting_quantity' in user_state:
             try:
                 quantity = int(text)
-                selection = context.user_data['selecting_quantity']
+                selection = user_state['selecting_quantity']
 
                 if quantity < 1 or quantity > selection['max_quantity']:
                     await update.message.reply_text(
@@ -841,6 +1625,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
                 game_type = selection['game_type']
                 amount = selection['amount']
+                sku = catalog.sku(game_type, amount)
                 price = selection['price']
                 total_price = price * quantity
                 user = get_user(uid)
@@ -850,8 +1635,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     keyboard.append([
                         InlineKeyboardButton(
                             f"💰 လက်ကျန်ငွေဖြင့်ဝယ်ရန် ({total_price} MMK)",
-                            callback_data=
-                            f"buy_balance_{game_type}_{amount}_{quantity}")
+                            callback_data=f"buy_balance_{sku.id}_{quantity}")
                     ])
                 else:
                     keyboard.append([
@@ -862,32 +1646,28 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 keyboard.append([
                     InlineKeyboardButton(
                         "🧾 လွှဲငွေဖြင့်ဝယ်ရန်",
-                        callback_data=
-                        f"buy_receipt_{game_type}_{amount}_{quantity}")
+                        callback_data=f"buy_receipt_{sku.id}_{quantity}")
                 ])
                 keyboard.append([
-                    InlineKeyboardButton(
-                        "↩️ နောက်သို့ပြန်ရန်",
-                        callback_data=f"amount_{game_type}_{amount}")
+                    InlineKeyboardButton("↩️ နောက်သို့ပြန်ရန်",
+                                         callback_data=f"amount_{sku.id}")
                 ])
 
-                game_name = get_game_display_name(game_type)
-                unit = "Coin" if "MLBB" in game_type else "UC"
                 await update.message.reply_text(
-                    f"🎮 {game_name}\n"
-                    f"💎 {amount} {unit} x {quantity}\n"
+                    f"🎮 {sku.name}\n"
+                    f"💎 {sku.label} x {quantity}\n"
                     f"💰 စုစုပေါင်းတန်ဖိုး: {total_price} MMK\n"
                     f"💳 လက်ကျန်ငွေ: {user['balance']} MMK\n\n"
                     f"💳 ငွေပေးချေမှုနည်းလမ်းကိုရွေးချယ်ပါ:",
                     reply_markup=InlineKeyboardMarkup(keyboard))
-                del context.user_data['selecting_quantity']
+                del user_state['selecting_quantity']
                 return
             except ValueError:
                 await update.message.reply_text("⚠️ ကျေးဇူးပြု၍ ကိန်းဂဏန်းသာ ရိုက်ထည့်ပါ။")
                 return
 
         # Handle admin addstock
-        if uid == ADMIN_ID and 'addstock_game' in context.user_data:
+        if is_admin(uid) and 'addstock_game' in user_state:
             try:
                 parts = text.split()
                 if len(parts) < 3:
@@ -895,32 +1675,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         "⚠️ အသုံးပြုနည်း: <amount> <price> <code1>")
                     return
 
-                game_type = context.user_data['addstock_game']
+                game_type = user_state['addstock_game']
                 amount = parts[0]
                 price = int(parts[1])
                 codes = parts[2:]
 
-                # Update stock
-                if game_type not in db["stock"]:
-                    db["stock"][game_type] = {}
-                if amount not in db["stock"][game_type]:
-                    db["stock"][game_type][amount] = []
-                db["stock"][game_type][amount].extend(codes)
-
-                # Update price
-                if game_type not in db["prices"]:
-                    db["prices"][game_type] = {}
-                db["prices"][game_type][amount] = price
-
-                save_db(db)
+                # Update stock and price
+                with db_transaction():
+                    add_codes(game_type, amount, codes)
+                    set_price(game_type, amount, price)
+                    save_db(db)
 
                 game_name = get_game_display_name(game_type)
-                unit = "Coin" if "MLBB" in game_type else "UC"
+                unit = catalog.unit(game_type)
                 await update.message.reply_text(
                     f"✅ {game_name} {amount} {unit}\n"
                     f"💰 ဈေးနှုန်း: {price} MMK\n"
                     f"📦 ကုတ်: {len(codes)} ခု ထည့်ပြီးပါပြီ")
-                del context.user_data['addstock_game']
+                del user_state['addstock_game']
                 return
             except ValueError:
                 await update.message.reply_text("⚠️ ဈေးနှုန်းသည် မှားယွင်းနေပါသည်။")
@@ -930,7 +1702,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
 
         # Handle topup with receipt ID and amount
-        if context.user_data.get('topup_photo_sent'):
+        if user_state.get('topup_photo_sent'):
             try:
                 parts = text.split()
                 if len(parts) != 2:
@@ -952,49 +1724,26 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     )
                     return
 
-                payment_method = context.user_data['topup_method']
-                photo_message_id = context.user_data['topup_photo_message_id']
+                payment_method = user_state['topup_method']
+                photo_message_id = user_state['topup_photo_message_id']
 
-                db["topup_requests"][receipt_id] = {
-                    "user_id": uid,
-                    "status": "pending",
-                    "amount": amount,
-                    "payment_method": payment_method
-                }
-                save_db(db)
+                with db_transaction():
+                    db["topup_requests"][receipt_id] = TopupRequest(
+                        uid,
+                        amount=amount,
+                        payment_method=payment_method,
+                        photo=photo_message_id)
+                    request_opened("topups", receipt_id)
+                    save_db(db)
 
-                keyboard = [[
-                    InlineKeyboardButton(
-                        "✅ လက်ခံရန်",
-                        callback_data=f"approve_topup_{receipt_id}"),
-                    InlineKeyboardButton(
-                        "💬 စာပို့ရန်",
-                        callback_data=f"message_topup_{receipt_id}"),
-                    InlineKeyboardButton(
-                        "❌ ငြင်းပယ်ရန်",
-                        callback_data=f"reject_topup_{receipt_id}")
-                ]]
-
-                await context.bot.forward_message(
-                    chat_id=ADMIN_ID,
-                    from_chat_id=update.message.chat.id,
-                    message_id=photo_message_id)
-
-                await context.bot.send_message(
-                    chat_id=ADMIN_ID,
-                    text=f"📬 ငွေဖြည့်တောင်းဆိုမှုအသစ်:\n"
-                    f"👤 အသုံးပြုသူ: {uid}\n"
-                    f"💳 နည်းလမ်း: {payment_method}\n"
-                    f"🧾 လွှဲငွေ ID: {receipt_id}\n"
-                    f"💰 ငွေပမာဏ: {amount} MMK",
-                    reply_markup=InlineKeyboardMarkup(keyboard))
+                await notify_reviewer(context.bot, "topups", receipt_id)
 
                 await update.message.reply_text("⏳ Admin မှ စစ်ဆေးနေပါသည်...")
 
                 # Clear user data
-                del context.user_data['topup_method']
-                del context.user_data['topup_photo_sent']
-                del context.user_data['topup_photo_message_id']
+                del user_state['topup_method']
+                del user_state['topup_photo_sent']
+                del user_state['topup_photo_message_id']
                 return
             except ValueError:
                 await update.message.reply_text("⚠️ ငွေပမာဏသည် မှားယွင်းနေပါသည်။")
@@ -1004,74 +1753,52 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
 
         # Handle receipt purchase with receipt ID
-        if 'buying_game' in context.user_data and context.user_data.get(
+        if 'buying_game' in user_state and user_state.get(
                 'receipt_step') == 'id':
             if not validate_receipt_id(text):
                 await update.message.reply_text(
                     "⚠️ လွှဲငွေ ID သည် ၅လုံး သို့မဟုတ် ၆လုံး ကိန်းဂဏန်းဖြစ်ရပါမည်။")
                 return
 
-            game_type = context.user_data['buying_game']
-            amount = context.user_data['buying_amount']
-            quantity = context.user_data['buying_quantity']
-            photo_message_id = context.user_data['receipt_photo_message_id']
-
-            db["receipts"][text] = {
-                "user_id": uid,
-                "status": "pending",
-                "game_type": game_type,
-                "amount": amount,
-                "quantity": quantity
-            }
-            save_db(db)
-
-            game_name = get_game_display_name(game_type)
-            unit = "Coin" if "MLBB" in game_type else "UC"
-            keyboard = [[
-                InlineKeyboardButton("✅ လက်ခံရန်",
-                                     callback_data=f"approve_{text}"),
-                InlineKeyboardButton("💬 စာပို့ရန်",
-                                     callback_data=f"message_{text}"),
-                InlineKeyboardButton("❌ ငြင်းပယ်ရန်",
-                                     callback_data=f"reject_{text}")
-            ]]
-
-            await context.bot.forward_message(
-                chat_id=ADMIN_ID,
-                from_chat_id=update.message.chat.id,
-                message_id=photo_message_id)
+            game_type = user_state['buying_game']
+            amount = user_state['buying_amount']
+            quantity = user_state['buying_quantity']
+            photo_message_id = user_state['receipt_photo_message_id']
+
+            with db_transaction():
+                db["receipts"][text] = Receipt(uid,
+                                               game_type=game_type,
+                                               amount=amount,
+                                               quantity=quantity,
+                                               photo=photo_message_id)
+                request_opened("receipts", text)
+                save_db(db)
 
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=f"📬 ကုတ်ဝယ်ယူမှု:\n"
-                f"👤 အသုံးပြုသူ: {uid}\n"
-                f"🎮 ဂိမ်း: {game_name}\n"
-                f"💎 {amount} {unit} x {quantity}\n"
-                f"🧾 လွှဲငွေ ID: {text}",
-                reply_markup=InlineKeyboardMarkup(keyboard))
+            await notify_reviewer(context.bot, "receipts", text)
             await update.message.reply_text("⏳ Admin မှ စစ်ဆေးနေပါသည်...")
 
             # Clear user data
-            del context.user_data['buying_game']
-            del context.user_data['buying_amount']
-            del context.user_data['buying_quantity']
-            del context.user_data['receipt_photo_sent']
-            del context.user_data['receipt_photo_message_id']
-            del context.user_data['receipt_step']
+            del user_state['buying_game']
+            del user_state['buying_amount']
+            del user_state['buying_quantity']
+            del user_state['receipt_photo_sent']
+            del user_state['receipt_photo_message_id']
+            del user_state['receipt_step']
             return
 
 
 # ---------------- Admin Commands ----------------
 async def setbalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
     try:
         args = context.args
         uid = int(args[0])
         amount = int(args[1])
-        user = get_user(uid)
-        user["balance"] = amount
-        save_db(db)
+        with db_transaction():
+            get_user(uid)
+            set_balance(uid, amount)
+            save_db(db)
         await update.message.reply_text(
             f"✅ အသုံးပြုသူ {uid} ၏ လက်ကျန်ငွေကို {amount} MMK သို့ပြောင်းပြီးပါပြီ")
     except:
@@ -1080,34 +1807,22 @@ async def setbalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def addstock(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
 
     # Interactive version
-    keyboard = [[
-        InlineKeyboardButton("🎮 Mobile Legends (Bal)",
-                             callback_data="addstock_MLBBbal")
-    ],
-                [
-                    InlineKeyboardButton("🎮 Mobile Legends (PH)",
-                                         callback_data="addstock_MLBBph")
-                ],
-                [
-                    InlineKeyboardButton("🎮 PUPG Mobile",
-                                         callback_data="addstock_PUPG")
-                ]]
+    text, keyboard = game_menu("addstock")
     await update.message.reply_text(
-        "🎮 ဂိမ်းအမျိုးအစားရွေးချယ်ပါ:",
-        reply_markup=InlineKeyboardMarkup(keyboard))
+        text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 
 async def delstock(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
 
     if len(context.args) < 3:
         await update.message.reply_text(
-            "အသုံးပြုနည်း: /delstock <MLBBbal/MLBBph/PUPG> <amount> <code>")
+            "အသုံးပြုနည်း: /delstock <game> <amount> <code>")
         return
 
     try:
@@ -1115,22 +1830,26 @@ async def delstock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = context.args[1]
         code_to_delete = context.args[2]
 
-        if game_type not in ["MLBBbal", "MLBBph", "PUPG"]:
+        if game_type not in catalog.game_types():
             await update.message.reply_text(
-                "ဂိမ်းအမျိုးအစား: MLBBbal, MLBBph, သို့မဟုတ် PUPG")
+                f"ဂိမ်းအမျိုးအစား: {', '.join(catalog.game_types())}")
             return
 
-        if game_type not in db["stock"] or amount not in db["stock"][game_type]:
+        with db_transaction():
+            known = amount in db["stock"].get(game_type, {})
+            removed = known and remove_code(game_type, amount, code_to_delete)
+            if removed:
+                save_db(db)
+
+        if not known:
             await update.message.reply_text(
                 "⚠️ ဒီဂိမ်းအမျိုးအစား သို့မဟုတ် ပမာဏ မရှိပါ။")
             return
 
-        if code_to_delete in db["stock"][game_type][amount]:
-            db["stock"][game_type][amount].remove(code_to_delete)
-            save_db(db)
+        if removed:
 
             game_name = get_game_display_name(game_type)
-            unit = "Coin" if "MLBB" in game_type else "UC"
+            unit = catalog.unit(game_type)
             await update.message.reply_text(
                 f"✅ {game_name} {amount} {unit} မှ ကုတ် {code_to_delete} ကို ဖျက်ပြီးပါပြီ"
             )
@@ -1138,15 +1857,15 @@ async def delstock(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⚠️ ဒီကုတ်ကို မတွေ့ပါ။")
     except:
         await update.message.reply_text(
-            "အသုံးပြုနည်း: /delstock <MLBBbal/MLBBph/PUPG> <amount> <code>")
+            "အသုံးပြုနည်း: /delstock <game> <amount> <code>")
 
 
 async def setprice(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
     if len(context.args) < 3:
         await update.message.reply_text(
-            "အသုံးပြုနည်း: /setprice <MLBBbal/MLBBph/PUPG> <amount> <price>")
+            "အသုံးပြုနည်း: /setprice <game> <amount> <price>")
         return
 
     try:
@@ -1154,29 +1873,79 @@ async def setprice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = context.args[1]
         price = int(context.args[2])
 
-        if game_type not in ["MLBBbal", "MLBBph", "PUPG"]:
+        if game_type not in catalog.game_types():
             await update.message.reply_text(
-                "ဂိမ်းအမျိုးအစား: MLBBbal, MLBBph, သို့မဟုတ် PUPG")
+                f"ဂိမ်းအမျိုးအစား: {', '.join(catalog.game_types())}")
             return
 
-        if game_type not in db["prices"]:
-            db["prices"][game_type] = {}
+        with db_transaction():
+            set_price(game_type, amount, price)
+            save_db(db)
 
-        db["prices"][game_type][amount] = price
+        game_name = get_game_display_name(game_type)
+        unit = catalog.unit(game_type)
+        await update.message.reply_text(
+            f"✅ {game_name} {amount} {unit} ၏ ဈေးနှုန်းကို {price} MMK အဖြစ်သတ်မှတ်ပြီးပါပြီ"
+        )
+    except:
+        await update.message.reply_text(
+            "အသုံးပြုနည်း: /setprice <game> <amount> <price>")
+
+
+async def addgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    args = context.args
+    if len(args) < 3 or not valid_game_type(args[0]):
+        await update.message.reply_text(
+            "အသုံးပြုနည်း: /addgame <game> <unit> <name>\n"
+            "(game: စာလုံး/ဂဏန်း ၁၆ လုံးအထိ)")
+        return
+
+    game_type, unit, name = args[0], args[1], " ".join(args[2:])
+    with db_transaction():
+        catalog.set_game(game_type, name, unit)
+        record_change("section", "catalog", db["catalog"])
         save_db(db)
+    await update.message.reply_text(
+        f"✅ 🎮 {name} ({game_type}, {unit}) ကို သိမ်းဆည်းပြီးပါပြီ")
+
+
+async def setalert(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    try:
+        game_type = context.args[0]
+        amount = context.args[1]
+        threshold = int(context.args[2])
+
+        if game_type not in catalog.game_types():
+            await update.message.reply_text(
+                f"ဂိမ်းအမျိုးအစား: {', '.join(catalog.game_types())}")
+            return
+
+        with db_transaction():
+            db["alert_thresholds"].setdefault(game_type, {})[amount] = threshold
+            record_change("section", "alert_thresholds",
+                           db["alert_thresholds"])
+            forecast.restocked(
+                game_type, amount,
+                len(db["stock"].get(game_type, {}).get(amount, [])))
+            forecast_changed(game_type, amount)
+            save_db(db)
 
         game_name = get_game_display_name(game_type)
-        unit = "Coin" if "MLBB" in game_type else "UC"
+        unit = catalog.unit(game_type)
         await update.message.reply_text(
-            f"✅ {game_name} {amount} {unit} ၏ ဈေးနှုန်းကို {price} MMK အဖြစ်သတ်မှတ်ပြီးပါပြီ"
+            f"✅ {game_name} {amount} {unit} ကုတ် {threshold} ခုအောက်ရောက်လျှင် သတိပေးပါမည်"
         )
     except:
         await update.message.reply_text(
-            "အသုံးပြုနည်း: /setprice <MLBBbal/MLBBph/PUPG> <amount> <price>")
+            "အသုံးပြုနည်း: /setalert <game> <amount> <count>")
 
 
 async def setpayment(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
     try:
         method = context.args[0].title()
@@ -1188,8 +1957,10 @@ async def setpayment(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "ငွေပေးချေမှုနည်းလမ်း: Wave သို့မဟုတ် KPay")
             return
 
-        db["payment"][method] = {"phone": phone, "name": name}
-        save_db(db)
+        with db_transaction():
+            db["payment"][method] = {"phone": phone, "name": name}
+            record_change("section", "payment", db["payment"])
+            save_db(db)
         await update.message.reply_text(
             f"✅ {method} ပေးချေမှုအချက်အလက်ကို ပြင်ဆင်ပြီးပါပြီ\n📱 ဖုန်း: {phone}\n👤 အမည်: {name}"
         )
@@ -1199,7 +1970,7 @@ async def setpayment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def viewhistory(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return
     try:
         uid = int(context.args[0])
@@ -1219,17 +1990,247 @@ async def viewhistory(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("အသုံးပြုနည်း: /viewhistory <user_id>")
 
 
-async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def finduser(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    if not context.args:
+        await update.message.reply_text(
+            "အသုံးပြုနည်း: /finduser <id/name/username>")
+        return
+    prefix = " ".join(context.args)
+    uids = user_search.search(prefix, limit=21)
+    if not uids:
+        await update.message.reply_text(f"🔍 '{prefix}' နှင့် ကိုက်ညီသူ မရှိပါ။")
+        return
+
+    lines = [f"🔍 '{prefix}' ရလဒ်များ:"]
+    for uid in uids[:20]:
+        user = db["users"][uid]
+        username = f" @{user['username']}" if "username" in user else ""
+        lines.append(f"• {uid} {user.get('name', '')}{username} — "
+                     f"{user['balance']:,} MMK, အော်ဒါ {len(user['history'])}")
+    if len(uids) > 20:
+        lines.append("… ပိုမိုတိကျသော စာလုံးဖြင့် ရှာပါ။")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def staff(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return
+    args = context.args
+    try:
+        if not args:
+            lines = ["👥 ဝန်ထမ်းများ:"]
+            for uid, member in review.members():
+                status = "🟢" if member["online"] else "🔴"
+                lines.append(f"{status} {uid} {member['role']} — "
+                             f"စောင့်ဆိုင်းဆဲ {review.outstanding(uid)}")
+            await update.message.reply_text("\n".join(lines))
+            return
+
+        uid = int(args[1])
+        moved = []
+        if args[0] == "add" and args[2] in ROLES and uid != ADMIN_ID:
+            with db_transaction():
+                member = review.member(uid) or {"online": True}
+                set_staff(uid, dict(member, role=args[2]))
+                save_db(db)
+        elif args[0] == "remove" and uid != ADMIN_ID:
+            with db_transaction():
+                set_staff(uid, None)
+                moved = [(name, rid) for name, rid in review.assigned_to(uid)
+                         if reassign(name, rid, uid)]
+                save_db(db)
+        else:
+            raise ValueError(args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "အသုံးပြုနည်း: /staff [add <user_id> <admin/reviewer> | "
+            "remove <user_id>]")
+        return
+
+    for name, rid in moved:
+        await notify_reviewer(context.bot, name, rid, REASSIGNED_NOTE)
+    await update.message.reply_text(
+        f"✅ ဝန်ထမ်းစာရင်း ပြင်ဆင်ပြီးပါပြီ (လွှဲပြောင်း {len(moved)} ခု)")
+
+
+async def set_availability(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                           online):
+    uid = update.effective_user.id
+    if not is_staff(uid):
+        return
+    with db_transaction():
+        set_staff(uid, dict(review.member(uid), online=online))
+        moved = [] if online else [
+            (name, rid) for name, rid in review.assigned_to(uid)
+            if reassign(name, rid, uid)
+        ]
+        save_db(db)
+
+    for name, rid in moved:
+        await notify_reviewer(context.bot, name, rid, REASSIGNED_NOTE)
+    if online:
+        await update.message.reply_text("🟢 တောင်းဆိုမှုအသစ်များ လက်ခံနေပါပြီ။")
+    else:
+        await update.message.reply_text(
+            f"🔴 တောင်းဆိုမှုအသစ်များ မပို့တော့ပါ။ (လွှဲပြောင်း {len(moved)} ခု)")
+
+
+async def online(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await set_availability(update, context, True)
+
+
+async def offline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await set_availability(update, context, False)
+
+
+async def redeliver(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    try:
+        uid = int(context.args[0])
+        count = int(context.args[1]) if len(context.args) > 1 else 1
+        orders = [h for h in get_user(uid)["history"] if h["codes"]][-count:]
+        if not orders:
+            await update.message.reply_text(
+                f"အသုံးပြုသူ {uid} ၏ မှတ်တမ်းမရှိပါ")
+            return
+
+        sent = 0
+        for order in orders:
+            title = (f"{order.get('game', '')} {order.get('amount', '')} "
+                     f"x {order.get('quantity', '')}")
+            if await send_codes(context.bot, uid, order["codes"], title):
+                sent += 1
+        await update.message.reply_text(
+            f"✅ အသုံးပြုသူ {uid} ထံ အော်ဒါ {sent}/{len(orders)} ခု ပြန်ပို့ပြီးပါပြီ")
+    except:
+        await update.message.reply_text(
+            "အသုံးပြုနည်း: /redeliver <user_id> [orders]")
+
+
+broadcast_task = None
+
+
+async def run_broadcast(app: Application, job: Broadcast):
+    global broadcast_task
+    try:
+        await job.run(app.bot, approved_users, BROADCAST_RATE,
+                      BROADCAST_CONCURRENCY,
+                      lambda: app.update_queue.qsize() > 0)
+    finally:
+        broadcast_task = None
+    await app.bot.send_message(
+        ADMIN_ID, f"📣 ကြေညာချက် ပို့ပြီးပါပြီ\n"
+        f"✅ ရောက်ရှိ: {job.delivered}\n"
+        f"🚫 Block ထားသူ: {job.blocked}\n"
+        f"⚠️ မအောင်မြင်: {job.failed}")
+
+
+def start_broadcast(app: Application, job: Broadcast):
+    global broadcast_task
+    broadcast_task = app.create_task(run_broadcast(app, job))
+    broadcast_task.job = job
+
+
+async def resume_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    job = Broadcast.load(BROADCAST_FILE)
+    if job and broadcast_task is None:
+        start_broadcast(context.application, job)
+
+
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    parts = update.message.text.split(None, 1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+
+    if text == "stop" and broadcast_task:
+        job = broadcast_task.job
+        broadcast_task.cancel()
+        job.finish()
+        await update.message.reply_text(
+            f"⏹ ကြေညာချက်ကို ရပ်လိုက်ပါပြီ ({job.delivered} ဦး ရောက်ရှိပြီး)")
+        return
+    if broadcast_task:
+        job = broadcast_task.job
+        await update.message.reply_text(
+            f"📣 ကြေညာချက် ပို့နေဆဲဖြစ်ပါသည်\n"
+            f"✅ {job.delivered} / 🚫 {job.blocked} / ⚠️ {job.failed}\n"
+            f"ရပ်ရန်: /broadcast stop")
+        return
+    if not text or text == "stop":
+        await update.message.reply_text("အသုံးပြုနည်း: /broadcast <message>")
+        return
+
+    job = Broadcast(BROADCAST_FILE, text)
+    job.checkpoint()
+    start_broadcast(context.application, job)
+    await update.message.reply_text(
+        "📣 အတည်ပြုထားသော အသုံးပြုသူအားလုံးထံ ကြေညာချက် ပို့နေပါပြီ")
+
+
+async def restore(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Dry run only: validate a snapshot and compare it with the live db"""
+    if not is_admin(update.effective_user.id):
+        return
+    if not context.args:
+        names = await asyncio.to_thread(backups.list)
+        if not names:
+            await update.message.reply_text("💾 Backup မရှိသေးပါ။")
+            return
+        await update.message.reply_text(
+            "💾 Backup များ (နောက်ဆုံး ၁၀ ခု):\n" +
+            "\n".join(names[:10]) + "\n\nစစ်ဆေးရန်: /restore <name>")
+        return
+
+    name = context.args[0]
+    try:
+        problems, summary = validate(await asyncio.to_thread(
+            backups.load, name))
+    except FileNotFoundError:
+        await update.message.reply_text(f"⚠️ {name} ကို မတွေ့ပါ။")
+        return
+    except (OSError, ValueError, KeyError, tarfile.TarError) as e:
+        await update.message.reply_text(f"❌ {name} ကို ဖတ်၍မရပါ: {e}")
+        return
+
+    live = {
+        "users": len(db["users"]),
+        "balance": sum(u["balance"] for u in db["users"].values()),
+        "codes": sum(
+            len(codes) for amounts in db["stock"].values()
+            for codes in amounts.values()),
+        "receipts": len(db["receipts"]),
+        "topups": len(db["topup_requests"]),
+        "sales_total": db["sales_total"],
+    }
+    lines = [f"🔍 {name} (dry run)"]
+    lines += [f"• {key}: {summary.get(key)} (ယခု {live[key]})" for key in live]
+    if problems:
+        lines.append("\n❌ ပြဿနာများ:")
+        lines += [f"• {problem}" for problem in problems]
+    elif name.endswith(".json.gz"):
+        lines.append("\n✅ အသုံးပြုနိုင်ပါသည်။ ပြန်ထားရန် bot ကိုရပ်ပြီး "
+                     f"{DB_DIR} ကို ဖယ်ရှား၊ {BACKUP_DIR}/{name} ကို ဖြည်၍ "
+                     f"{DB_FILE} နေရာတွင် ထားပါ။")
+    else:
+        lines.append("\n✅ အသုံးပြုနိုင်ပါသည်။ ပြန်ထားရန် bot ကိုရပ်ပြီး "
+                     f"{DB_DIR} ကို ရှင်းလင်းကာ tar -xzf {BACKUP_DIR}/{name} "
+                     f"-C {DB_DIR} ဖြင့် ဖြည်ပါ။")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
 
     # Calculate stock counts
-    mlbbbal_count = sum(
-        len(codes) for codes in db["stock"].get("MLBBbal", {}).values())
-    mlbbph_count = sum(
-        len(codes) for codes in db["stock"].get("MLBBph", {}).values())
-    pupg_count = sum(
-        len(codes) for codes in db["stock"].get("PUPG", {}).values())
+    stock_lines = "\n".join(
+        f"🎮 {catalog.display_name(game_type)} ကုတ်: "
+        f"{sum(len(codes) for codes in db['stock'][game_type].values())}"
+        for game_type in catalog.game_types() if game_type in db["stock"])
 
     # Calculate total orders
     total_orders = 0
@@ -1242,9 +2243,11 @@ async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Calculate pending counts (only pending status)
     pending_receipts = len(
-        [r for r in db["receipts"].values() if r["status"] == "pending"])
-    pending_topups = len(
-        [r for r in db["topup_requests"].values() if r["status"] == "pending"])
+        [r for r in db["receipts"].values() if r["status"] == Status.PENDING])
+    pending_topups = len([
+        r for r in db["topup_requests"].values()
+        if r["status"] == Status.PENDING
+    ])
     pending_registrations = len(db.get("pending_registrations", {}))
 
     help_text = f"""
@@ -1252,16 +2255,25 @@ async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 /setbalance <user_id> <amount> - အသုံးပြုသူငွေစစ်ရန်
 /addstock - ကုတ်များထည့်ရန် (အပြန်အလှန်)
-/delstock <MLBBbal/MLBBph/PUPG> <amount> <code> - ကုတ်ဖျက်ရန်
-/setprice <MLBBbal/MLBBph/PUPG> <amount> <price> - ဈေးနှုန်းသတ်မှတ်ရန်
+/delstock <game> <amount> <code> - ကုတ်ဖျက်ရန်
+/setprice <game> <amount> <price> - ဈေးနှုန်းသတ်မှတ်ရန်
 /setpayment <Wave/Kpay> <phone> <name> - ပေးချေမှုအချက်အလက်ပြင်ရန်
+/setalert <game> <amount> <count> - ကုတ်နည်းသတိပေးချက်သတ်မှတ်ရန်
+/addgame <game> <unit> <name> - ဂိမ်းအသစ်ထည့်ရန်/အမည်ပြင်ရန်
 /viewhistory <user_id> - အသုံးပြုသူမှတ်တမ်းကြည့်ရန်
+/finduser <id/name/username> - အသုံးပြုသူရှာရန်
+/staff [add <user_id> <admin/reviewer> | remove <user_id>] - ဝန်ထမ်းစာရင်း
+/online, /offline - တောင်းဆိုမှုအသစ် လက်ခံရန်/ရပ်ရန်
+/redeliver <user_id> [orders] - နောက်ဆုံးအော်ဒါ၏ကုတ်များ ပြန်ပို့ရန်
+/broadcast <message> - အသုံးပြုသူအားလုံးထံ ကြေညာချက်ပို့ရန်
+/restore [name] - Backup များကြည့်ရန်/စစ်ဆေးရန် (dry run)
+/perf - စွမ်းဆောင်ရည်စာရင်းကြည့်ရန်
+/stats [15m/6h/7d] - အရောင်းစာရင်းကြည့်ရန်
+/memstats [types | trace start/stop | every <minutes>] - Memory သုံးစွဲမှုကြည့်ရန်
 /admhelp - ဤအကူအညီစာကိုပြရန်
 
 📊 အချက်အလက်အကျဉ်းချုပ်:
-🎮 MLBB Bal ကုတ်: {mlbbbal_count}
-🎮 MLBB PH ကုတ်: {mlbbph_count}
-🎮 PUPG ကုတ်: {pupg_count}
+{stock_lines}
 👥 အသုံးပြုသူ: {len(db["users"])}
 📦 အော်ဒါစုစုပေါင်း: {total_orders}
 💰 အသုံးပြုသူငွေစုစုပေါင်း: {total_user_balance:,} MMK
@@ -1274,6 +2286,7 @@ async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /setprice MLBBbal 1000 2500
 /setprice PUPG 60 1500
 /delstock MLBBbal 1000 CODE123
+/addgame FF Diamond Free Fire
 /setpayment Kpay 09123456789 John Doe
 
 🛠️ နောက်ထပ်ကုဒ်များ:
@@ -1285,21 +2298,377 @@ async def admhelp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(help_text)
 
 
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    if not metrics.enabled:
+        await update.message.reply_text(
+            "📈 Metrics ပိတ်ထားပါသည်။ METRICS_ENABLED=1 ဖြင့် ဖွင့်ပါ။")
+        return
+
+    lines = ["📈 Performance (count / mean / p50 / p99 ms):"]
+    for title, name in (("Handlers", "handler_seconds"),
+                        ("Bot API", "api_request_seconds"),
+                        ("Persistence", "persistence_seconds")):
+        rows = metrics.summary(name)
+        if not rows:
+            continue
+        lines.append(f"\n{title}:")
+        for label, count, mean, p50, p99 in rows:
+            lines.append(f"• {label}: {count} / {mean * 1000:.1f} / "
+                         f"≤{p50 * 1000:g} / ≤{p99 * 1000:g}")
+    counters = metrics.counters()
+    if counters:
+        lines.append("\nCounters:")
+        for (name, label), value in sorted(counters.items()):
+            lines.append(f"• {name}{{{label}}}: {value}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    label = context.args[0] if context.args else "24h"
+    try:
+        seconds = parse_window(label)
+    except ValueError:
+        await update.message.reply_text("အသုံးပြုနည်း: /stats [15m/6h/7d]")
+        return
+
+    if seconds > sales.span:
+        # The rings hold no more than this; a longer window would only
+        # dilute the hourly rates
+        seconds = sales.span
+        label = f"{seconds // 86400}d"
+
+    sales.catch_up()
+    now = time.time()
+    window = sales.window(seconds, now)
+    revenue = sum(totals[0] for totals in window.values())
+    units = sum(totals[1] for totals in window.values())
+    orders = sum(totals[2] for totals in window.values())
+    # The newest bucket is still filling; rate over the time actually held
+    hours = max(sales.covered(seconds, now), 1) / 3600
+    lines = [
+        f"📊 အရောင်း ({label}):",
+        f"💰 ဝင်ငွေ: {revenue} MMK",
+        f"📦 ကုတ်: {units} ခု / အော်ဒါ: {orders}",
+        f"⚡ {units / hours:.1f} ခု/နာရီ, {revenue / hours:.0f} MMK/နာရီ",
+    ]
+    if window:
+        lines.append("\n🏆 အရောင်းရဆုံး (ကုတ် / ဝင်ငွေ / sell-through):")
+    ranked = sorted(window.items(), key=lambda item: -item[1][1])
+    for (game_type, amount), (key_revenue, key_units, _) in ranked[:10]:
+        left = len(db["stock"].get(game_type, {}).get(amount, []))
+        unit = catalog.unit(game_type)
+        lines.append(f"• {get_game_display_name(game_type)} {amount} {unit}: "
+                     f"{key_units} / {key_revenue} MMK / "
+                     f"{key_units * 100 // (key_units + left)}%")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def sweep_conversations(context: ContextTypes.DEFAULT_TYPE):
+    conversations.sweep()
+
+
+EXPIRED_TEXT = {
+    "registrations":
+    "⌛ အကောင့်ဝင်ရန်တောင်းဆိုမှု သက်တမ်းကုန်သွားပါပြီ။ /start ဖြင့် ထပ်မံတောင်းဆိုပါ။",
+    "topups":
+    "⌛ ငွေဖြည့်တောင်းဆိုမှု {rid} သက်တမ်းကုန်သွားပါပြီ။ လိုအပ်ပါက ထပ်မံတောင်းဆိုပါ။",
+    "receipts":
+    "⌛ လွှဲငွေ {rid} ဖြင့်ဝယ်ယူမှု သက်တမ်းကုန်သွားပါပြီ။ လိုအပ်ပါက ထပ်မံတောင်းဆိုပါ။",
+}
+
+
+async def backup_db(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await asyncio.to_thread(backups.create)
+    except OSError as e:
+        await context.bot.send_message(ADMIN_ID, f"⚠️ Backup မအောင်မြင်ပါ: {e}")
+
+
+async def expire_requests(context: ContextTypes.DEFAULT_TYPE):
+    """Expire stale pending requests and archive old resolved ones"""
+    with db_transaction():
+        expired, archived = lifecycle.sweep()
+        for name, rid, request in expired:
+            pending.discard(name, rid)
+            review.release(name, rid)
+            request_changed(name, rid)
+        for name, rid in archived:
+            request_changed(name, rid)
+        if expired or archived:
+            save_db(db)
+
+    for name, rid, request in expired:
+        try:
+            await context.bot.send_message(
+                request["user_id"], EXPIRED_TEXT[name].format(rid=rid))
+        except TelegramError:
+            pass
+
+
+async def reassign_requests(context: ContextTypes.DEFAULT_TYPE):
+    """Pass requests left unhandled past REVIEW_TIMEOUT to someone else"""
+    with db_transaction():
+        moved = []
+        overdue = review.overdue()
+        for name, rid, reviewer in overdue:
+            if reassign(name, rid, reviewer):
+                moved.append((name, rid))
+            else:
+                # Nobody else is online; give the same reviewer more time
+                review.assign(name, rid, reviewer)
+                request_changed(name, rid)
+        if overdue:
+            save_db(db)
+
+    for name, rid in moved:
+        try:
+            await notify_reviewer(context.bot, name, rid, REASSIGNED_NOTE)
+        except TelegramError:
+            pass
+
+
+async def refresh_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Let read-only handlers see what the other workers committed"""
+    shared_db.refresh()
+
+
+# ---------------- Memory ----------------
+# tracemalloc, off until /memstats trace start
+allocations = AllocationTrace()
+MEMSTATS_USAGE = ("အသုံးပြုနည်း: /memstats [types | trace [start [frames]/stop] "
+                  "| every <minutes>]")
+
+
+def memory_report(app):
+    """Approximate footprint of the database, conversation state and
+    in-memory indexes; sections are sized from samples, so this is cheap
+    enough to run on the event loop"""
+    current, peak = rss()
+    title = f"🧠 Memory (worker {worker_index})" if shared_db else "🧠 Memory"
+    lines = [f"{title}: RSS {human(current)}, peak {human(peak)}",
+             "\ndb (approx):"]
+    for name, size, entries in section_sizes(db):
+        lines.append(f"• {name}: {human(size)} ({entries})")
+
+    usage = conversations.usage()
+    user_data, chat_data = dict(app.user_data), dict(app.chat_data)
+    lines.append(
+        f"\nConversation state: {usage['users']} users, {usage['keys']} keys, "
+        f"{usage['expiry']} expiry entries, {human(footprint(conversations))}")
+    lines.append(f"PTB user_data: {len(user_data)} users, "
+                 f"{human(deep_size(user_data))}; chat_data: "
+                 f"{len(chat_data)} chats, {human(deep_size(chat_data))}")
+
+    # Indexes keep references into db; those are counted above
+    stop = {id(db), *map(id, db.values())}
+    lines.append("\nIndexes:")
+    for name, index in (("user_search", user_search), ("balances", balances),
+                        ("pending", pending), ("lifecycle", lifecycle),
+                        ("review", review), ("price_index", price_index),
+                        ("catalog", catalog), ("forecast", forecast),
+                        ("sales", sales), ("recent_queries", recent_queries),
+                        ("flood_control", flood_control)):
+        lines.append(f"• {name}: {human(footprint(index, stop))}")
+
+    if allocations.active:
+        traced, traced_peak = allocations.traced()
+        lines.append(f"\ntracemalloc: {human(traced)} traced, "
+                     f"peak {human(traced_peak)}")
+    return lines
+
+
+def allocation_lines():
+    lines = ["📍 Allocation changes since the last mark:"]
+    for size, count, where in allocations.diff():
+        sign = "+" if size > 0 else "-"
+        lines.append(f"• {sign}{human(abs(size))} ({count:+} blocks) {where}")
+    return lines
+
+
+async def send_memory_report(context: ContextTypes.DEFAULT_TYPE):
+    lines = memory_report(context.application)
+    if allocations.active:
+        lines += ["", *allocation_lines()]
+    await context.bot.send_message(ADMIN_ID, "\n".join(lines)[:MESSAGE_LIMIT])
+
+
+def schedule_memory_reports(app, interval):
+    for job in app.job_queue.get_jobs_by_name("memstats"):
+        job.schedule_removal()
+    if interval > 0:
+        app.job_queue.run_repeating(send_memory_report,
+                                    interval=interval,
+                                    first=interval,
+                                    name="memstats")
+
+
+async def memstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        return
+    args = context.args
+    try:
+        if not args:
+            lines = memory_report(context.application)
+        elif args[0] == "types":
+            lines = ["🔬 Live objects by type:"] + [
+                f"• {name}: {count:,}" for name, count in type_census()
+            ]
+        elif args[0] == "trace" and len(args) == 1:
+            lines = allocation_lines() if allocations.active else [
+                "📍 tracemalloc ပိတ်ထားပါသည်။ /memstats trace start ဖြင့် ဖွင့်ပါ။"
+            ]
+        elif args[0] == "trace" and args[1] == "start":
+            frames = int(args[2]) if len(args) > 2 else 1
+            allocations.start(frames)
+            lines = [
+                f"📍 tracemalloc ဖွင့်ပြီးပါပြီ ({frames} frame)။ "
+                "/memstats trace ဖြင့် ယခုအချိန်မှစ၍ ပြောင်းလဲမှုကို ကြည့်ပါ။ "
+                "Bot နှေးစေနိုင်သဖြင့် ပြီးလျှင် /memstats trace stop ဖြင့် ပိတ်ပါ။"
+            ]
+        elif args[0] == "trace" and args[1] == "stop":
+            allocations.stop()
+            lines = ["📍 tracemalloc ပိတ်ပြီးပါပြီ"]
+        elif args[0] == "every":
+            minutes = float(args[1])
+            schedule_memory_reports(context.application, minutes * 60)
+            lines = [f"⏰ {minutes:g} မိနစ်တိုင်း ပို့ပါမည်" if minutes > 0
+                     else "⏰ အလိုအလျောက်ပို့ခြင်း ရပ်ပြီးပါပြီ"]
+        else:
+            raise ValueError(args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text(MEMSTATS_USAGE)
+        return
+    await update.message.reply_text("\n".join(lines)[:MESSAGE_LIMIT])
+
+
+# ---------------- Dashboard API ----------------
+def api_stock(params):
+    return {
+        game_type: {
+            amount: {
+                "count": len(codes),
+                "price": db["prices"].get(game_type, {}).get(amount)
+            }
+            for amount, codes in amounts.items()
+        }
+        for game_type, amounts in db["stock"].items()
+    }
+
+
+def api_pending(params):
+    return pending.snapshot(query_limit(params, 20))
+
+
+def api_top_users(params):
+    return [{
+        "user_id": uid,
+        "balance": balance
+    } for uid, balance in balances.top(query_limit(params, 10))]
+
+
+def api_recent_sales(params):
+    sales.catch_up()
+    return list(sales.recent)[-query_limit(params, 20):][::-1]
+
+
+dashboard = Dashboard(
+    {
+        "/api/stock": api_stock,
+        "/api/pending": api_pending,
+        "/api/top-users": api_top_users,
+        "/api/sales/recent": api_recent_sales,
+    },
+    ttl=DASHBOARD_TTL,
+    refresh=lambda: shared_db and shared_db.refresh())
+
+
 # ---------------- Main ----------------
-def main():
-    app = Application.builder().token(BOT_TOKEN).build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("setbalance", setbalance))
-    app.add_handler(CommandHandler("addstock", addstock))
-    app.add_handler(CommandHandler("delstock", delstock))
-    app.add_handler(CommandHandler("setprice", setprice))
-    app.add_handler(CommandHandler("setpayment", setpayment))
-    app.add_handler(CommandHandler("viewhistory", viewhistory))
-    app.add_handler(CommandHandler("admhelp", admhelp))
-    app.add_handler(CallbackQueryHandler(callback_handler))
+async def post_init(app: Application):
+    if METRICS_ENABLED:
+        await metrics.serve(METRICS_HOST, METRICS_PORT)
+    if DASHBOARD_PORT and worker_index == 0:
+        await dashboard.serve(METRICS_HOST, DASHBOARD_PORT)
+
+
+def command(name, handler):
+    timed = metrics.instrument("handler_seconds", lambda update: f"/{name}")
+    return CommandHandler(name, timed(handler))
+
+
+def add_handlers(app):
+    """Every update handler, in dispatch order; bench/replay.py feeds
+    traces through these on an app of its own"""
+    if trace:
+        app.add_handler(TypeHandler(Update, record_update), group=-3)
+    if shared_db:
+        app.add_handler(TypeHandler(Update, refresh_db), group=-2)
+    app.add_handler(TypeHandler(Update, rate_limit), group=-1)
+    app.add_handler(command("start", start))
+    app.add_handler(command("setbalance", setbalance))
+    app.add_handler(command("addstock", addstock))
+    app.add_handler(command("delstock", delstock))
+    app.add_handler(command("setprice", setprice))
+    app.add_handler(command("addgame", addgame))
+    app.add_handler(command("setpayment", setpayment))
+    app.add_handler(command("setalert", setalert))
+    app.add_handler(command("viewhistory", viewhistory))
+    app.add_handler(command("finduser", finduser))
+    app.add_handler(command("staff", staff))
+    app.add_handler(command("online", online))
+    app.add_handler(command("offline", offline))
+    app.add_handler(command("redeliver", redeliver))
+    app.add_handler(command("broadcast", broadcast))
+    app.add_handler(command("restore", restore))
+    app.add_handler(command("admhelp", admhelp))
+    app.add_handler(command("perf", perf))
+    app.add_handler(command("stats", stats))
+    app.add_handler(command("memstats", memstats))
+    app.add_handler(
+        CallbackQueryHandler(
+            metrics.instrument("handler_seconds",
+                               callback_action)(callback_handler)))
     app.add_handler(
-        MessageHandler(filters.ALL & ~filters.COMMAND, handle_message))
-    app.run_polling()
+        MessageHandler(
+            filters.ALL & ~filters.COMMAND,
+            metrics.instrument("handler_seconds",
+                               message_kind)(handle_message)))
+    app.add_handler(TypeHandler(Update, remember_profile), group=1)
+
+
+def build_application(updater=True):
+    builder = Application.builder().token(BOT_TOKEN).post_init(post_init)
+    if BOT_API_BASE_URL:
+        builder.base_url(BOT_API_BASE_URL)
+    if METRICS_ENABLED:
+        builder.request(metrics.InstrumentedRequest(connection_pool_size=256))
+    if not updater:
+        builder.updater(None)
+    app = builder.build()
+    add_handlers(app)
+    app.job_queue.run_repeating(sweep_conversations,
+                                interval=STATE_SWEEP_INTERVAL,
+                                first=STATE_SWEEP_INTERVAL)
+    schedule_memory_reports(app, MEMSTATS_INTERVAL)
+    if worker_index == 0:
+        app.job_queue.run_once(resume_broadcast, 0)
+        app.job_queue.run_repeating(expire_requests,
+                                    interval=LIFECYCLE_SWEEP_INTERVAL,
+                                    first=60)
+        app.job_queue.run_repeating(reassign_requests,
+                                    interval=REVIEW_SWEEP_INTERVAL,
+                                    first=REVIEW_SWEEP_INTERVAL)
+        app.job_queue.run_repeating(backup_db,
+                                    interval=BACKUP_INTERVAL,
+                                    first=BACKUP_INTERVAL)
+    return app
+
+
+def main():
+    build_application().run_polling()
 
 
 if __name__ == "__main__":
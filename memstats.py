@@ -0,0 +1,174 @@
+import collections
+import gc
+import os
+import random
+import resource
+import sys
+import tracemalloc
+import types
+
+# Containers larger than this are sized from a random sample of items
+SAMPLE = 2000
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType,
+           types.BuiltinFunctionType)
+
+
+def rss():
+    """(current, peak) resident memory in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak, peak
+    return current, max(current, peak)
+
+
+def deep_size(obj, stop=()):
+    """Approximate bytes reachable from `obj`: sys.getsizeof summed over
+    containers, __dict__ and __slots__, each object counted once. The walk
+    does not enter objects in `stop` (ids), classes, modules or functions."""
+    seen = set(stop)
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _OPAQUE):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, (str, bytes, int, float, bool, type(None))):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(o)
+        else:
+            if hasattr(o, "__dict__"):
+                stack.append(o.__dict__)
+            for cls in type(o).__mro__:
+                slots = getattr(cls, "__slots__", ())
+                for name in (slots, ) if isinstance(slots, str) else slots:
+                    if name not in ("__dict__", "__weakref__"):
+                        stack.append(getattr(o, name, None))
+    return total
+
+
+def estimate(container, stop=(), sample=SAMPLE, rng=random):
+    """deep_size of a dict or list, extrapolated from `sample` items when
+    it is longer than that"""
+    if id(container) in stop:
+        return 0
+    if not isinstance(container, (dict, list)) or len(container) <= sample:
+        return deep_size(container, stop)
+    if isinstance(container, dict):
+        keys = rng.sample(list(container), sample)
+        items = sum(
+            deep_size(key, stop) + deep_size(container[key], stop)
+            for key in keys)
+    else:
+        items = sum(
+            deep_size(item, stop) for item in rng.sample(container, sample))
+    return sys.getsizeof(container) + items * len(container) // sample
+
+
+def footprint(obj, stop=()):
+    """deep_size of an object, its large dict and list attributes
+    estimated from a sample"""
+    if isinstance(obj, (dict, list)):
+        return estimate(obj, stop)
+    if hasattr(obj, "__dict__"):
+        attributes = list(vars(obj).values())
+    else:
+        attributes = [
+            getattr(obj, name, None) for cls in type(obj).__mro__
+            for name in getattr(cls, "__slots__", ())
+        ]
+    return sys.getsizeof(obj) + sum(
+        estimate(value, stop) for value in attributes)
+
+
+def section_sizes(db):
+    """[(section, approx bytes, entries)] of a db-like dict, largest first"""
+    sizes = []
+    for name, value in db.items():
+        if name == "stock" and isinstance(value, dict):
+            # Code lists are sampled one by one
+            size = sys.getsizeof(value) + sum(
+                sys.getsizeof(amounts) + sum(
+                    deep_size(amount) + estimate(codes)
+                    for amount, codes in amounts.items())
+                for amounts in value.values())
+        elif isinstance(value, (dict, list)):
+            size = estimate(value)
+        else:
+            size = deep_size(value)
+        entries = len(value) if isinstance(value, (dict, list)) else 1
+        sizes.append((name, size, entries))
+    sizes.sort(key=lambda row: row[1], reverse=True)
+    return sizes
+
+
+def type_census(limit=15):
+    """[(type name, live objects)] for the most numerous types gc tracks.
+    Walks the whole heap: fine on demand, not for a timer."""
+    counts = collections.Counter(
+        type(o).__qualname__ for o in gc.get_objects())
+    return counts.most_common(limit)
+
+
+def human(size):
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class AllocationTrace:
+    """tracemalloc, switched on and off at runtime.
+
+    Free while off. While on, every allocation is recorded with `frames`
+    stack frames, which slows allocation-heavy code down severalfold and
+    costs memory per live block, so it is meant to run for a while and
+    then be stopped. diff() reports the biggest changes since the previous
+    diff() (or start()) and moves that mark to now.
+    """
+
+    def __init__(self):
+        self._mark = None
+
+    @property
+    def active(self):
+        return tracemalloc.is_tracing()
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+
+    def start(self, frames=1):
+        if not self.active:
+            tracemalloc.start(frames)
+        self._mark = self._snapshot()
+
+    def stop(self):
+        tracemalloc.stop()
+        self._mark = None
+
+    def traced(self):
+        """(current, peak) bytes allocated since start()"""
+        return tracemalloc.get_traced_memory()
+
+    def diff(self, limit=10):
+        """[(bytes delta, blocks delta, "file:line")], largest change first"""
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._mark, "lineno")
+        self._mark = snapshot
+        return [(stat.size_diff, stat.count_diff,
+                 f"{os.path.basename(stat.traceback[0].filename)}:"
+                 f"{stat.traceback[0].lineno}")
+                for stat in stats[:limit] if stat.size_diff]
@@ -0,0 +1,195 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import time
+from urllib.parse import urlsplit
+
+from telegram.request import HTTPXRequest
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+enabled = False
+_histograms = {}  # (name, label) -> Histogram
+_counters = {}  # (name, label) -> int
+_null_timer = contextlib.nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def observe(name, label, seconds):
+    hist = _histograms.get((name, label))
+    if hist is None:
+        hist = _histograms[(name, label)] = Histogram()
+    hist.observe(seconds)
+
+
+def inc(name, label="", value=1):
+    if enabled:
+        _counters[(name, label)] = _counters.get((name, label), 0) + value
+
+
+class _Timer:
+    __slots__ = ("name", "label", "start")
+
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, self.label, time.perf_counter() - self.start)
+
+
+def timer(name, label):
+    return _Timer(name, label) if enabled else _null_timer
+
+
+def instrument(name, label_of):
+    """Handler decorator recording latency under label_of(update) and
+    counting exceptions; the handler is returned untouched when disabled"""
+
+    def decorator(handler):
+        if not enabled:
+            return handler
+
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            label = label_of(update)
+            start = time.perf_counter()
+            try:
+                return await handler(update, context)
+            except Exception:
+                inc("errors_total", label)
+                raise
+            finally:
+                observe(name, label, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call by method name"""
+
+    async def do_request(self, url, method, request_data=None, *args,
+                         **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args,
+                                            **kwargs)
+        except Exception:
+            inc("api_errors_total", api_method)
+            raise
+        finally:
+            observe("api_request_seconds", api_method,
+                    time.perf_counter() - start)
+
+
+# ---------------- Exposition ----------------
+def render():
+    """Prometheus text exposition format"""
+    lines = []
+    for name in sorted({name for name, _ in _histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (hname, label), hist in sorted(_histograms.items()):
+            if hname != name:
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf", ), hist.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{label="{label}",le="{bound}"}} '
+                             f"{cumulative}")
+            lines.append(f'{name}_sum{{label="{label}"}} {hist.total}')
+            lines.append(f'{name}_count{{label="{label}"}} {hist.count}')
+    for name in sorted({name for name, _ in _counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (cname, label), value in sorted(_counters.items()):
+            if cname == name:
+                lines.append(f'{name}{{label="{label}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def summary(name):
+    """(label, count, mean, p50, p99) rows for one histogram"""
+    rows = []
+    for (hname, label), hist in sorted(_histograms.items()):
+        if hname == name and hist.count:
+            rows.append((label, hist.count, hist.total / hist.count,
+                         hist.quantile(0.5), hist.quantile(0.99)))
+    return rows
+
+
+def counters():
+    return dict(_counters)
+
+
+def http_handler(respond, content_type):
+    """asyncio.start_server callback answering one GET per connection
+    with `respond(path, query)` -> (status line, body bytes)"""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # headers
+            parts = request_line.decode(errors="replace").split()
+            url = urlsplit(parts[1] if len(parts) > 1 else "")
+            status, body = respond(url.path, url.query)
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return handle
+
+
+def _respond(path, query):
+    if path == "/metrics":
+        return "200 OK", render().encode()
+    return "404 Not Found", b"not found\n"
+
+
+async def serve(host, port):
+    """Serve GET /metrics on the running event loop"""
+    return await asyncio.start_server(
+        http_handler(_respond, "text/plain; version=0.0.4"), host, port)
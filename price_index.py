@@ -0,0 +1,63 @@
+class PriceIndex:
+    """Cheapest in-stock price per game plus the global minimum.
+
+    Call update() for every (game_type, amount) whose stock or price changed;
+    "can this balance buy anything" is then a single comparison.
+    """
+
+    def __init__(self, stock, prices):
+        self._stock = stock
+        self._prices = prices
+        self._available = {}  # game_type -> {amount: price} with stock > 0
+        self._game_min = {}
+        self.global_min = None
+        self.rebuild()
+
+    def rebuild(self, stock=None, prices=None):
+        """Recompute everything, optionally against freshly loaded dicts"""
+        if stock is not None:
+            self._stock = stock
+        if prices is not None:
+            self._prices = prices
+        self._available = {}
+        for game_type, amounts in self._prices.items():
+            for amount, price in amounts.items():
+                if self._stock.get(game_type, {}).get(amount):
+                    self._available.setdefault(game_type, {})[amount] = price
+        self._game_min = {
+            game_type: min(available.values())
+            for game_type, available in self._available.items() if available
+        }
+        self._refresh_global()
+
+    def update(self, game_type, amount):
+        available = self._available.setdefault(game_type, {})
+        old = available.pop(amount, None)
+        price = self._prices.get(game_type, {}).get(amount)
+        if price is not None and self._stock.get(game_type, {}).get(amount):
+            available[amount] = price
+
+        current = self._game_min.get(game_type)
+        if price is not None and amount in available and (current is None
+                                                          or price < current):
+            self._game_min[game_type] = price
+        elif old is not None and old == current:
+            # The cheapest entry went away or got dearer
+            if available:
+                self._game_min[game_type] = min(available.values())
+            else:
+                del self._game_min[game_type]
+        else:
+            return
+        self._refresh_global()
+
+    def _refresh_global(self):
+        self.global_min = min(self._game_min.values(), default=None)
+
+    def cheapest(self, game_type):
+        return self._game_min.get(game_type)
+
+    def can_afford(self, balance, game_type=None):
+        price = self.global_min if game_type is None else self.cheapest(
+            game_type)
+        return price is not None and balance >= price
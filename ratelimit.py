@@ -0,0 +1,49 @@
+import time
+
+
+class TokenBuckets:
+    """Per-key token buckets, each stored as a single float.
+
+    A bucket refills at `rate` tokens/second up to `burst`. Instead of
+    (tokens, last update) we keep the time at which the bucket will be full
+    again (GCRA), so a key whose time has passed is equivalent to a fresh
+    bucket and can simply be dropped from the map.
+    """
+
+    def __init__(self, rate, burst, prune_every=60):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.prune_every = prune_every
+        self._full_at = {}
+        self._last_prune = time.monotonic()
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self._last_prune >= self.prune_every:
+            self.prune(now)
+        full_at = max(self._full_at.get(key, now), now)
+        if full_at - now > self.tolerance:
+            return False
+        self._full_at[key] = full_at + self.interval
+        return True
+
+    def prune(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._full_at = {k: t for k, t in self._full_at.items() if t > now}
+        self._last_prune = now
+
+    def __len__(self):
+        return len(self._full_at)
+
+
+class FloodControl:
+    """One TokenBuckets per action class, e.g. navigation vs purchase"""
+
+    def __init__(self, budgets):
+        self._buckets = {
+            name: TokenBuckets(rate, burst)
+            for name, (rate, burst) in budgets.items()
+        }
+
+    def allow(self, uid, action):
+        return self._buckets[action].allow(uid)
@@ -0,0 +1,307 @@
+import sys
+import time
+
+# ---------------- Enum-like values ----------------
+# Plain interned strings so records stay JSON-compatible and every
+# "pending"/"MLBBbal"/"Wave" in memory shares a single object.
+
+
+class Status:
+    PENDING = sys.intern("pending")
+    APPROVED = sys.intern("approved")
+    REJECTED = sys.intern("rejected")
+    EXPIRED = sys.intern("expired")
+
+
+class GameType:
+    MLBB_BAL = sys.intern("MLBBbal")
+    MLBB_PH = sys.intern("MLBBph")
+    PUPG = sys.intern("PUPG")
+
+
+# Display names, as stored in history entries
+GAME_NAMES = {
+    GameType.MLBB_BAL: "Mobile Legends (Bal)",
+    GameType.MLBB_PH: "Mobile Legends (PH)",
+    GameType.PUPG: "PUPG Mobile"
+}
+
+
+class PaymentMethod:
+    WAVE = sys.intern("Wave")
+    KPAY = sys.intern("Kpay")
+
+
+class HistoryType:
+    BALANCE = sys.intern("balance")
+    RECEIPT = sys.intern("receipt")
+
+
+# Allowed status changes for receipts and top-up requests
+TRANSITIONS = {
+    Status.PENDING: (Status.APPROVED, Status.REJECTED, Status.EXPIRED),
+}
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# ---------------- Records ----------------
+class Record:
+    """Slotted record that still reads and writes like the old dicts"""
+    __slots__ = ("_extra", )
+    _fields = ()
+    _optional = ()
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not None or key not in self._optional:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        data = {}
+        for field in self._fields:
+            value = getattr(self, field)
+            if value is None and field in self._optional:
+                continue
+            if isinstance(value, tuple):
+                value = list(value)
+            data[field] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        known = {k: v for k, v in data.items() if k in cls._fields}
+        record = cls(**known)
+        extra = {k: v for k, v in data.items() if k not in cls._fields}
+        if extra:
+            record._extra = extra
+        return record
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class HistoryEntry(Record):
+    __slots__ = ("type", "codes", "receipt", "game", "amount", "quantity",
+                 "total_price")
+    _fields = __slots__
+    _optional = ("receipt", "game", "amount", "quantity", "total_price")
+
+    def __init__(self,
+                 type,
+                 codes=(),
+                 receipt=None,
+                 game=None,
+                 amount=None,
+                 quantity=None,
+                 total_price=None):
+        self._extra = None
+        self.type = intern(type)
+        self.codes = tuple(codes)
+        self.receipt = receipt
+        self.game = intern(game)
+        self.amount = intern(amount)
+        self.quantity = quantity
+        self.total_price = total_price
+
+
+class UserRecord(Record):
+    __slots__ = ("balance", "history", "approved", "name", "username")
+    _fields = __slots__
+    _optional = ("name", "username")
+
+    def __init__(self,
+                 balance=0,
+                 history=None,
+                 approved=False,
+                 name=None,
+                 username=None):
+        self._extra = None
+        self.balance = balance
+        self.history = [
+            h if isinstance(h, HistoryEntry) else HistoryEntry.from_dict(h)
+            for h in history or ()
+        ]
+        self.approved = approved
+        # Telegram first name and @username, for /finduser
+        self.name = name
+        self.username = username
+
+    def same_as(self, data):
+        """Whether `data`, a user as read back from JSON, holds nothing
+        this record lacks. History is append-only, so its length stands in
+        for its entries."""
+        extra = {k: v for k, v in data.items() if k not in self._fields}
+        return (data.get("balance") == self.balance
+                and len(data.get("history", ())) == len(self.history)
+                and data.get("approved") == self.approved
+                and data.get("name") == self.name
+                and data.get("username") == self.username
+                and extra == (self._extra or {}))
+
+
+class Receipt(Record):
+    __slots__ = ("user_id", "status", "game_type", "amount", "quantity",
+                 "created", "resolved", "photo", "assignee", "assigned")
+    _fields = __slots__
+    _optional = ("resolved", "photo", "assignee", "assigned")
+
+    def __init__(self,
+                 user_id,
+                 status=Status.PENDING,
+                 game_type=None,
+                 amount=None,
+                 quantity=0,
+                 created=None,
+                 resolved=None,
+                 photo=None,
+                 assignee=None,
+                 assigned=None):
+        self._extra = None
+        self.user_id = user_id
+        self.status = status
+        self.game_type = game_type
+        self.amount = amount
+        self.quantity = quantity
+        # Records saved before timestamps existed count from their first load
+        self.created = time.time() if created is None else created
+        self.resolved = resolved
+        # Screenshot message id in the user's chat, forwarded to reviewers
+        self.photo = photo
+        # Reviewer the request was routed to, and when
+        self.assignee = assignee
+        self.assigned = assigned
+
+    def __setattr__(self, name, value):
+        if name in ("status", "game_type", "amount"):
+            value = intern(value)
+        object.__setattr__(self, name, value)
+
+
+class TopupRequest(Record):
+    __slots__ = ("user_id", "status", "amount", "payment_method", "created",
+                 "resolved", "photo", "assignee", "assigned")
+    _fields = __slots__
+    _optional = ("resolved", "photo", "assignee", "assigned")
+
+    def __init__(self,
+                 user_id,
+                 status=Status.PENDING,
+                 amount=0,
+                 payment_method=None,
+                 created=None,
+                 resolved=None,
+                 photo=None,
+                 assignee=None,
+                 assigned=None):
+        self._extra = None
+        self.user_id = user_id
+        self.status = status
+        self.amount = amount
+        self.payment_method = payment_method
+        self.created = time.time() if created is None else created
+        self.resolved = resolved
+        self.photo = photo
+        self.assignee = assignee
+        self.assigned = assigned
+
+    def __setattr__(self, name, value):
+        if name in ("status", "payment_method"):
+            value = intern(value)
+        object.__setattr__(self, name, value)
+
+
+def transition(record, status, now=None):
+    """Move a receipt/top-up to `status` if allowed; False if already done"""
+    if status not in TRANSITIONS.get(record.status, ()):
+        return False
+    record.status = status
+    record.resolved = time.time() if now is None else now
+    return True
+
+
+# ---------------- (De)serialization ----------------
+def encode_record(obj):
+    """`default=` hook for json.dump"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(
+        f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _int_key(key):
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return key
+
+
+def hydrate(data):
+    """Turn the freshly loaded JSON sections into records, in place.
+
+    JSON object keys are always strings, while handlers look users and
+    registrations up by integer Telegram id, so those keys are restored to
+    ints here.
+    """
+    data["users"] = {
+        _int_key(uid): u if isinstance(u, UserRecord) else
+        UserRecord.from_dict(u)
+        for uid, u in data.get("users", {}).items()
+    }
+    data["pending_registrations"] = {
+        _int_key(uid): reg
+        for uid, reg in data.get("pending_registrations", {}).items()
+    }
+    data["staff"] = {
+        _int_key(uid): member
+        for uid, member in data.get("staff", {}).items()
+    }
+    data["receipts"] = {
+        rid: r if isinstance(r, Receipt) else Receipt.from_dict(r)
+        for rid, r in data.get("receipts", {}).items()
+    }
+    data["topup_requests"] = {
+        rid: r if isinstance(r, TopupRequest) else TopupRequest.from_dict(r)
+        for rid, r in data.get("topup_requests", {}).items()
+    }
+    for section in ("stock", "prices"):
+        for game_type in list(data.get(section, {})):
+            data[section][intern(game_type)] = {
+                intern(amount): value
+                for amount, value in data[section].pop(game_type).items()
+            }
+    return data
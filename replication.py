@@ -0,0 +1,134 @@
+import json
+import os
+import time
+
+from records import encode_record
+
+# Request queue name -> database section
+QUEUE_SECTIONS = {
+    "registrations": "pending_registrations",
+    "topups": "topup_requests",
+    "receipts": "receipts",
+}
+# A full journal segment is renamed to CHANGE_LOG + ROTATED
+ROTATED = ".1"
+
+
+class ChangeLog:
+    """Change capture for a standby replica.
+
+    Mutation helpers record() operations as they happen; save_db() calls
+    commit(), which appends everything recorded since the last save as a
+    single JSON line. Commits run under the database lock in scale-out
+    mode, so the file is in commit order. Every operation carries its
+    result (absolute balances, the codes taken, full request records) so
+    replaying one that is already in a replica's snapshot is harmless.
+
+    Once the file reaches `max_bytes` it is renamed to path + ROTATED,
+    replacing the segment before it, and the next commit starts a new
+    file. Everything in a rotated segment is already in the section store,
+    which is where a new standby seeds from; a running one finishes the
+    rotated segment before moving on, so it may lag by up to a segment.
+    """
+
+    def __init__(self, path, max_bytes=64 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._ops = []
+
+    def record(self, op, *args):
+        self._ops.append([op, *args])
+
+    def commit(self):
+        if not self._ops:
+            return
+        line = json.dumps({
+            "ts": time.time(),
+            "ops": self._ops
+        },
+                          separators=(",", ":"),
+                          default=encode_record) + "\n"
+        self._ops = []
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size >= self.max_bytes:
+            os.replace(self.path, self.path + ROTATED)
+
+
+def touch(store, op, args):
+    """Mark the section-store section an operation lands in"""
+    if op in ("take", "add", "remove"):
+        store.touch(f"stock.{args[0]}")
+    elif op in ("user", "balance", "history"):
+        store.touch_user(int(args[0]))
+    elif op in ("request", "drop_request"):
+        store.touch(QUEUE_SECTIONS[args[0]])
+    else:
+        store.touch("config")
+
+
+def _stock(data, game_type, amount):
+    return data["stock"].setdefault(game_type, {}).setdefault(amount, [])
+
+
+def _user(data, uid):
+    return data["users"].setdefault(int(uid), {
+        "balance": 0,
+        "history": [],
+        "approved": False
+    })
+
+
+def apply(data, ops):
+    """Replay one commit onto a plain-JSON copy of the database whose
+    users are keyed by integer uid, as SectionStore writes them"""
+    for op, *args in ops:
+        if op in ("take", "remove"):
+            game_type, amount, codes = args
+            gone = set(codes)
+            stock = _stock(data, game_type, amount)
+            stock[:] = [code for code in stock if code not in gone]
+        elif op == "add":
+            game_type, amount, codes = args
+            stock = _stock(data, game_type, amount)
+            present = set(stock)
+            stock.extend(code for code in codes if code not in present)
+        elif op == "price":
+            game_type, amount, price = args
+            data["prices"].setdefault(game_type, {})[amount] = price
+        elif op == "user":
+            uid, record = args
+            user = data["users"].get(int(uid))
+            if user is not None:
+                # Balance and history have operations of their own
+                record = dict(record,
+                              balance=user["balance"],
+                              history=user["history"])
+            data["users"][int(uid)] = record
+        elif op == "balance":
+            uid, balance = args
+            _user(data, uid)["balance"] = balance
+        elif op == "history":
+            uid, index, entry = args
+            history = _user(data, uid)["history"]
+            if len(history) == index:
+                history.append(entry)
+        elif op == "request":
+            queue, rid, record = args
+            data.setdefault(QUEUE_SECTIONS[queue], {})[str(rid)] = record
+        elif op == "drop_request":
+            queue, rid = args
+            data.get(QUEUE_SECTIONS[queue], {}).pop(str(rid), None)
+        elif op == "forecast":
+            game_type, amount, entry = args
+            data.setdefault("forecast", {}).setdefault(game_type,
+                                                       {})[amount] = entry
+        elif op == "section":
+            name, value = args
+            data[name] = value
+        else:
+            raise ValueError(f"unknown change {op!r}")
@@ -0,0 +1,331 @@
+"""Offline exports and reports over a database snapshot.
+
+    python report.py export users --format csv --out users.csv
+    python report.py export history --format jsonl
+    python report.py revenue
+    python report.py top-buyers --limit 20
+    python report.py pending
+    python report.py --source backups/database-20250101T000000.tar.gz revenue
+
+--source is the live section store (DB_DIR, the default), a backup
+archive, or an old single-file database.json or .json.gz backup. A live
+store is read from the manifest and files open when the command starts,
+so it is a consistent point in time however many commits the bot makes
+meanwhile, and nothing is ever written. User shards are parsed one user at
+a time as the file is read, so memory holds a read buffer and the current
+user rather than a shard; a single-file database has to be loaded whole.
+"""
+import argparse
+import codecs
+import csv
+import gzip
+import heapq
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+
+from dotenv import load_dotenv
+
+from records import GAME_NAMES, HistoryType, Status
+from section_store import MANIFEST, OWN_SECTIONS, SectionStore
+
+load_dotenv()
+DB_DIR = os.getenv("DB_DIR", "database")
+
+AGE_BUCKETS = ((3600, "<1h"), (6 * 3600, "1-6h"), (86400, "6-24h"),
+               (3 * 86400, "1-3d"), (float("inf"), ">3d"))
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_items(f, chunk_size=1 << 20):
+    """(key, value) of the JSON object in binary file `f`, parsed one
+    member at a time as the file is read"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        if eof:
+            raise ValueError("truncated JSON object")
+        data = f.read(chunk_size)
+        eof = not data
+        buf = buf[pos:] + utf8.decode(data, final=eof)
+        pos = 0
+
+    def peek():
+        """Next non-whitespace character, reading on as needed"""
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            fill()
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            follow = WHITESPACE.match(buf, end).end()
+            if not eof and (follow == len(buf) or buf[follow] not in ",:}"):
+                fill()  # "12" or "-2.5" of a longer number still decodes
+                continue
+            pos = end
+            return obj
+
+    if peek() != "{":
+        raise ValueError("expected a JSON object")
+    pos += 1
+    if peek() == "}":
+        return
+    while True:
+        key = value()
+        if peek() != ":":
+            raise ValueError("expected ':' in JSON object")
+        pos += 1
+        yield key, value()
+        separator = peek()
+        pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError("expected ',' or '}' in JSON object")
+
+
+class Source:
+    """One consistent snapshot, read a section at a time"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        if os.path.isdir(self.path):
+            self._snapshot = SectionStore(self.path).snapshot()
+            self.manifest, files = self._snapshot.__enter__()
+            self._read = lambda name: json.load(files[name])
+            self._items = lambda name: iter_items(files[name])
+        elif tarfile.is_tarfile(self.path):
+            self._snapshot = tarfile.open(self.path, "r:gz")
+            self._read = lambda name: json.load(
+                self._snapshot.extractfile(name))
+            self._items = lambda name: iter_items(
+                self._snapshot.extractfile(name))
+            self.manifest = self._read(MANIFEST)
+        else:
+            self._snapshot = None
+            opener = gzip.open if self.path.endswith(".gz") else open
+            with opener(self.path, "rt") as f:
+                data = json.load(f)
+            data["config"] = {
+                k: v
+                for k, v in data.items() if k not in OWN_SECTIONS
+            }
+            self._read = lambda name: data.get(name, {})
+            self._items = lambda name: iter(data.get(name, {}).items())
+            self.manifest = {
+                "sections": {
+                    name: name
+                    for name in ("config", "users", "receipts",
+                                 "topup_requests", "pending_registrations")
+                }
+            }
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self._snapshot, tarfile.TarFile):
+            self._snapshot.close()
+        elif self._snapshot is not None:
+            self._snapshot.__exit__(*exc)
+
+    def section(self, name):
+        filename = self.manifest["sections"].get(name)
+        return self._read(filename) if filename else {}
+
+    def users(self):
+        """(uid, user) for every user, one user in memory at a time"""
+        for name, filename in self.manifest["sections"].items():
+            if name.partition(".")[0] == "users":
+                yield from self._items(filename)
+
+
+# ---------------- Exports ----------------
+EXPORTS = {
+    "users": ("uid", "name", "username", "approved", "balance", "orders"),
+    "history": ("uid", "index", "type", "game", "amount", "quantity",
+                "total_price", "receipt", "codes"),
+    "receipts": ("id", "user_id", "status", "game_type", "amount",
+                 "quantity", "created", "resolved"),
+    "topups": ("id", "user_id", "status", "amount", "payment_method",
+               "created", "resolved"),
+}
+
+
+def export_rows(source, table):
+    if table == "users":
+        for uid, user in source.users():
+            yield {
+                "uid": uid,
+                "name": user.get("name"),
+                "username": user.get("username"),
+                "approved": user["approved"],
+                "balance": user["balance"],
+                "orders": len(user["history"])
+            }
+    elif table == "history":
+        for uid, user in source.users():
+            for index, entry in enumerate(user["history"]):
+                yield {
+                    "uid": uid,
+                    "index": index,
+                    **entry, "codes": len(entry["codes"])
+                }
+    else:
+        section = "receipts" if table == "receipts" else "topup_requests"
+        for rid, request in source.section(section).items():
+            yield {"id": rid, **request}
+
+
+def export(source, args):
+    columns = EXPORTS[args.table]
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    try:
+        if args.format == "csv":
+            writer = csv.DictWriter(out, columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(export_rows(source, args.table))
+        else:
+            for row in export_rows(source, args.table):
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if args.out:
+            out.close()
+
+
+# ---------------- Reports ----------------
+def game_types(config):
+    """Display name -> game type; history entries only keep the name"""
+    names = dict(GAME_NAMES)
+    for game_type, game in config.get("catalog", {}).get("games", {}).items():
+        names[game_type] = game["name"]
+    return {name: game_type for game_type, name in names.items()}
+
+
+def order_value(entry, receipts, prices, types):
+    """What an order brought in; receipt orders are valued at today's
+    prices, since only balance purchases record what was paid"""
+    if entry["type"] == HistoryType.BALANCE:
+        return entry.get("total_price") or 0
+    receipt = receipts.get(entry.get("receipt"), {})
+    game_type = receipt.get("game_type") or types.get(entry.get("game"))
+    price = prices.get(game_type, {}).get(entry.get("amount"), 0)
+    return price * entry.get("quantity", 0)
+
+
+def sort_key(item):
+    (game, amount), _ = item
+    return game, int(amount) if amount.isdigit() else 0, amount
+
+
+def revenue(source, args):
+    receipts = source.section("receipts")
+    config = source.section("config")
+    prices, types = config.get("prices", {}), game_types(config)
+    totals = {}  # (game, amount) -> [orders, codes, balance, receipt]
+    for _, user in source.users():
+        for entry in user["history"]:
+            key = entry.get("game") or "?", entry.get("amount") or "?"
+            row = totals.setdefault(key, [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += len(entry["codes"])
+            column = 2 if entry["type"] == HistoryType.BALANCE else 3
+            row[column] += order_value(entry, receipts, prices, types)
+
+    print(f"{'game':<22}{'amount':>8}{'orders':>9}{'codes':>9}"
+          f"{'balance MMK':>14}{'receipt MMK*':>14}")
+    for (game, amount), row in sorted(totals.items(), key=sort_key):
+        print(f"{game:<22}{amount:>8}{row[0]:>9}{row[1]:>9}"
+              f"{row[2]:>14,}{row[3]:>14,}")
+    sums = [sum(row[i] for row in totals.values()) for i in range(4)]
+    print(f"{'total':<30}{sums[0]:>9}{sums[1]:>9}{sums[2]:>14,}"
+          f"{sums[3]:>14,}")
+    print("* receipt orders valued at current prices")
+
+
+def top_buyers(source, args):
+    receipts = source.section("receipts")
+    config = source.section("config")
+    prices, types = config.get("prices", {}), game_types(config)
+    top = []  # min-heap of (spent, uid, orders, name), args.limit long
+    for uid, user in source.users():
+        spent = sum(
+            order_value(entry, receipts, prices, types)
+            for entry in user["history"])
+        if not spent:
+            continue
+        item = (spent, int(uid), len(user["history"]), user.get("name"))
+        if len(top) < args.limit:
+            heapq.heappush(top, item)
+        elif item > top[0]:
+            heapq.heapreplace(top, item)
+
+    print(f"{'uid':>12}  {'name':<20}{'orders':>8}{'spent MMK':>14}")
+    for spent, uid, orders, name in sorted(top, reverse=True):
+        print(f"{uid:>12}  {(name or '')[:20]:<20}{orders:>8}{spent:>14,}")
+
+
+def pending(source, args):
+    now = time.time()
+    print(f"{'queue':<24}" + "".join(f"{label:>8}"
+                                     for _, label in AGE_BUCKETS) +
+          f"{'oldest':>10}")
+    for section in ("receipts", "topup_requests", "pending_registrations"):
+        counts = [0] * len(AGE_BUCKETS)
+        oldest = None
+        for request in source.section(section).values():
+            if request["status"] != Status.PENDING:
+                continue
+            age = now - request.get("created", now)
+            oldest = age if oldest is None else max(oldest, age)
+            for i, (limit, _) in enumerate(AGE_BUCKETS):
+                if age < limit:
+                    counts[i] += 1
+                    break
+        print(f"{section:<24}" + "".join(f"{n:>8}" for n in counts) +
+              f"{'-' if oldest is None else f'{oldest / 3600:.1f}h':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source",
+                        default=DB_DIR,
+                        help="section store or backup archive, streamed "
+                        "a user at a time, or database.json, loaded whole")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("export")
+    p.add_argument("table", choices=sorted(EXPORTS))
+    p.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    p.add_argument("--out", help="file to write; stdout by default")
+    p.set_defaults(run=export)
+    commands.add_parser("revenue").set_defaults(run=revenue)
+    p = commands.add_parser("top-buyers")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(run=top_buyers)
+    commands.add_parser("pending").set_defaults(run=pending)
+    args = parser.parse_args()
+
+    with Source(args.source) as source:
+        args.run(source, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import time
+
+from records import Status
+
+ROLES = ("admin", "reviewer")
+
+
+class ReviewQueue:
+    """Staff roster and the assignment of pending requests to reviewers.
+
+    `staff` is the persisted roster {uid: {"role", "online"}}; `owner`
+    (ADMIN_ID) is always an admin, online unless the roster says
+    otherwise. A new request goes to the online reviewer with the fewest
+    outstanding requests, ties going to whoever was picked least
+    recently. Each assignment is stamped on the request and scheduled on
+    a heap; overdue() hands back requests still pending with the same
+    reviewer after `timeout` seconds so they can be passed on.
+    """
+
+    def __init__(self, owner, timeout):
+        self.owner = owner
+        self.timeout = timeout
+        self._turn = itertools.count()
+        self._picked = {}  # reviewer -> turn when last picked
+        self.rebind({}, {})
+
+    def rebind(self, staff, queues):
+        self.staff = staff
+        self.queues = queues
+        self._assigned = {}  # (queue, id) -> reviewer
+        self._load = {}  # reviewer -> outstanding requests
+        self._heap = []
+        for name, requests in queues.items():
+            for rid, request in requests.items():
+                if (request["status"] == Status.PENDING
+                        and request.get("assignee") is not None):
+                    self._heap.append(self._track(name, rid, request))
+        heapq.heapify(self._heap)
+
+    # ---------------- Roster ----------------
+    def member(self, uid):
+        member = self.staff.get(uid)
+        if member is None and uid == self.owner:
+            return {"role": "admin", "online": True}
+        return member
+
+    def role(self, uid):
+        member = self.member(uid)
+        return member and member["role"]
+
+    def members(self):
+        uids = set(self.staff) | {self.owner}
+        return sorted((uid, self.member(uid)) for uid in uids)
+
+    def outstanding(self, uid):
+        return self._load.get(uid, 0)
+
+    def assigned_to(self, uid):
+        return [key for key, reviewer in self._assigned.items()
+                if reviewer == uid]
+
+    # ---------------- Assignment ----------------
+    def pick(self, exclude=None):
+        """Least-loaded online reviewer other than `exclude`, or None"""
+        online = [
+            uid for uid, member in self.members()
+            if member["online"] and uid != exclude
+        ]
+        if not online:
+            return None
+        uid = min(online,
+                  key=lambda u: (self.outstanding(u), self._picked.get(u, -1)))
+        self._picked[uid] = next(self._turn)
+        return uid
+
+    def _track(self, name, rid, request):
+        """Count an assignment; returns its heap entry"""
+        reviewer = request["assignee"]
+        self._assigned[(name, rid)] = reviewer
+        self._load[reviewer] = self.outstanding(reviewer) + 1
+        return request["assigned"] + self.timeout, name, rid, reviewer
+
+    def track(self, name, rid):
+        """Take up a request's assignment as another process left it"""
+        self.release(name, rid)
+        request = self.queues[name].get(rid)
+        if (request is not None and request["status"] == Status.PENDING
+                and request.get("assignee") is not None):
+            heapq.heappush(self._heap, self._track(name, rid, request))
+
+    def assign(self, name, rid, uid, now=None):
+        self.release(name, rid)
+        request = self.queues[name][rid]
+        request["assignee"] = uid
+        request["assigned"] = time.time() if now is None else now
+        heapq.heappush(self._heap, self._track(name, rid, request))
+
+    def release(self, name, rid):
+        """Forget the assignment of a resolved (or reassigned) request"""
+        reviewer = self._assigned.pop((name, rid), None)
+        if reviewer is not None:
+            self._load[reviewer] -= 1
+
+    def overdue(self, now=None):
+        """[(queue, id, reviewer)] left unhandled past the timeout"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, name, rid, reviewer = heapq.heappop(self._heap)
+            request = self.queues[name].get(rid)
+            if (request is not None and request["status"] == Status.PENDING
+                    and self._assigned.get((name, rid)) == reviewer
+                    and request["assigned"] + self.timeout <= now):
+                due.append((name, rid, reviewer))
+        return due
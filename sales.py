@@ -0,0 +1,237 @@
+import collections
+import fcntl
+import json
+import math
+import os
+import time
+
+# (bucket width in seconds, buckets kept)
+GRANULARITIES = ((60, 60), (3600, 48), (86400, 35))
+# A log segment older than the coarsest ring is renamed to path + ROTATED
+ROTATED = ".1"
+
+
+class Ring:
+    """Fixed number of time buckets, each {(game_type, amount): totals}"""
+
+    def __init__(self, width, slots):
+        self.width = width
+        self.slots = slots
+        self._index = [None] * slots  # absolute bucket number held by a slot
+        self._totals = [None] * slots
+
+    @property
+    def span(self):
+        return self.width * self.slots
+
+    def add(self, ts, key, revenue, units):
+        index = int(ts // self.width)
+        slot = index % self.slots
+        held = self._index[slot]
+        if held is None or index > held:
+            self._index[slot] = index
+            self._totals[slot] = {}
+        elif index < held:
+            return  # older than anything this ring still covers
+        totals = self._totals[slot].setdefault(key, [0, 0, 0])
+        totals[0] += revenue
+        totals[1] += units
+        totals[2] += 1
+
+    def _first(self, seconds, now):
+        """Absolute number of the oldest bucket a window reaches back to"""
+        count = min(self.slots, max(1, math.ceil(seconds / self.width)))
+        return int(now // self.width) - count + 1
+
+    def covered(self, seconds, now):
+        """Seconds the buckets of a window actually hold: whole buckets
+        plus the elapsed part of the current one"""
+        return now - self._first(seconds, now) * self.width
+
+    def window(self, seconds, now):
+        """Per-key [revenue, units, orders] over the last `seconds`"""
+        result = {}
+        current = int(now // self.width)
+        for index in range(self._first(seconds, now), current + 1):
+            slot = index % self.slots
+            if self._index[slot] != index:
+                continue
+            for key, (revenue, units, orders) in self._totals[slot].items():
+                totals = result.setdefault(key, [0, 0, 0])
+                totals[0] += revenue
+                totals[1] += units
+                totals[2] += orders
+        return result
+
+
+class SalesLog:
+    """Append-only sales events plus rolling per-denomination aggregates.
+
+    Events are JSON lines in `path`. The aggregates are fed by reading the
+    file forward from the last offset, so sales appended by other worker
+    processes are counted too. A window query touches at most one ring's
+    buckets, never the event history.
+
+    Once the file's first event is older than the coarsest ring spans, the
+    file is renamed to path + ROTATED, replacing the segment before it, so
+    a start replays at most two spans of events. Writers append under a
+    shared flock that the rotation takes exclusively, so nothing lands in
+    a segment after its rename; readers finish the renamed segment through
+    the handle they hold before moving on to the new file.
+    """
+
+    def __init__(self, path, recent=50):
+        self.path = path
+        self.rings = [Ring(width, slots) for width, slots in GRANULARITIES]
+        self.recent = collections.deque(maxlen=recent)
+        self._file = None  # segment being read forward
+        self._offset = 0
+        self._started = None  # ts of its first event
+        live = self._open()
+        try:
+            with open(self.path + ROTATED, "rb") as f:
+                if live is None or _inode(f.fileno()) != _inode(
+                        live.fileno()):
+                    for line in f:
+                        self._line(line)
+        except FileNotFoundError:
+            pass
+        self._file = live
+        self.catch_up()
+
+    def _open(self):
+        try:
+            return open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+
+    def _current(self, fd):
+        """Whether `fd` is still the file at `path`"""
+        try:
+            return os.stat(self.path).st_ino == _inode(fd)
+        except FileNotFoundError:
+            return False
+
+    def emit(self, uid, channel, game_type, amount, quantity, revenue,
+             ts=None):
+        event = {
+            "ts": time.time() if ts is None else ts,
+            "uid": uid,
+            "channel": channel,
+            "game": game_type,
+            "amount": amount,
+            "quantity": quantity,
+            "revenue": revenue,
+        }
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        # One O_APPEND write per event keeps lines whole across processes
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                if self._current(fd):
+                    os.write(fd, line.encode())
+                    break
+            finally:
+                os.close(fd)  # rotated under us: append to the new file
+        self.catch_up()
+        if (self._started is not None
+                and event["ts"] - self._started >= self.span):
+            self._rotate()
+
+    def _rotate(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Unless another process rotated first
+            if self._current(fd) and _inode(fd) == _inode(
+                    self._file.fileno()):
+                os.replace(self.path, self.path + ROTATED)
+        finally:
+            os.close(fd)
+
+    def catch_up(self):
+        """Fold every event appended since the last call into the rings"""
+        while True:
+            if self._file is None:
+                self._file = self._open()
+                self._offset, self._started = 0, None
+                if self._file is None:
+                    return
+            self._drain()
+            if self._current(self._file.fileno()):
+                return
+            # Rotated: whatever the segment got before its rename is in it
+            self._drain()
+            self._file.close()
+            self._file = None
+
+    def _drain(self):
+        self._file.seek(self._offset)
+        for line in self._file:
+            if not line.endswith(b"\n"):
+                break  # another process is mid-write; read it next time
+            self._offset += len(line)
+            event = self._line(line)
+            if self._started is None and event is not None:
+                self._started = event["ts"]
+
+    def _line(self, line):
+        """Apply one complete line; the event, or None if unreadable"""
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return None
+        self._apply(event)
+        return event
+
+    def _apply(self, event):
+        key = (event["game"], event["amount"])
+        for ring in self.rings:
+            ring.add(event["ts"], key, event["revenue"], event["quantity"])
+        self.recent.append(event)
+
+    @property
+    def span(self):
+        """Longest window the rings can answer, in seconds"""
+        return self.rings[-1].span
+
+    def _ring(self, seconds):
+        """Finest ring that spans a window, or the coarsest one"""
+        return next((r for r in self.rings if r.span >= seconds),
+                    self.rings[-1])
+
+    def window(self, seconds, now=None):
+        """Per-(game_type, amount) [revenue, units, orders] for a window.
+
+        Uses the finest granularity that spans the window; windows longer
+        than the coarsest ring are clipped to it.
+        """
+        now = time.time() if now is None else now
+        ring = self._ring(seconds)
+        return ring.window(min(seconds, ring.span), now)
+
+    def covered(self, seconds, now=None):
+        """Seconds that window() actually sums over, for rates"""
+        now = time.time() if now is None else now
+        ring = self._ring(seconds)
+        return ring.covered(min(seconds, ring.span), now)
+
+
+def _inode(fd):
+    return os.fstat(fd).st_ino
+
+
+def parse_window(text):
+    """'15m', '6h', '7d' -> seconds"""
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if len(text) < 2 or text[-1] not in units or not text[:-1].isdigit():
+        raise ValueError(text)
+    seconds = int(text[:-1]) * units[text[-1]]
+    if seconds <= 0:
+        raise ValueError(text)
+    return seconds
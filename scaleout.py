@@ -0,0 +1,123 @@
+"""Run the bot across several worker processes.
+
+    WORKERS=4 python scaleout.py
+
+One ingress process long-polls getUpdates and hands every update to the
+worker that owns its user (uid % WORKERS), so a user's conversation state,
+rate-limit bucket and callback dedupe all stay in one process. Updates from
+ADMIN_ID, and updates without a user, always go to worker 0; admin
+approvals are therefore handled by a single, known process, which is also
+the only one running singleton jobs such as broadcasts.
+
+Workers run the normal handlers from main.py. They share DB_DIR through
+shared_store.SharedDatabase: every check-mutate-save runs under an exclusive
+cross-process lock on a freshly reloaded copy, so stock and balances are
+never spent twice. getUpdates is at-least-once across an ingress restart;
+workers drop update ids they have already seen.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from idempotency import RecentQueries
+from shared_store import SharedDatabase
+
+load_dotenv()
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+ADMIN_ID = int(os.getenv("ADMIN_ID"))
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+POLL_TIMEOUT = 30
+
+
+def owner(update, workers):
+    """Index of the worker that handles `update`"""
+    user = update.effective_user
+    if user is None or user.id == ADMIN_ID:
+        return 0
+    return user.id % workers
+
+
+# ---------------- Worker ----------------
+def run_worker(index, queue):
+    # Ctrl-C reaches the whole process group; ingress drives the shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import main as bot
+    bot.shared_db = SharedDatabase(bot.DB_DIR, bot.reload_db)
+    bot.METRICS_PORT += index
+    bot.worker_index = index
+    asyncio.run(serve(bot, queue))
+
+
+async def serve(bot, queue):
+    app = bot.build_application(updater=False)
+    seen = RecentQueries(ttl=3600)
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            update = Update.de_json(json.loads(raw), app.bot)
+            if not seen.seen(update.update_id):
+                await app.update_queue.put(update)
+        await app.stop()
+
+
+# ---------------- Ingress ----------------
+async def ingress(queues):
+    kwargs = {"base_url": BOT_API_BASE_URL} if BOT_API_BASE_URL else {}
+    offset = None
+    async with Bot(BOT_TOKEN, **kwargs) as tg:
+        await tg.delete_webhook()
+        while True:
+            try:
+                updates = await tg.get_updates(offset=offset,
+                                               timeout=POLL_TIMEOUT,
+                                               read_timeout=POLL_TIMEOUT + 5,
+                                               allowed_updates=Update.ALL_TYPES)
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (NetworkError, TimedOut):
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                queues[owner(update, len(queues))].put(
+                    json.dumps(update.to_dict()))
+
+
+def main():
+    if os.getenv("TRACE_FILE"):
+        # One anonymization key, so pseudonyms match across workers
+        os.environ.setdefault("TRACE_KEY", os.urandom(16).hex())
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(WORKERS)]
+    workers = [
+        ctx.Process(target=run_worker, args=(i, q), name=f"worker-{i}")
+        for i, q in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        asyncio.run(ingress(queues))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import contextlib
+import fcntl
+import json
+import os
+
+from records import encode_record
+
+MANIFEST = "manifest.json"
+# Top-level keys stored as sections of their own; the rest is "config"
+OWN_SECTIONS = ("users", "stock", "receipts", "topup_requests",
+                "pending_registrations")
+QUEUES = ("receipts", "topup_requests", "pending_registrations")
+
+
+def assemble(manifest, read):
+    """Rebuild the database dict from a manifest; read(filename) -> JSON"""
+    data = {"users": {}, "stock": {}}
+    for section, filename in manifest["sections"].items():
+        value = read(filename)
+        kind, _, key = section.partition(".")
+        if section == "config":
+            data.update(value)
+        elif kind == "users":
+            data["users"].update(value)
+        elif kind == "stock":
+            data["stock"][key] = value
+        else:
+            data[section] = value
+    return data
+
+
+class SectionStore:
+    """The database as one JSON file per section plus a manifest.
+
+    Sections are "config" (prices, payment, sales_total and every other
+    small key), "users.<n>" (users by uid % user_shards), "stock.<game>"
+    and one per request queue. Mutations touch() the sections they change,
+    and save() writes only those, each to a new file named after the
+    commit's generation. Replacing manifest.json, which names the current
+    file of every section, is the commit point: after a crash the previous
+    manifest still describes a complete set of files, so a purchase (stock,
+    user and sales_total) is on disk entirely or not at all.
+
+    Files of the previous generation are kept until the next commit so a
+    reader holding the previous manifest can still open them.
+
+    The store remembers which file of each section the caller's copy was
+    read from or written to, so changed() can hand back only the sections
+    another process has committed since.
+    """
+
+    def __init__(self, directory, user_shards=16, fsync=False):
+        self.directory = directory
+        self.user_shards = user_shards
+        self.fsync = fsync
+        self._dirty = set()
+        self._full = False
+        self._members = {}  # user shard -> uids
+        self._files = {}  # section -> file the in-memory copy matches
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path(MANIFEST))
+
+    def _read_manifest(self):
+        with open(self._path(MANIFEST)) as f:
+            return json.load(f)
+
+    # ---------------- Dirty flags ----------------
+    def touch(self, section):
+        self._dirty.add(section)
+
+    def touch_user(self, uid):
+        shard = uid % self.user_shards
+        self._members.setdefault(shard, set()).add(uid)
+        self._dirty.add(f"users.{shard}")
+
+    def shard_members(self, shard):
+        """Uids that users.<shard> holds, or will at the next save()"""
+        return self._members.get(shard, set())
+
+    def _index_users(self, users):
+        """Shard membership by integer uid, the key type once hydrated"""
+        self._members = {}
+        for uid in map(int, users):
+            self._members.setdefault(uid % self.user_shards, set()).add(uid)
+
+    # ---------------- Reading ----------------
+    @contextlib.contextmanager
+    def snapshot(self):
+        """The current manifest and an open file per section.
+
+        Open files stay readable after a later commit deletes them, so the
+        caller can take as long as it needs.
+        """
+        for _ in range(10):
+            manifest = self._read_manifest()
+            files = {}
+            try:
+                for filename in manifest["sections"].values():
+                    files[filename] = open(self._path(filename), "rb")
+            except FileNotFoundError:
+                # Two commits landed since the manifest was read; retry
+                for f in files.values():
+                    f.close()
+                continue
+            try:
+                yield manifest, files
+            finally:
+                for f in files.values():
+                    f.close()
+            return
+        raise RuntimeError(f"no stable snapshot of {self.directory}")
+
+    def load(self):
+        with self.snapshot() as (manifest, files):
+            data = assemble(manifest, lambda name: json.load(files[name]))
+        self._index_users(data["users"])
+        self._files = dict(manifest["sections"])
+        if manifest.get("user_shards") != self.user_shards:
+            self._full = True
+        return data
+
+    def changed(self):
+        """{section: JSON value} for every section committed since the last
+        load(), save() or changed(); a section gone from the manifest maps
+        to None. None instead if the shard layout changed, in which case
+        only a full load() will do."""
+        for _ in range(10):
+            manifest = self._read_manifest()
+            if manifest.get("user_shards") != self.user_shards:
+                return None
+            sections = manifest["sections"]
+            try:
+                changed = {}
+                for section, filename in sections.items():
+                    if self._files.get(section) != filename:
+                        with open(self._path(filename), "rb") as f:
+                            changed[section] = json.load(f)
+                break
+            except FileNotFoundError:
+                continue  # see snapshot()
+        else:
+            raise RuntimeError(f"no stable snapshot of {self.directory}")
+        changed.update(
+            (section, None) for section in self._files
+            if section not in sections)
+        for section, value in changed.items():
+            kind, _, key = section.partition(".")
+            if kind == "users":
+                self._members[int(key)] = set(map(int, value or ()))
+        self._files = dict(sections)
+        return changed
+
+    # ---------------- Writing ----------------
+    def create(self, data):
+        """Write hydrated `data` as the first generation, unless another
+        process already did"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._path(".create.lock"), os.O_RDWR | os.O_CREAT,
+                     0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if not self.exists():
+                self._index_users(data.get("users", {}))
+                self._full = True
+                self.save(data)
+        finally:
+            os.close(fd)
+
+    def _value(self, db, section):
+        kind, _, key = section.partition(".")
+        if section == "config":
+            return {k: v for k, v in db.items() if k not in OWN_SECTIONS}
+        if kind == "users":
+            users = db["users"]
+            return {
+                uid: users[uid]
+                for uid in self._members.get(int(key), ())
+                if uid in users
+            }
+        if kind == "stock":
+            return db["stock"].get(key, {})
+        return db.get(section, {})
+
+    def _write(self, name, value, indent=None):
+        with open(self._path(name), "w") as f:
+            json.dump(value, f, indent=indent, default=encode_record)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def save(self, db):
+        """Write the touched sections and commit them with a new manifest"""
+        if not self._dirty and not self._full:
+            return
+        previous = self._read_manifest() if self.exists() else {
+            "generation": 0,
+            "sections": {}
+        }
+        generation = previous["generation"] + 1
+        if self._full:
+            touched = (["config"] +
+                       [f"users.{n}" for n in range(self.user_shards)] +
+                       [f"stock.{game}" for game in db["stock"]] +
+                       list(QUEUES))
+            sections = {}
+        else:
+            touched = sorted(self._dirty)
+            sections = dict(previous["sections"])
+        for section in touched:
+            filename = f"{section}.{generation}.json"
+            self._write(filename, self._value(db, section),
+                        2 if section == "config" else None)
+            sections[section] = filename
+
+        self._write(MANIFEST + ".tmp", {
+            "generation": generation,
+            "user_shards": self.user_shards,
+            "sections": sections
+        })
+        os.replace(self._path(MANIFEST + ".tmp"), self._path(MANIFEST))
+        if self.fsync:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self._dirty.clear()
+        self._full = False
+        self._files = dict(sections)
+
+        keep = set(sections.values()) | set(previous["sections"].values())
+        keep.update((MANIFEST, ".create.lock"))
+        for name in os.listdir(self.directory):
+            if name not in keep:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,68 @@
+import contextlib
+import fcntl
+import os
+import struct
+
+
+class SharedDatabase:
+    """Cross-process transactions over the JSON database.
+
+    Several worker processes keep their own in-memory copy of the database.
+    A transaction takes an exclusive flock, reloads the copy if another
+    worker committed since we last looked, and releases the lock when the
+    block ends. Every save inside a transaction bumps a generation counter
+    kept in the lock file, which is how the other workers notice.
+    Transactions nest; only the outermost one locks.
+
+    `reload` is expected to read only what changed, so the lock is held
+    for a few section files at most. refresh(), which runs before every
+    update, takes no lock at all: a section store commits by replacing its
+    manifest atomically, so it can be read while another worker writes.
+    """
+
+    def __init__(self, path, reload):
+        self._reload = reload
+        self._fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        self._depth = 0
+        self._generation = None
+
+    def _read_generation(self):
+        data = os.pread(self._fd, 8, 0)
+        return struct.unpack("<Q", data)[0] if len(data) == 8 else 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                generation = self._read_generation()
+                if generation != self._generation:
+                    self._reload()
+                    self._generation = generation
+            except BaseException:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                raise
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Catch up outside a transaction, without the lock"""
+        if self._depth == 0:
+            generation = self._read_generation()
+            if generation != self._generation:
+                # A commit landing meanwhile may be read too; it is then
+                # read again, as a no-op, on the next refresh
+                self._reload()
+                self._generation = generation
+
+    def saved(self):
+        """Record a commit; must be called inside a transaction"""
+        if self._depth == 0:
+            raise RuntimeError("database saved outside of a transaction")
+        self._generation = self._read_generation() + 1
+        os.pwrite(self._fd, struct.pack("<Q", self._generation), 0)
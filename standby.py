@@ -0,0 +1,181 @@
+"""Keep a hot-standby copy of the database by tailing the change journal.
+
+    python standby.py --replica /srv/standby/database
+
+The replica is a section store like DB_DIR. On first start it is seeded
+from the section store in DB_DIR; from then on only the commits appended
+to CHANGE_LOG are applied, and at most every --interval seconds the
+sections they touched are committed to the replica, the way the bot
+commits its own. To fail over, start the bot with DB_DIR pointing at the
+replica.
+
+The journal position is noted before the seed copy is taken, so commits
+that already made it into the copy are replayed once more; the journal's
+operations are absolute, which makes that harmless. When the bot rotates
+the journal, the standby finishes the rotated segment before moving on to
+the new file.
+"""
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from replication import ROTATED, apply, touch
+from section_store import SectionStore
+
+load_dotenv()
+DB_DIR = os.getenv("DB_DIR", "database")
+DB_USER_SHARDS = int(os.getenv("DB_USER_SHARDS", "16"))
+CHANGE_LOG = os.getenv("CHANGE_LOG", "changes.jsonl")
+
+
+class Standby:
+
+    def __init__(self, primary, journal, replica, user_shards=16):
+        self.journal = journal
+        self.store = SectionStore(replica, user_shards)
+        self.offset_file = os.path.normpath(replica) + ".offset"
+        if not self.store.exists():
+            self._seed(primary)
+        self.data = self._users_by_uid(self.store.load())
+        with open(self.offset_file) as f:
+            position = f.read().split()
+        # inode of the journal file the offset is in; None = the live one
+        self.inode = int(position[0]) if len(position) > 1 else None
+        self.offset = int(position[-1])
+        self.commits = 0
+        self.last_ts = None
+        self.dirty = False
+
+    @staticmethod
+    def _users_by_uid(data):
+        data["users"] = {int(uid): user for uid, user in data["users"].items()}
+        return data
+
+    def _seed(self, primary):
+        try:
+            stat = os.stat(self.journal)
+            self.inode, self.offset = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            self.inode, self.offset = None, 0
+        self.store.create(self._users_by_uid(SectionStore(primary).load()))
+        self._write_offset()
+
+    def _write_offset(self):
+        position = f"{self.offset}" if self.inode is None else (
+            f"{self.inode} {self.offset}")
+        with open(self.offset_file + ".tmp", "w") as f:
+            f.write(position)
+        os.replace(self.offset_file + ".tmp", self.offset_file)
+
+    def _segment(self):
+        """(open journal file holding the offset, whether it is the live
+        one), or (None, True) while there is no live file to read.
+
+        Without an inode the offset is in the live file, never in the
+        rotated one: that is either already applied or, right after a
+        rotation, waiting for the primary to start the next file."""
+        paths = [self.journal]
+        if self.inode is not None:
+            paths.append(self.journal + ROTATED)
+        for path in paths:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            inode = os.fstat(f.fileno()).st_ino
+            if self.inode is None or inode == self.inode:
+                self.inode = inode
+                return f, path == self.journal
+            f.close()
+        if self.inode is None:
+            return None, True
+        raise RuntimeError(
+            f"{self.journal} was rotated twice since offset {self.offset}; "
+            "remove the replica to seed a new one")
+
+    def poll(self):
+        """Apply every complete commit appended since the last poll"""
+        applied = 0
+        while True:
+            f, live = self._segment()
+            if f is None:
+                break
+            with f:
+                f.seek(self.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # the primary is mid-write
+                    commit = json.loads(line)
+                    apply(self.data, commit["ops"])
+                    for op, *args in commit["ops"]:
+                        touch(self.store, op, args)
+                    self.offset += len(line)
+                    self.last_ts = commit["ts"]
+                    applied += 1
+            if live:
+                break
+            # Done with the rotated segment; the live file comes next
+            self.inode, self.offset = None, 0
+        self.commits += applied
+        self.dirty = self.dirty or applied > 0
+        return applied
+
+    def flush(self):
+        """Commit the touched sections, then the offset they correspond to"""
+        if not self.dirty:
+            return
+        self.store.save(self.data)
+        self._write_offset()
+        self.dirty = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--primary",
+                        default=DB_DIR,
+                        help="section store directory")
+    parser.add_argument("--journal", default=CHANGE_LOG)
+    parser.add_argument("--replica",
+                        required=True,
+                        help="section store directory to keep up to date")
+    parser.add_argument("--interval",
+                        type=float,
+                        default=1.0,
+                        help="seconds between replica commits")
+    parser.add_argument("--poll", type=float, default=0.2)
+    parser.add_argument("--report",
+                        type=float,
+                        default=10.0,
+                        help="seconds between progress lines")
+    args = parser.parse_args()
+
+    standby = Standby(args.primary, args.journal, args.replica,
+                      DB_USER_SHARDS)
+    print(f"standby: {args.replica} from journal offset {standby.offset}",
+          flush=True)
+    last_flush = last_report = time.monotonic()
+    try:
+        while True:
+            standby.poll()
+            now = time.monotonic()
+            if now - last_flush >= args.interval:
+                if standby.dirty:
+                    standby.flush()
+                    lag = time.time() - standby.last_ts
+                    if now - last_report >= args.report:
+                        print(f"standby: {standby.commits} commits applied, "
+                              f"lag {lag:.1f}s",
+                              flush=True)
+                        last_report = now
+                last_flush = now
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        standby.poll()
+        standby.flush()
+
+
+if __name__ == "__main__":
+    main()
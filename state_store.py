@@ -0,0 +1,152 @@
+import heapq
+import json
+import sqlite3
+import time
+from collections.abc import MutableMapping
+
+
+class ConversationStore:
+    """Per-user conversation state with TTLs, persisted to SQLite.
+
+    Keys belong to a flow (e.g. the receipt purchase flow) and every key of a
+    flow shares one expiry, refreshed whenever any of them is written, so an
+    abandoned flow disappears as a whole. Each write touches a single row
+    instead of re-serializing everyone's state.
+    """
+
+    def __init__(self, path, flows, default_ttl=3600):
+        self._ttl = {}
+        self._flow = {}
+        for flow, (ttl, keys) in flows.items():
+            for key in keys:
+                self._ttl[key] = ttl
+                self._flow[key] = keys
+        self._default_ttl = default_ttl
+        self._state = {}  # uid -> {key: [value, expires]}
+        self._expiry = []  # heap of (expires, uid, key)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state ("
+                           "uid INTEGER, key TEXT, value TEXT, expires REAL, "
+                           "PRIMARY KEY (uid, key)) WITHOUT ROWID")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS state_expires ON state (expires)")
+        now = time.time()
+        self._conn.execute("DELETE FROM state WHERE expires <= ?", (now, ))
+        self._conn.commit()
+        for uid, key, value, expires in self._conn.execute(
+                "SELECT uid, key, value, expires FROM state"):
+            self._state.setdefault(uid, {})[key] = [json.loads(value), expires]
+            heapq.heappush(self._expiry, (expires, uid, key))
+
+    def for_user(self, uid):
+        return UserState(self, uid)
+
+    def _entries(self, uid):
+        entries = self._state.get(uid)
+        if not entries:
+            return {}
+        now = time.time()
+        expired = [k for k, (_, expires) in entries.items() if expires <= now]
+        if expired:
+            self.delete(uid, *expired)
+        return entries
+
+    def get(self, uid, key, default=None):
+        entry = self._entries(uid).get(key)
+        return default if entry is None else entry[0]
+
+    def set(self, uid, key, value, ttl=None):
+        expires = time.time() + (ttl or self._ttl.get(key, self._default_ttl))
+        entries = self._state.setdefault(uid, {})
+        entries[key] = [value, expires]
+        rows = [(uid, key, json.dumps(value), expires)]
+        for sibling in self._flow.get(key, ()):
+            if sibling != key and sibling in entries:
+                entries[sibling][1] = expires
+                rows.append((uid, sibling, json.dumps(entries[sibling][0]),
+                             expires))
+        for row in rows:
+            heapq.heappush(self._expiry, (expires, uid, row[1]))
+        self._conn.executemany("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                               rows)
+        self._conn.commit()
+
+    def delete(self, uid, *keys):
+        entries = self._state.get(uid)
+        if not entries:
+            return
+        removed = [(uid, k) for k in keys if entries.pop(k, None) is not None]
+        if not entries:
+            del self._state[uid]
+        if removed:
+            self._conn.executemany("DELETE FROM state WHERE uid = ? AND key = ?",
+                                   removed)
+            self._conn.commit()
+
+    def sweep(self, now=None):
+        """Drop every expired key; costs O(expired log n)"""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, uid, key = heapq.heappop(self._expiry)
+            entry = self._state.get(uid, {}).get(key)
+            # Stale heap entries are left behind whenever a key is refreshed
+            if entry is None or entry[1] != expires:
+                continue
+            del self._state[uid][key]
+            if not self._state[uid]:
+                del self._state[uid]
+            removed += 1
+        self._conn.execute("DELETE FROM state WHERE expires <= ?", (now, ))
+        self._conn.commit()
+        return removed
+
+    def __len__(self):
+        return len(self._state)
+
+    def usage(self):
+        """Users and keys held, and expiry heap entries (stale ones stay
+        until they come due)"""
+        return {
+            "users": len(self._state),
+            "keys": sum(len(entries) for entries in self._state.values()),
+            "expiry": len(self._expiry)
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+class UserState(MutableMapping):
+    """dict-like view of one user's state, a drop-in for context.user_data"""
+    __slots__ = ("_store", "_uid")
+
+    def __init__(self, store, uid):
+        self._store = store
+        self._uid = uid
+
+    def __getitem__(self, key):
+        entry = self._store._entries(self._uid).get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self._store.set(self._uid, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._store.delete(self._uid, key)
+
+    def __iter__(self):
+        return iter(list(self._store._entries(self._uid)))
+
+    def __len__(self):
+        return len(self._store._entries(self._uid))
+
+    def __contains__(self, key):
+        return key in self._store._entries(self._uid)
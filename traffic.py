@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+
+# A number, possibly in digit groups ("09 7812 3456", "09-7812-3456"),
+# else a word. Command arguments are separate fields, so there a space
+# ends the number.
+_TEXT_TOKEN = re.compile(r"\d+(?:[-.() ]+\d+)*|\w+")
+_ARGUMENT_TOKEN = re.compile(r"\d+(?:[-.()]+\d+)*|\w+")
+_DIGITS = re.compile(r"\d+")
+
+
+class TraceRecorder:
+    """Incoming updates, anonymized, appended to a gzip trace for
+    bench/replay.py.
+
+    Each update is one JSON line {"t": arrival time, "u": pseudonymous
+    user, "s": 1 for staff, "k": "text" | "photo" | "callback" | "other",
+    "d": text or callback data}. Lines are buffered and appended as one
+    gzip member per batch with a single O_APPEND write, so several workers
+    can share a file and it still reads as one gzip stream.
+
+    Anonymization is keyed by a secret that is never written out (`key`,
+    random unless given; workers sharing a trace must share it):
+    user ids and other numbers of 7+ digits (phone numbers, also when
+    typed in groups) become pseudonymous ids, and 5-6 digit numbers
+    (receipt ids) are replaced consistently, so approve_<id> still
+    matches the id typed before it.
+    Words in free text are masked unless `known(word)` (game types and
+    the like). Commands, short numbers (quantities, amounts, prices) and
+    the layout of callback data are kept, since that is what the
+    handlers branch on. Of a photo only the fact that one was sent is kept.
+    """
+
+    def __init__(self, path, is_staff, known=lambda word: False, key=None,
+                 batch=256, interval=5.0):
+        self.path = path
+        self.is_staff = is_staff
+        self.known = known
+        self.batch = batch
+        self.interval = interval
+        self._key = key or os.urandom(16)
+        self._lines = []
+        self._flushed = time.monotonic()
+
+    # ---------------- Anonymization ----------------
+    def _digest(self, value):
+        return int.from_bytes(
+            hmac.new(self._key, value.encode(), hashlib.sha256).digest()[:8],
+            "big")
+
+    def pseudonym(self, uid):
+        return 10**9 + self._digest(f"uid:{uid}") % 10**9
+
+    def _number(self, digits):
+        if len(digits) >= 7:
+            return str(self.pseudonym(int(digits)))
+        if len(digits) >= 5:
+            width = len(digits)
+            low = 10**(width - 1)
+            return str(low + self._digest(f"n:{digits}") % (9 * low))
+        return digits
+
+    def _word(self, match):
+        word = match.group()
+        if not word[0].isdigit():
+            return word if self.known(word) else "x" * len(word)
+        digits = "".join(_DIGITS.findall(word))
+        if len(digits) >= 7:
+            return self._number(digits)
+        return _DIGITS.sub(lambda m: self._number(m.group()), word)
+
+    def scrub_text(self, text):
+        command, sep, rest = text.partition(" ")
+        if not command.startswith("/"):
+            return _TEXT_TOKEN.sub(self._word, text)
+        return command + sep + _ARGUMENT_TOKEN.sub(self._word, rest)
+
+    def scrub_callback(self, data):
+        return "_".join(
+            self._number(field) if field.isdigit() else field
+            for field in data.split("_"))
+
+    # ---------------- Recording ----------------
+    def record(self, update):
+        user = update.effective_user
+        if user is None:
+            return
+        if update.callback_query:
+            kind, data = "callback", self.scrub_callback(
+                update.callback_query.data or "")
+        elif update.message and update.message.text:
+            kind, data = "text", self.scrub_text(update.message.text)
+        elif update.message and update.message.photo:
+            kind, data = "photo", None
+        else:
+            kind, data = "other", None
+        event = {"t": round(time.time(), 3), "u": self.pseudonym(user.id),
+                 "k": kind}
+        if data is not None:
+            event["d"] = data
+        if self.is_staff(user.id):
+            event["s"] = 1
+        self._lines.append(json.dumps(event, ensure_ascii=False,
+                                      separators=(",", ":")))
+        if (len(self._lines) >= self.batch
+                or time.monotonic() - self._flushed >= self.interval):
+            self.flush()
+
+    def flush(self):
+        self._flushed = time.monotonic()
+        if not self._lines:
+            return
+        member = gzip.compress(("\n".join(self._lines) + "\n").encode())
+        self._lines = []
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, member)
+        finally:
+            os.close(fd)
+
+
+def read_trace(path):
+    """Events of a trace (or several workers' traces) in arrival order"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    events.sort(key=lambda event: event["t"])
+    return events
@@ -0,0 +1,57 @@
+import bisect
+
+
+def _keys(uid, name, username):
+    keys = {str(uid)}
+    if name:
+        name = name.casefold()
+        keys.add(name)
+        keys.update(name.split())
+    if username:
+        keys.add(username.casefold().lstrip("@"))
+    return keys
+
+
+class UserIndex:
+    """Prefix search over user ids, names and usernames.
+
+    A sorted array of (key, uid) pairs: every match for a prefix is one
+    contiguous run starting at bisect_left(prefix), so a search costs a
+    binary search plus the matches it returns. Names are also indexed
+    word by word, so "aung" finds "Kyaw Aung".
+    """
+
+    def __init__(self):
+        self._entries = []  # (key, uid), ascending
+        self._keys = {}  # uid -> keys currently indexed
+
+    def rebuild(self, users):
+        self._keys = {
+            uid: _keys(uid, user.get("name"), user.get("username"))
+            for uid, user in users.items()
+        }
+        self._entries = sorted(
+            (key, uid) for uid, keys in self._keys.items() for key in keys)
+
+    def update(self, uid, name=None, username=None):
+        keys = _keys(uid, name, username)
+        old = self._keys.get(uid, set())
+        for key in old - keys:
+            i = bisect.bisect_left(self._entries, (key, uid))
+            del self._entries[i]
+        for key in keys - old:
+            bisect.insort(self._entries, (key, uid))
+        self._keys[uid] = keys
+
+    def search(self, prefix, limit=20):
+        """Up to `limit` distinct uids with a key starting with `prefix`"""
+        prefix = prefix.casefold().lstrip("@")
+        found = {}
+        i = bisect.bisect_left(self._entries, (prefix, ))
+        while i < len(self._entries) and len(found) < limit:
+            key, uid = self._entries[i]
+            if not key.startswith(prefix):
+                break
+            found[uid] = None
+            i += 1
+        return list(found)